@@ -0,0 +1,169 @@
+"""
+Benchmarks of the compression codecs and filters of root_utils/compression.py on the arrays of converted outputs
+
+Each array of an event_dump.py output file, and the dense and sparse event data gridded from it by np_to_grid_hdf5.py,
+is written alone with every combination of codec and filters, as an .npz file with save_npz and as an HDF5 dataset, and
+read back. The write and read speeds, in MB/s of uncompressed data, and the compression ratio are reported for each, so
+that the codec of each dataset can be chosen (see the --compression options of the conversion scripts). Without input
+files, the arrays are taken from synthetic events (see root_utils/synthetic_wcsim.py). Codecs whose packages are not
+installed are skipped.
+
+Usage: PYTHONPATH=/path/to/DataTools python benchmarks/benchmark_compression.py [file.npz] [-n nevents]
+       [-o results.json]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from root_utils.synthetic_wcsim import SyntheticEvents, SyntheticWCSim
+from root_utils.compression import Codec, load_npz, save_npz
+from root_utils.barrel_grid import grid_events, to_sparse
+import root_utils.event_dump as event_dump
+import root_utils.ragged_utils as ru
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='benchmark the compression codecs on the arrays of converted outputs')
+    parser.add_argument('input_file', type=str, nargs='?', default=None,
+                        help='event_dump.py output file whose arrays are compressed, instead of synthetic events')
+    parser.add_argument('-n', '--nevents', type=int, default=500, help='number of events whose arrays are compressed')
+    parser.add_argument('-a', '--arrays', type=str, nargs='+', default=None,
+                        help='names of the arrays to compress (default: all numeric arrays)')
+    parser.add_argument('-c', '--codecs', type=str, nargs='+',
+                        default=['none', 'zlib:1', 'zlib:6', 'lz4', 'zstd:3', 'zstd:9', 'blosc:5'],
+                        help='codecs to compare, as name[:level]')
+    parser.add_argument('-f', '--filters', type=str, nargs='+',
+                        default=['none', 'shuffle', 'delta', 'delta+shuffle', 'shuffle+delta'],
+                        help='combinations of filters applied with each codec, joined by +, or none')
+    parser.add_argument('-t', '--threads', type=int, default=1, help='number of threads compressing each array')
+    parser.add_argument('-o', '--output', type=str, default=None, help='write the results to this JSON file')
+    args = parser.parse_args()
+    return args
+
+
+def load_arrays(config):
+    """Returns the arrays of the dump of the events and of their gridded event data, by name"""
+    if config.input_file is None:
+        wcsim = SyntheticWCSim(SyntheticEvents(config.nevents))
+        data = event_dump.dump_events(wcsim, "synthetic.root", 0, config.nevents)
+    else:
+        with load_npz(config.input_file, allow_pickle=True) as npz_file:
+            data = {name: npz_file[name] for name in npz_file.files}
+        data = select_events(data, config.nevents)
+    arrays = {name: a for name, a in data.items() if a.dtype.kind in "biuf"}
+    if "digi_hit_offsets" in data:
+        nevents = len(data["digi_hit_offsets"]) - 1
+        event_data = grid_events(data["digi_hit_pmt"], data["digi_hit_charge"], data["digi_hit_time"],
+                                 data["digi_hit_offsets"], 0, nevents)
+        index, values, counts = to_sparse(event_data)
+        arrays.update(event_data=event_data, event_data_index=index, event_data_values=values,
+                      event_data_offsets=ru.offsets_from_counts(counts))
+    if config.arrays is not None:
+        arrays = {name: arrays[name] for name in config.arrays}
+    return arrays
+
+
+def select_events(data, nevents):
+    """Returns the arrays of the first nevents events of the arrays of an event_dump.py output"""
+    nevents = min(nevents, len(data["event_id"]))
+    selected = {}
+    for name, array in data.items():
+        if name in event_dump.RAGGED_FIELDS:
+            selected[name] = array[:nevents + 1]
+            for field in event_dump.RAGGED_FIELDS[name]:
+                if field in data:
+                    selected[field] = data[field][:array[nevents]]
+        elif name not in selected and name != "root_files":
+            selected[name] = array[:nevents]
+    return selected
+
+
+def timed(function):
+    start = time.perf_counter()
+    value = function()
+    return time.perf_counter() - start, value
+
+
+def bench_npz(filename, name, array, codec):
+    """Returns the write and read times and stored size of an array saved alone to an npz file"""
+    write_time, _ = timed(lambda: save_npz(filename, {name: array}, codec))
+
+    def read():
+        with load_npz(filename, threads=codec.threads) as f:
+            return f[name]
+    read_time, read_array = timed(read)
+    if not np.array_equal(read_array, array):
+        raise RuntimeError(name + " was not read back unchanged with codec " + str(codec))
+    return write_time, read_time, os.path.getsize(filename)
+
+
+def bench_h5(filename, name, array, codec):
+    """Returns the write and read times and stored size of an array written alone as an HDF5 dataset"""
+    options = codec.h5py_options()
+
+    def write():
+        with h5py.File(filename, "w") as f:
+            f.create_dataset(name, data=array, **options)
+    write_time, _ = timed(write)
+    with h5py.File(filename, "r") as f:
+        read_time, read_array = timed(lambda: f[name][...])
+        size = f[name].id.get_storage_size()
+    if not np.array_equal(read_array, array):
+        raise RuntimeError(name + " was not read back unchanged with codec " + str(codec))
+    return write_time, read_time, size
+
+
+def available_codecs(config):
+    codecs = []
+    for spec in config.codecs:
+        for filters in config.filters:
+            try:
+                codecs.append(Codec.parse(spec if filters == "none" else spec + "+" + filters, config.threads))
+            except ImportError as e:
+                print("Skipping", spec, "+", filters, ":", e)
+                break
+    return codecs
+
+
+def run_benchmarks(config, work_dir):
+    arrays = load_arrays(config)
+    codecs = available_codecs(config)
+    results = []
+    print("{:<24}{:>8}  {:<26}{:>6}{:>10}{:>12}{:>12}".format("array", "MB", "codec", "format", "ratio", "write MB/s",
+                                                              "read MB/s"))
+    for name, array in arrays.items():
+        mb = array.nbytes / 2**20
+        for codec in codecs:
+            for fmt, bench in (("npz", bench_npz), ("h5", bench_h5)):
+                try:
+                    write_time, read_time, size = bench(os.path.join(work_dir, "bench." + fmt), name, array, codec)
+                except (ValueError, ImportError) as e:
+                    # e.g. the delta filter, which HDF5 does not have
+                    print("{:<24}{:>8.1f}  {:<26}{:>6}  {}".format(name, mb, str(codec), fmt, e))
+                    continue
+                result = {"array": name, "codec": str(codec), "format": fmt, "mb": mb, "ratio": array.nbytes / size,
+                          "write_mb_per_second": mb / write_time, "read_mb_per_second": mb / read_time}
+                results.append(result)
+                print("{:<24}{:>8.1f}  {:<26}{:>6}{:>10.2f}{:>12.1f}{:>12.1f}".format(
+                    name, mb, str(codec), fmt, result["ratio"], result["write_mb_per_second"],
+                    result["read_mb_per_second"]))
+    return results
+
+
+if __name__ == '__main__':
+    config = get_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmarks(config, work_dir)
+    print("\nbest ratio of each array:")
+    for name in dict.fromkeys(r["array"] for r in results):
+        best = max((r for r in results if r["array"] == name), key=lambda r: r["ratio"])
+        print("{:<24}{:<26}{:>6}{:>10.2f}".format(name, best["codec"], best["format"], best["ratio"]))
+    if config.output is not None:
+        with open(config.output, "w") as f:
+            json.dump({"config": vars(config), "results": results}, f, indent=1)
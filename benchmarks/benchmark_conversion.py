@@ -0,0 +1,129 @@
+"""
+Benchmarks of the conversion tools on synthetic WCSim events
+
+Generates synthetic events (see root_utils/synthetic_wcsim.py) and times each stage of the conversion chain on them,
+reporting the events per second and the peak memory allocated by each stage. Neither ROOT nor WCSim is needed, the
+stages reading events through the WCSim class use stand-in objects in place of the WCSimRoot classes.
+
+SyntheticWCSim replaces the compiled extraction of WCSim.extract_range and WCSim.extract_photons by slicing the arrays
+of the synthetic events, so the stages built on them, get_hit_photons and dump_events, time that fixture rather than
+the extraction code of the repository. They are marked with * in the output and with "fixture": true in the results,
+and only the stages after them, from saving the dump on, time the repository's own code on the extracted arrays.
+
+Usage: PYTHONPATH=/path/to/DataTools python benchmarks/benchmark_conversion.py [-n nevents] [-o results.json]
+"""
+
+import argparse
+import gc
+import json
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from root_utils.synthetic_wcsim import SyntheticEvents, SyntheticWCSim
+import root_utils.event_dump as event_dump
+import root_utils.np_to_grid_hdf5 as np_to_grid
+from root_utils.h5_reader import H5BatchReader
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='benchmark the conversion tools on synthetic WCSim events')
+    parser.add_argument('-n', '--nevents', type=int, default=2000, help='number of events converted by each stage')
+    parser.add_argument('-l', '--loop_events', type=int, default=200,
+                        help='number of events read one by one through the WCSim object API')
+    parser.add_argument('--digi_hits', type=float, default=2000, help='mean number of digitized hits per event')
+    parser.add_argument('--true_hits', type=float, default=2000, help='mean number of true hits per event')
+    parser.add_argument('--photons', type=float, default=1.5, help='mean number of photons per true hit')
+    parser.add_argument('--tracks', type=float, default=10, help='mean number of secondary tracks per event')
+    parser.add_argument('-b', '--block_size', type=int, default=1024, help='np_to_grid_hdf5 block size')
+    parser.add_argument('--no_memory', action='store_true',
+                        help='do not trace memory allocations, which slows down stages running python loops')
+    parser.add_argument('-o', '--output', type=str, default=None, help='write the results to this JSON file')
+    args = parser.parse_args()
+    return args
+
+
+class Benchmark:
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.results = []
+        print("{:<24}{:>10}{:>12}{:>14}{:>16}".format("stage", "events", "seconds", "events/s", "peak MB"))
+
+    def run(self, name, nevents, function, fixture=False):
+        """
+        Times function, which processes nevents events, records the result and returns function's return value. fixture
+        marks stages whose time is mostly spent in the synthetic stand-in of the compiled extraction code.
+        """
+        gc.collect()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        value = function()
+        elapsed = time.perf_counter() - start
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        self.results.append({"stage": name, "events": nevents, "seconds": elapsed,
+                             "events_per_second": nevents / elapsed, "peak_mb": peak, "fixture": fixture})
+        label = name + "*" if fixture else name
+        print("{:<24}{:>10}{:>12.3f}{:>14.1f}{:>16}".format(label, nevents, elapsed, nevents / elapsed,
+                                                            "-" if peak is None else "{:.1f}".format(peak)))
+        return value
+
+
+def loop_events(wcsim, nevents, method):
+    for ev in range(nevents):
+        wcsim.get_event(ev)
+        getattr(wcsim, method)()
+
+
+def run_benchmarks(config, work_dir):
+    bench = Benchmark(not config.no_memory)
+    n = config.nevents
+    events = bench.run("generate", n, lambda: SyntheticEvents(n, config.digi_hits, config.true_hits, config.photons,
+                                                              config.tracks))
+    wcsim = SyntheticWCSim(events)
+    n_loop = min(config.loop_events, n)
+    for method in ("get_digitized_hits", "get_true_hits", "get_hit_photons", "get_tracks", "get_event_info"):
+        bench.run(method, n_loop, lambda: loop_events(wcsim, n_loop, method), fixture=method == "get_hit_photons")
+    dump_file = os.path.join(work_dir, "dump.npz")
+    bench.run("dump_events", n, lambda: event_dump.dump_events(wcsim, "synthetic.root", 0, n), fixture=True)
+    bench.run("dump_events_digi_only", n,
+              lambda: event_dump.dump_events(wcsim, "synthetic.root", 0, n, fields=("truth", "digi_hits")),
+              fixture=True)
+    data = event_dump.dump_events(wcsim, "synthetic.root", 0, n)
+    bench.run("save_npz", n, lambda: event_dump.save_file(dump_file, data))
+    del data
+    dense_file = os.path.join(work_dir, "dense.h5")
+    sparse_file = os.path.join(work_dir, "sparse.h5")
+    bench.run("np_to_grid_dense", n, lambda: np_to_grid.convert_serial([dump_file], dense_file, config.block_size))
+    bench.run("np_to_grid_sparse", n,
+              lambda: np_to_grid.convert_serial([dump_file], sparse_file, config.block_size, sparse=True))
+    for name, h5_file in (("read_dense_h5", dense_file), ("read_sparse_h5", sparse_file)):
+        def read_epoch():
+            with H5BatchReader(h5_file) as reader:
+                for _ in reader.epoch(64, seed=0):
+                    pass
+        bench.run(name, n, read_epoch)
+    sizes = {os.path.basename(f): os.path.getsize(f) for f in (dump_file, dense_file, sparse_file)}
+    return bench.results, sizes
+
+
+if __name__ == '__main__':
+    config = get_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        results, sizes = run_benchmarks(config, work_dir)
+    print("* synthetic stand-in of the compiled extraction code, not the repository's extraction")
+    for name, size in sizes.items():
+        print("{:<24}{:>10.1f} MB".format(name, size / 2**20))
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    print("peak resident memory of the whole run: {:.1f} MB".format(max_rss))
+    if config.output is not None:
+        with open(config.output, "w") as f:
+            json.dump({"config": vars(config), "stages": results, "file_sizes": sizes, "max_rss_mb": max_rss}, f,
+                      indent=1)
@@ -0,0 +1,75 @@
+"""
+Memory ceiling check for long scans of WCSim events
+
+Reads every event of a chain of WCSim files, as the data quality scripts do, and fails if the resident memory grows by
+more than a ceiling between the end of a warm-up period and the end of the scan. Reading many events across several
+files catches leaks of the triggers read for each event, including at the file changes of the chain. Without WCSim
+files, synthetic events (see root_utils/synthetic_wcsim.py) can be scanned instead, which only checks the Python side:
+the synthetic reader does not own its event object or delete triggers. The release of the triggers of each event is
+tested without ROOT by tests/test_root_file_utils.py, this script is an optional check of real files on top of it.
+
+Usage: PYTHONPATH=/path/to/DataTools python benchmarks/memory_ceiling.py file1.root file2.root ... [--max_growth_mb 50]
+Exits with status 1 if the ceiling is exceeded.
+"""
+
+import argparse
+import sys
+
+from root_utils.profiling import rss_mb
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='check that scanning many WCSim events does not grow memory use')
+    parser.add_argument('input_files', type=str, nargs='*', help='WCSim files scanned as one chain')
+    parser.add_argument('-s', '--synthetic', type=int, default=None,
+                        help='scan this many synthetic events instead of input files')
+    parser.add_argument('-n', '--max_events', type=int, default=None, help='stop after this many events')
+    parser.add_argument('-w', '--warmup', type=int, default=200,
+                        help='number of events read before the baseline memory is measured')
+    parser.add_argument('-m', '--max_growth_mb', type=float, default=50.,
+                        help='maximum allowed growth of resident memory after the warm-up, in MB')
+    parser.add_argument('-i', '--report_interval', type=int, default=1000, help='events between memory reports')
+    args = parser.parse_args()
+    if not args.input_files and args.synthetic is None:
+        parser.error("either input files or --synthetic must be given")
+    return args
+
+
+def open_chain(config):
+    if config.synthetic is not None:
+        from root_utils.synthetic_wcsim import SyntheticEvents, SyntheticWCSim
+        return SyntheticWCSim(SyntheticEvents(config.synthetic, digi_hits=500, true_hits=500))
+    from root_utils.root_file_utils import WCSimChain
+    return WCSimChain(config.input_files)
+
+
+def scan(wcsim, nevents, warmup, report_interval):
+    """Reads the first trigger and digitized hits of each event, returning the RSS after warm-up and at the end"""
+    baseline = None
+    for ev in range(nevents):
+        wcsim.get_event(ev)
+        wcsim.get_first_trigger()
+        wcsim.get_digitized_hits(positions=False)
+        if ev + 1 == warmup:
+            baseline = rss_mb()
+            print("event", ev + 1, "baseline RSS {:.1f} MB".format(baseline), flush=True)
+        elif (ev + 1) % report_interval == 0:
+            print("event", ev + 1, "RSS {:.1f} MB".format(rss_mb()), flush=True)
+    return baseline, rss_mb()
+
+
+if __name__ == '__main__':
+    config = get_args()
+    wcsim = open_chain(config)
+    nevents = wcsim.nevent if config.max_events is None else min(config.max_events, wcsim.nevent)
+    if nevents <= config.warmup:
+        sys.exit("Only " + str(nevents) + " events to scan, need more than the " + str(config.warmup)
+                 + " warm-up events")
+    baseline, final = scan(wcsim, nevents, config.warmup, config.report_interval)
+    growth = final - baseline
+    print("scanned {} events, RSS grew by {:.1f} MB after warm-up (ceiling {:.1f} MB)".format(
+        nevents, growth, config.max_growth_mb))
+    if growth > config.max_growth_mb:
+        print("FAIL: memory grew by more than the ceiling")
+        sys.exit(1)
+    print("OK")
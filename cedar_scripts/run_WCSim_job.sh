@@ -224,7 +224,15 @@ npzfile="${data_dir}/numpy/${fullname}.npz"
 mkdir -p "$(dirname "${npzfile}")"
 mkdir -p "$(dirname "${logfile}")"
 echo "[`date`] Converting to numpy file ${npzfile} log to ${logfile}"
-python "$DATATOOLS/root_utils/event_dump.py" "${rootfile}" -d "${data_dir}/numpy/${directory}" &> "${logfile}"
+python "$DATATOOLS/root_utils/event_dump.py" "${rootfile}" -d "${data_dir}/numpy/${directory}" -c 1000 &> "${logfile}"
+
+# Partial data quality histograms of this job, to be added to other jobs' with wcsim_data_quality.py --reduce
+dqname="${data_dir}/data_quality/${fullname}"
+[ ! -z "$logs" ] && logfile="${LOGDIR}/data_quality/${fullname}.log"
+mkdir -p "$(dirname "${dqname}")"
+mkdir -p "$(dirname "${logfile}")"
+echo "[`date`] Filling data quality histograms ${dqname}.npz log to ${logfile}"
+python "$DATATOOLS/data_quality/wcsim_data_quality.py" -i "${dqname}" "${npzfile}" --partial &> "${logfile}"
 
 if [ ! -z "${runfiTQun}" ]; then
   echo "[`date`] Running fiTQun on ${rootfile}"
@@ -1,28 +1,220 @@
+"""
+Data quality histograms of the digitized hits of sets of WCSim files
+
+Each file set is given as a name followed by its files, and the histograms of the set are saved as pdf files in a
+directory with the set's name. WCSim .root files are read event by event with PyROOT. The .npz outputs of event_dump.py
+and the .h5 outputs of np_to_grid_hdf5.py are instead histogrammed with numpy over whole blocks of events, with the
+files processed in parallel worker processes. The .h5 files only hold the barrel PMTs of the image, with one hit per
+PMT.
+
+With --partial, the bin counts of each file set are saved to a partial result file, name.npz, instead of being plotted,
+so that each job of an array can histogram its own files. --reduce adds the partial results of many jobs and plots
+them, or with --partial saves the sum as a new partial result, so that the plots can be updated as more jobs finish.
+"""
+
 import argparse
+import os
+from multiprocessing import Pool
+import numpy as np
+import h5py
+import root_utils.ragged_utils as ru
+from root_utils.barrel_grid import is_sparse
+from root_utils.compression import load_npz, register_hdf5_filters
 from root_utils.root_file_utils import *
 
-ROOT.gROOT.SetBatch(True)
+# Title, number of bins, lower edge and upper edge of each histogram
+HISTOGRAMS = {
+    "digiHitTime": (";Digitized hit times [ns]", 1350, 550, 1900),
+    "digiHitCharge": (";Digitized hit charge", 1000, 0.1, 100),
+    "totalCharge": (";Total charge", 1000, 100, 100000)
+}
 
 
 def get_args():
-    parser = argparse.ArgumentParser(description='dump WCSim data into numpy .npz file')
-    parser.add_argument('-i', '--input', action='append', nargs='+', metavar=('name' 'file(s)'))
+    parser = argparse.ArgumentParser(description='plot data quality histograms of WCSim .root, .npz or .h5 files')
+    parser.add_argument('-i', '--input', action='append', nargs='+', metavar=('name' 'file(s)'), default=[])
+    parser.add_argument('-r', '--reduce', action='append', nargs='+', metavar=('name' 'partial(s)'), default=[],
+                        help='add partial result files saved with --partial and plot them as one file set')
+    parser.add_argument('-p', '--partial', action='store_true',
+                        help='save the bin counts of each file set to name.npz instead of plotting them')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of worker processes histogramming .npz and .h5 files in parallel')
+    parser.add_argument('-b', '--block_size', type=int, default=10000,
+                        help='number of events of .npz and .h5 files histogrammed at once')
     args = parser.parse_args()
     return args
 
 
-def process_fileset(name, files):
+def new_counts():
+    """Returns empty bin counts for each histogram, including an underflow bin first and an overflow bin last as TH1"""
+    return {name: np.zeros(bins + 2, dtype=np.float64) for name, (_, bins, _, _) in HISTOGRAMS.items()}
+
+
+def fill_counts(counts, name, values):
+    """Adds values to the bin counts of a histogram, binned as TH1::Fill would"""
+    _, bins, low, high = HISTOGRAMS[name]
+    values = values[np.isfinite(values)]
+    # Bin 0 is the underflow and bin bins+1 the overflow, as in ROOT
+    bin_index = np.clip(np.floor((values - low) * (bins / (high - low))), -1, bins).astype(np.int64) + 1
+    counts[name] += np.bincount(bin_index, minlength=bins + 2)
+
+
+def first_triggers(trigger_time, trigger_offsets):
+    """Returns the index within each event of its earliest trigger, as chosen by WCSim.get_first_trigger, or -1"""
+    return ru.segment_argmin(trigger_time, trigger_offsets)
+
+
+def npz_counts(filename, block_size):
+    """Returns the histogram counts of the hits of the first trigger of each event of an event_dump.py output file"""
+    counts = new_counts()
+    npz_file = load_npz(filename, allow_pickle=True)
+    hit_time, hit_offsets = ru.load_field(npz_file, 'digi_hit_time', 'digi_hit_offsets')
+    hit_charge, _ = ru.load_field(npz_file, 'digi_hit_charge', 'digi_hit_offsets')
+    hit_trigger = None
+    if 'first_trigger' in npz_file or 'trigger_time' in npz_file:
+        hit_trigger, _ = ru.load_field(npz_file, 'digi_hit_trigger', 'digi_hit_offsets')
+    else:
+        # e.g. dumps written with --fields truth digi_hits, which leave out the triggers
+        print("Warning: " + filename + " has no trigger times, histogramming the hits of all triggers")
+    if 'first_trigger' in npz_file:
+        first_trigger = npz_file['first_trigger']
+    elif hit_trigger is not None:
+        first_trigger = first_triggers(*ru.load_field(npz_file, 'trigger_time', 'trigger_offsets'))
+    nevents = len(hit_offsets) - 1
+    for start in range(0, nevents, block_size):
+        stop = min(start + block_size, nevents)
+        hits = slice(hit_offsets[start], hit_offsets[stop])
+        event = ru.event_index(hit_offsets[start:stop+1] - hit_offsets[start])
+        time, charge = hit_time[hits], hit_charge[hits]
+        if hit_trigger is not None:
+            selected = hit_trigger[hits] == first_trigger[start:stop][event]
+            event, time, charge = event[selected], time[selected], charge[selected]
+        fill_counts(counts, "digiHitTime", time)
+        fill_counts(counts, "digiHitCharge", charge)
+        fill_counts(counts, "totalCharge", np.bincount(event, weights=charge, minlength=stop-start))
+    return counts, nevents
+
+
+def h5_counts(filename, block_size):
+    """Returns the histogram counts of the PMT hits in the images of an np_to_grid_hdf5.py output file"""
+    counts = new_counts()
+    register_hdf5_filters()
+    with h5py.File(filename, 'r') as f:
+        nevents = f["event_ids"].shape[0]
+        sparse = is_sparse(f)
+        if sparse:
+            offsets = f["event_data_offsets"][...]
+        for start in range(0, nevents, block_size):
+            stop = min(start + block_size, nevents)
+            if sparse:
+                entries = slice(offsets[start], offsets[stop])
+                channel = f["event_data_index"][entries][:, 2]
+                values = f["event_data_values"][entries]
+                event = ru.event_index(offsets[start:stop+1] - offsets[start])
+                is_charge = channel < 19
+                charge, time = values[is_charge], values[~is_charge]
+                total_charge = np.bincount(event[is_charge], weights=charge, minlength=stop-start)
+            else:
+                event_data = f["event_data"][start:stop]
+                hit = event_data[..., :19] != 0
+                charge, time = event_data[..., :19][hit], event_data[..., 19:][hit]
+                total_charge = event_data[..., :19].sum(axis=(1, 2, 3), dtype=np.float64)
+            fill_counts(counts, "digiHitTime", time)
+            fill_counts(counts, "digiHitCharge", charge)
+            fill_counts(counts, "totalCharge", total_charge)
+    return counts, nevents
+
+
+def file_counts(task):
+    filename, block_size = task
+    if os.path.splitext(filename)[1].lower() == '.h5':
+        return h5_counts(filename, block_size)
+    return npz_counts(filename, block_size)
+
+
+def count_filesets(filesets, workers, block_size):
+    """Returns the histogram counts and number of events of each (name, files) file set of .npz or .h5 files"""
+    tasks = [(f, block_size) for _, files in filesets for f in files]
+    with Pool(workers) as pool:
+        results = pool.imap(file_counts, tasks)
+        results_by_fileset = []
+        for name, files in filesets:
+            counts = new_counts()
+            nevents = 0
+            for f in files:
+                file_result, file_events = next(results)
+                for key in counts:
+                    counts[key] += file_result[key]
+                nevents += file_events
+                print("Finished file", f, flush=True)
+            print(nevents, "events in file set", name)
+            results_by_fileset.append((counts, nevents))
+    return results_by_fileset
+
+
+def save_partial(filename, counts, nevents, inputs):
+    """Saves the bin counts and binning of each histogram, the number of events and the input files they come from"""
+    arrays = {"nevents": nevents, "inputs": np.array(inputs)}
+    for key, (_, bins, low, high) in HISTOGRAMS.items():
+        arrays[key] = counts[key]
+        arrays[key+"_binning"] = np.array([bins, low, high], dtype=np.float64)
+    np.savez(filename, **arrays)
+
+
+def load_partial(filename):
+    """Returns the bin counts, number of events and input files of a partial result file"""
+    with np.load(filename) as f:
+        for key, (_, bins, low, high) in HISTOGRAMS.items():
+            if not np.array_equal(f[key+"_binning"], [bins, low, high]):
+                raise ValueError("Binning of "+key+" in "+filename+" does not match the current binning")
+        return {key: f[key] for key in HISTOGRAMS}, int(f["nevents"]), f["inputs"].tolist()
+
+
+def reduce_partials(filenames):
+    """Returns the sums of the bin counts and numbers of events of partial result files, and all of their inputs"""
+    counts = new_counts()
+    nevents = 0
+    inputs = []
+    for filename in filenames:
+        partial_counts, partial_events, partial_inputs = load_partial(filename)
+        duplicates = set(inputs).intersection(partial_inputs)
+        if duplicates:
+            raise ValueError("Partial result "+filename+" includes input files already included by another partial "
+                             "result: "+", ".join(sorted(duplicates)))
+        for key in counts:
+            counts[key] += partial_counts[key]
+        nevents += partial_events
+        inputs.extend(partial_inputs)
+    return counts, nevents, inputs
+
+
+def new_histograms(name):
+    histograms = {}
+    for key, (title, bins, low, high) in HISTOGRAMS.items():
+        h = ROOT.TH1D(key, name+title, bins, low, high)
+        h.SetStats(0)
+        h.GetXaxis().SetTitleSize(0.05)
+        histograms[key] = h
+    return histograms
+
+
+def counts_histograms(name, counts):
+    """Returns TH1Ds with the given bin counts, including underflow and overflow"""
+    histograms = new_histograms(name)
+    for key, h in histograms.items():
+        for i, c in enumerate(counts[key]):
+            h.SetBinContent(i, c)
+        h.SetEntries(counts[key].sum())
+    return histograms
+
+
+def fill_fileset(name, files):
     wcsim = WCSimChain(files)
     print(wcsim.nevent, "events in file set", name)
-    digiHitTime = ROOT.TH1D("digiHitTime", name+";Digitized hit times [ns]", 1350, 550, 1900)
-    digiHitCharge = ROOT.TH1D("digiHitCharge", name+";Digitized hit charge", 1000, 0.1, 100)
-    totalCharge = ROOT.TH1D("totalCharge", name+";Total charge", 1000, 100, 100000)
-    digiHitTime.SetStats(0)
-    digiHitCharge.SetStats(0)
-    totalCharge.SetStats(0)
-    digiHitTime.GetXaxis().SetTitleSize(0.05)
-    digiHitCharge.GetXaxis().SetTitleSize(0.05)
-    totalCharge.GetXaxis().SetTitleSize(0.05)
+    histograms = new_histograms(name)
+    digiHitTime = histograms["digiHitTime"]
+    digiHitCharge = histograms["digiHitCharge"]
+    totalCharge = histograms["totalCharge"]
     for ev in range(wcsim.nevent):
         if ev % 100 == 0: print("event", ev, "of", wcsim.nevent, flush=True)
         wcsim.get_event(ev)
@@ -36,26 +228,66 @@ def process_fileset(name, files):
             totalQ += Q
             digiHitCharge.Fill(Q)
         totalCharge.Fill(totalQ)
+    return histograms, wcsim.nevent
+
+
+def histogram_counts(histograms):
+    """Returns the bin counts of TH1Ds, including underflow and overflow"""
+    return {key: np.array([h.GetBinContent(i) for i in range(h.GetNbinsX() + 2)]) for key, h in histograms.items()}
+
+
+def save_plots(name, histograms):
     if not os.path.isdir(name):
         os.mkdir(name)
     path=os.path.abspath(name)
     c = ROOT.TCanvas()
-    digiHitTime.Draw()
+    histograms["digiHitTime"].Draw()
     c.SetLogy()
     c.SaveAs(path+"/digiHitTime.pdf")
-    digiHitCharge.Draw()
+    histograms["digiHitCharge"].Draw()
     c.SetLogy()
     c.SetLogx()
     c.Draw()
     c.SaveAs(path+"/digiHitCharge.pdf")
-    totalCharge.Draw()
+    histograms["totalCharge"].Draw()
     c.SetLogy()
     c.SetLogx()
     c.Draw()
     c.SaveAs(path+"/totalCharge.pdf")
 
 
+def is_root_fileset(files):
+    return all(os.path.splitext(f)[1].lower() == '.root' for f in files)
+
+
+def fileset_counts(filesets, workers, block_size):
+    """Returns the histogram counts and number of events of each (name, files) file set"""
+    converted = [(name, files) for name, files in filesets if not is_root_fileset(files)]
+    converted_counts = iter(count_filesets(converted, workers, block_size) if converted else [])
+    results = []
+    for name, files in filesets:
+        if is_root_fileset(files):
+            histograms, nevents = fill_fileset(name, files)
+            results.append((histogram_counts(histograms), nevents))
+        else:
+            results.append(next(converted_counts))
+    return results
+
+
+def save_result(name, counts, nevents, inputs, partial):
+    if partial:
+        save_partial(name+".npz", counts, nevents, inputs)
+        print("Saved partial result of", nevents, "events to", name+".npz")
+    else:
+        save_plots(name, counts_histograms(name, counts))
+
+
 if __name__ == '__main__':
     config = get_args()
-    for fileset in config.input:
-        process_fileset(fileset[0], fileset[1:])
+    filesets = [(fileset[0], [os.path.abspath(f) for f in fileset[1:]]) for fileset in config.input]
+    for (name, files), (counts, nevents) in zip(filesets, fileset_counts(filesets, config.workers, config.block_size)):
+        save_result(name, counts, nevents, files, config.partial)
+    for name, *partials in config.reduce:
+        counts, nevents, inputs = reduce_partials(partials)
+        print(nevents, "events from", len(inputs), "files in", len(partials), "partial results for", name)
+        save_result(name, counts, nevents, inputs, config.partial)
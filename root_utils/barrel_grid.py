@@ -0,0 +1,93 @@
+"""
+Conversion of digitized hits to the 16 x 40 x 38 image of the IWCD barrel used for training
+
+The image has one pixel per barrel mPMT module (16 rows of 40 columns) with 38 channels: the charge of each of the 19
+PMTs in the module in channels 0-18, and their times in channels 19-37.
+"""
+
+import numpy as np
+
+import root_utils.pos_utils as pu
+import root_utils.ragged_utils as ru
+
+GRID_SHAPE = (16, 40, 38)
+
+
+def grid_events(hit_pmt, hit_charge, hit_time, hit_offsets, start, stop, out=None):
+    """
+    Returns the barrel images of events start to stop-1, given the flat hit arrays and offsets of many events
+
+    The hits of the whole range are processed at once. If out is given, it must have shape (stop-start, 16, 40, 38) and
+    is overwritten with the images instead of allocating a new float32 array.
+    """
+    pmt, offsets = ru.event_range(hit_pmt, hit_offsets, start, stop)
+    hits = slice(hit_offsets[start], hit_offsets[stop])
+    event = ru.event_index(offsets)
+    module_index = pu.module_index(pmt)
+    barrel = pu.is_barrel(module_index)
+    row, col = pu.row_col(module_index[barrel])
+    pmt_in_module = pu.pmt_in_module_id(pmt[barrel])
+    event = event[barrel]
+    if out is None:
+        out = np.zeros((stop - start,) + GRID_SHAPE, dtype=np.float32)
+    else:
+        out[...] = 0
+    out[event, row, col, pmt_in_module] = hit_charge[hits][barrel]
+    out[event, row, col, pmt_in_module + 19] = hit_time[hits][barrel]
+    return out
+
+
+def to_sparse(event_data):
+    """
+    Converts a block of barrel images to sparse form, keeping only the non-zero pixel channels
+
+    Returns the (row, column, channel) index of each non-zero entry as a uint8 array of shape (n, 3), the float32 values
+    and the number of entries of each event, with the entries ordered by event.
+    """
+    event, row, col, channel = np.nonzero(event_data)
+    index = np.stack((row, col, channel), axis=1).astype(np.uint8)
+    values = event_data[event, row, col, channel].astype(np.float32)
+    counts = np.bincount(event, minlength=event_data.shape[0])
+    return index, values, counts
+
+
+def densify(index, values, offsets, events, out=None):
+    """
+    Returns the dense barrel images of a list of events, given sparse event data with its per-event offsets
+
+    The images are written into out if given, which must have shape (len(events), 16, 40, 38).
+    """
+    events = np.asarray(events, dtype=np.int64)
+    event_index, event_offsets = ru.gather_events(index, offsets, events)
+    event_values, _ = ru.gather_events(values, offsets, events)
+    if out is None:
+        out = np.zeros((len(events),) + GRID_SHAPE, dtype=np.float32)
+    else:
+        out[...] = 0
+    event = ru.event_index(event_offsets)
+    out[event, event_index[:, 0], event_index[:, 1], event_index[:, 2]] = event_values
+    return out
+
+
+def is_sparse(f):
+    """Returns True if the event data of an HDF5 or npz file is stored in sparse form"""
+    return "event_data_values" in f
+
+
+def read_event_data(f, events):
+    """
+    Returns the dense barrel images of a list of events from an HDF5 or npz file, with event data in either form
+
+    Sparse event data is densified on the fly, reading only the entries of the requested events.
+    """
+    events = np.asarray(events, dtype=np.int64)
+    if not is_sparse(f):
+        # h5py needs strictly increasing indices, so read each distinct event once and then restore the requested order
+        unique_events, inverse = np.unique(events, return_inverse=True)
+        return np.asarray(f["event_data"][unique_events], dtype=np.float32)[inverse]
+    offsets = f["event_data_offsets"][...]
+    ranges = [slice(offsets[e], offsets[e + 1]) for e in events]
+    index = np.concatenate([f["event_data_index"][r] for r in ranges]) if ranges else np.empty((0, 3), np.uint8)
+    values = np.concatenate([f["event_data_values"][r] for r in ranges]) if ranges else np.empty(0, np.float32)
+    local_offsets = ru.offsets_from_counts(offsets[events + 1] - offsets[events])
+    return densify(index, values, local_offsets, np.arange(len(events)))
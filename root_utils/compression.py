@@ -0,0 +1,371 @@
+"""
+Compression codecs and filters for the .npz and HDF5 outputs of the conversion scripts
+
+A codec is written as "name[:level][+filter...]", e.g. "zlib:6", "lz4", "zstd:9+delta" or "blosc:5+shuffle", with name
+one of CODECS and filters from FILTERS applied in the order given before compressing:
+    shuffle: stores the first bytes of all elements together, then the second bytes, and so on, so that the slowly
+             varying high bytes of numbers of similar size compress well
+    delta: replaces each row by its difference from the previous row, taken on the bit patterns of the elements so that
+           it is exactly reversible for floats, which turns sorted PMT ids and hit times into small numbers
+Filters only apply to numeric arrays, and other arrays are compressed as they are. The lz4, zstd and blosc codecs need
+the lz4, zstandard and blosc packages, and hdf5plugin to write or read HDF5 files with them.
+
+The outputs of an "npz" file are written by save_npz to a zip archive like np.savez. With the none or zlib codecs
+without filters, arrays are written as standard .npy members, so the file is the same as written by np.savez or
+np.savez_compressed. Otherwise each array is a .npc member, with a header giving its dtype, shape and codec followed by
+independently compressed blocks of rows (see NPC_MAGIC), and the file must be read with load_npz, which reads both.
+
+A Compression gives the codec of each array of an output, as a default codec and codecs for named arrays, written as
+"name=codec" (see Compression.parse), so that each dataset can be stored with the codec that suits it best.
+"""
+
+import json
+import struct
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+CODECS = ("none", "zlib", "lz4", "zstd", "blosc")
+FILTERS = ("shuffle", "delta")
+DEFAULT_LEVELS = {"none": 0, "zlib": 6, "lz4": 0, "zstd": 3, "blosc": 5}
+DEFAULT_CODEC = "zlib"
+# Internal compressor of blosc, which adds its own shuffle and multithreading
+BLOSC_COMPRESSOR = "lz4"
+# Arrays are compressed in independent blocks of rows of about this size, which are compressed in parallel and bound
+# the memory used to stream an array
+BLOCK_BYTES = 4 * 1024 * 1024
+# Start of each .npc member, followed by the length of its JSON header as a little-endian uint32, the header, then each
+# block as its compressed length as a little-endian uint64 followed by the compressed bytes
+NPC_MAGIC = b"\x93NPC\x01"
+
+
+def import_codec_module(name):
+    """Imports the package implementing a codec, which are optional dependencies"""
+    packages = {"lz4": "lz4.frame", "zstd": "zstandard", "blosc": "blosc"}
+    try:
+        return __import__(packages[name], fromlist=["_"])
+    except ImportError:
+        raise ImportError("The " + name + " codec needs the " + packages[name].split(".")[0] + " package") from None
+
+
+def register_hdf5_filters():
+    """Registers the HDF5 filters of hdf5plugin, if installed, so that files compressed with them can be read"""
+    try:
+        import hdf5plugin  # noqa: F401
+    except ImportError:
+        pass
+
+
+class Codec:
+    """
+    Compresses arrays with one of CODECS, at a level whose meaning depends on the codec, after applying the FILTERS in
+    the order given. Blocks of rows are compressed on threads threads, except with blosc which uses its own threads.
+    """
+
+    def __init__(self, name=DEFAULT_CODEC, level=None, filters=(), threads=1):
+        if name not in CODECS:
+            raise ValueError("Unknown codec " + name + ", expected one of " + ", ".join(CODECS))
+        unknown = [f for f in filters if f not in FILTERS]
+        if unknown:
+            raise ValueError("Unknown filters " + ", ".join(unknown) + ", expected some of " + ", ".join(FILTERS))
+        self.name = name
+        self.level = DEFAULT_LEVELS[name] if level is None else int(level)
+        self.filters = tuple(filters)
+        self.threads = threads
+        if name != "none" and name != "zlib":
+            self.module = import_codec_module(name)
+
+    @classmethod
+    def parse(cls, spec, threads=1):
+        """Returns the codec written as "name[:level][+filter...]" """
+        name, *filters = spec.split("+")
+        name, _, level = name.partition(":")
+        return cls(name, level or None, filters, threads)
+
+    def __str__(self):
+        spec = self.name if self.name == "none" else self.name + ":" + str(self.level)
+        return "+".join((spec,) + self.filters)
+
+    def __repr__(self):
+        return "Codec(" + repr(str(self)) + ")"
+
+    @property
+    def npy_compatible(self):
+        """Whether arrays are written as standard .npy members, compressed by the zip archive itself"""
+        return self.name in ("none", "zlib") and not self.filters
+
+    def compress(self, raw, itemsize):
+        if self.name == "none":
+            return raw
+        if self.name == "zlib":
+            return zlib.compress(raw, self.level)
+        if self.name == "lz4":
+            return self.module.compress(raw, compression_level=self.level)
+        if self.name == "zstd":
+            return self.module.ZstdCompressor(level=self.level).compress(raw)
+        shuffle = self.module.SHUFFLE if "shuffle" in self.filters else self.module.NOSHUFFLE
+        return self.module.compress(raw, typesize=itemsize, clevel=self.level, shuffle=shuffle, cname=BLOSC_COMPRESSOR)
+
+    def decompress(self, data, nbytes):
+        if self.name == "none":
+            return data
+        if self.name == "zlib":
+            return zlib.decompress(data)
+        if self.name == "zstd":
+            return self.module.ZstdDecompressor().decompress(data, max_output_size=nbytes)
+        return self.module.decompress(data)
+
+    def filtered(self, dtype):
+        """Returns the filters applied to arrays of dtype by this codec, blosc applying the shuffle itself"""
+        if dtype.kind not in "biuf" or dtype.itemsize not in (1, 2, 4, 8):
+            return ()
+        return tuple(f for f in self.filters if not (f == "shuffle" and self.name == "blosc"))
+
+    def filter_steps(self, dtype, shape):
+        """
+        Returns each filter applied to arrays of dtype and shape, with the dtype and shape of the array it is applied
+        to, which the filters before it have changed
+        """
+        steps = []
+        for f in self.filtered(dtype):
+            steps.append((f, dtype, shape))
+            if f == "delta":
+                dtype = np.dtype("u" + str(dtype.itemsize))
+            else:
+                shape = (dtype.itemsize, int(np.prod(shape)))
+                dtype = np.dtype(np.uint8)
+        return steps
+
+    def encode(self, block):
+        """Returns the compressed bytes of a block of rows, after applying the filters"""
+        block = np.ascontiguousarray(block)
+        for f, dtype, shape in self.filter_steps(block.dtype, block.shape):
+            if f == "delta":
+                bits = block.view("u" + str(dtype.itemsize))
+                block = bits.copy()
+                block[1:] -= bits[:-1]
+            else:
+                block = block.view(np.uint8).reshape(-1, dtype.itemsize).T.copy()
+        return self.compress(block.tobytes(), block.dtype.itemsize)
+
+    def decode(self, data, dtype, shape):
+        """Returns the block of rows of the given dtype and shape encoded as data, undoing the filters in reverse"""
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        raw = np.frombuffer(self.decompress(data, nbytes), dtype=np.uint8)
+        for f, step_dtype, step_shape in reversed(self.filter_steps(dtype, shape)):
+            if f == "delta":
+                bits = raw.view("u" + str(step_dtype.itemsize)).reshape(step_shape)
+                raw = np.cumsum(bits, axis=0, dtype=bits.dtype).view(np.uint8).reshape(-1)
+            else:
+                raw = raw.reshape(step_dtype.itemsize, -1).T.reshape(-1)
+        return raw.view(dtype).reshape(shape)
+
+    def map_blocks(self, function, blocks):
+        """Applies function to each block in order, on up to threads blocks at a time"""
+        if self.threads <= 1 or self.name == "blosc":
+            if self.name == "blosc":
+                self.module.set_nthreads(max(self.threads, 1))
+            yield from map(function, blocks)
+            return
+        with ThreadPoolExecutor(self.threads) as executor:
+            batch = []
+            for block in blocks:
+                batch.append(block)
+                if len(batch) == self.threads:
+                    yield from executor.map(function, batch)
+                    batch = []
+            yield from executor.map(function, batch)
+
+    def h5py_options(self):
+        """Returns the keyword arguments of h5py's create_dataset that compress a dataset with this codec"""
+        if "delta" in self.filters:
+            raise ValueError("The delta filter is not available for HDF5 datasets")
+        if self.name == "none":
+            options = {}
+        elif self.name == "zlib":
+            options = {"compression": "gzip", "compression_opts": self.level}
+        else:
+            try:
+                import hdf5plugin
+            except ImportError:
+                raise ImportError("Writing HDF5 datasets with the " + self.name + " codec needs the hdf5plugin "
+                                  "package") from None
+            if self.name == "lz4":
+                options = dict(hdf5plugin.LZ4())
+            elif self.name == "zstd":
+                options = dict(hdf5plugin.Zstd(clevel=self.level))
+            else:
+                shuffle = hdf5plugin.Blosc.SHUFFLE if "shuffle" in self.filters else hdf5plugin.Blosc.NOSHUFFLE
+                options = dict(hdf5plugin.Blosc(cname=BLOSC_COMPRESSOR, clevel=self.level, shuffle=shuffle))
+        if "shuffle" in self.filters and self.name != "blosc":
+            options["shuffle"] = True
+        return options
+
+
+class Compression:
+    """Codec of each array of an output: the codec of arrays with their own entry in codecs, or the default codec"""
+
+    def __init__(self, default=DEFAULT_CODEC, codecs=None, threads=1):
+        self.default = default if isinstance(default, Codec) else Codec.parse(default, threads)
+        self.codecs = {name: c if isinstance(c, Codec) else Codec.parse(c, threads)
+                       for name, c in (codecs or {}).items()}
+
+    @classmethod
+    def parse(cls, specs, threads=1):
+        """Returns the compression given by a list of codecs, at most one a default and the rest "name=codec" """
+        default = None
+        codecs = {}
+        for spec in specs:
+            name, _, codec = spec.rpartition("=")
+            if name:
+                codecs[name] = codec
+            elif default is not None:
+                raise ValueError("More than one default codec given: " + default + " and " + codec)
+            else:
+                default = codec
+        return cls(default or DEFAULT_CODEC, codecs, threads)
+
+    def codec(self, name):
+        return self.codecs.get(name, self.default)
+
+    def __str__(self):
+        return " ".join([str(self.default)] + [n + "=" + str(c) for n, c in self.codecs.items()])
+
+
+def as_compression(compression):
+    """Returns the Compression given as a Compression, Codec, codec string or list of codec strings, default if None"""
+    if isinstance(compression, Compression):
+        return compression
+    if compression is None or isinstance(compression, (Codec, str)):
+        return Compression(compression or DEFAULT_CODEC)
+    return Compression.parse(compression)
+
+
+def block_rows(dtype, row_shape):
+    """Returns the number of rows in each compressed block of an array"""
+    return max(1, BLOCK_BYTES // max(1, dtype.itemsize * int(np.prod(row_shape, dtype=np.int64))))
+
+
+def write_member(npz, name, codec, dtype, shape, blocks):
+    """
+    Writes an array of the given dtype and shape to the open zip archive npz, from an iterable of consecutive blocks of
+    rows, each of block_rows rows except the last. Object arrays and scalars are always written as .npy members.
+    """
+    if codec.npy_compatible or dtype.hasobject or len(shape) == 0:
+        # The zip archive compresses each member as set when it is opened, with zlib unless no compression is wanted.
+        # The zlib level is only applied from python 3.7, older versions use zlib's default level.
+        npz.compression = zipfile.ZIP_STORED if codec.name == "none" else zipfile.ZIP_DEFLATED
+        npz.compresslevel = codec.level if codec.name == "zlib" else None
+        with npz.open(name + ".npy", mode="w", force_zip64=True) as out:
+            if dtype.hasobject:
+                # Object arrays are pickled, as np.savez does, which is only done for whole arrays
+                blocks = list(blocks)
+                np.lib.format.write_array(out, np.concatenate(blocks) if len(blocks) > 1 else np.asarray(blocks[0]),
+                                          allow_pickle=True)
+                return
+            np.lib.format.write_array_header_1_0(out, {"descr": np.lib.format.dtype_to_descr(dtype),
+                                                       "fortran_order": False, "shape": shape})
+            for block in blocks:
+                out.write(np.ascontiguousarray(block, dtype=dtype).tobytes())
+        return
+    npz.compression = zipfile.ZIP_STORED
+    npz.compresslevel = None
+    header = json.dumps({"descr": np.lib.format.dtype_to_descr(dtype), "shape": list(shape), "codec": str(codec),
+                         "block_rows": block_rows(dtype, shape[1:])}).encode()
+    with npz.open(name + ".npc", mode="w", force_zip64=True) as out:
+        out.write(NPC_MAGIC + struct.pack("<I", len(header)) + header)
+        for data in codec.map_blocks(codec.encode, (np.asarray(b, dtype=dtype) for b in blocks)):
+            out.write(struct.pack("<Q", len(data)) + data)
+
+
+def read_npc(member, threads=1):
+    """Returns the array stored in an open .npc member"""
+    if member.read(len(NPC_MAGIC)) != NPC_MAGIC:
+        raise ValueError("Not a compressed array member")
+    header = json.loads(member.read(struct.unpack("<I", member.read(4))[0]))
+    dtype = np.lib.format.descr_to_dtype(header["descr"])
+    shape = tuple(header["shape"])
+    codec = Codec.parse(header["codec"], threads)
+    rows = header["block_rows"]
+    array = np.empty(shape, dtype=dtype)
+
+    def compressed_blocks():
+        for start in range(0, shape[0], rows):
+            yield start, member.read(struct.unpack("<Q", member.read(8))[0])
+
+    def decode(block):
+        start, data = block
+        stop = min(start + rows, shape[0])
+        array[start:stop] = codec.decode(data, dtype, (stop - start,) + shape[1:])
+
+    for _ in codec.map_blocks(decode, compressed_blocks()):
+        pass
+    return array
+
+
+def save_npz(filename, arrays, compression=None):
+    """Saves a dictionary of arrays to an npz file, compressing each with its codec (see as_compression)"""
+    compression = as_compression(compression)
+    with zipfile.ZipFile(filename, mode="w", allowZip64=True) as npz:
+        for name, array in arrays.items():
+            array = np.asanyarray(array)
+            if array.ndim == 0:
+                write_member(npz, name, compression.codec(name), array.dtype, array.shape, [array])
+                continue
+            rows = block_rows(array.dtype, array.shape[1:])
+            blocks = (array[i:i + rows] for i in range(0, len(array), rows))
+            write_member(npz, name, compression.codec(name), array.dtype, array.shape, blocks)
+
+
+class NpzArrays:
+    """
+    Arrays of an npz file written by save_npz or np.savez, read when accessed by name like the result of np.load
+
+    Object arrays, which older outputs of the conversion scripts contain, are only read if allow_pickle is True.
+    """
+
+    def __init__(self, filename, allow_pickle=False, threads=1):
+        self.zip = zipfile.ZipFile(filename)
+        self.allow_pickle = allow_pickle
+        self.threads = threads
+        self.members = {}
+        for member in self.zip.namelist():
+            name, ext = member.rsplit(".", 1) if "." in member else (member, "")
+            if ext in ("npy", "npc"):
+                self.members[name] = member
+        self.files = list(self.members)
+
+    def __getitem__(self, name):
+        member = self.members[name]
+        with self.zip.open(member) as f:
+            if member.endswith(".npc"):
+                return read_npc(f, self.threads)
+            return np.lib.format.read_array(f, allow_pickle=self.allow_pickle)
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    def keys(self):
+        return self.files
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_npz(filename, allow_pickle=False, threads=1):
+    """Returns the arrays of an npz file, compressed with any codec, see NpzArrays"""
+    return NpzArrays(filename, allow_pickle, threads)
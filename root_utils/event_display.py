@@ -1,9 +1,15 @@
 """
-Python 3 script for displaying data from a particular event in a ROOT file at a specified index
+Python 3 script for displaying data from events in ROOT files
+
+The input is a request file with one line per set of displays, giving a name, a ROOT file and the events to display, as
+a single index, an inclusive range such as 10-20, or a comma separated list of both such as 1,5,10-20. The PMT geometry
+and its projections are loaded once per ROOT file (see geometry.py), and the events are rendered in parallel worker
+processes. The geometry plots of each output directory are only redrawn if they are missing or older than the ROOT file.
 
 Authors: Wojtek Fedorko, Julian Ding, Nick Prouse
 """
 import argparse
+from multiprocessing import Pool
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -13,11 +19,10 @@ from mpl_toolkits.mplot3d import Axes3D
 
 from root_utils.pos_utils import *
 from root_utils.root_file_utils import *
+from root_utils.geometry import REGION_BARREL, REGION_BOTTOM, REGION_TOP
 
 import os
 
-ROOT.gROOT.SetBatch(True)
-
 matplotlib.use('Agg')
 
 
@@ -25,6 +30,11 @@ def get_args():
     parser = argparse.ArgumentParser(description='Display events from a list of input ROOT files')
     parser.add_argument('input_file', type=str)
     parser.add_argument('output_dir', type=str)
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of worker processes rendering events in parallel')
+    parser.add_argument('-f', '--format', type=str, default='pdf', choices=['pdf', 'png'],
+                        help='file format of the plots')
+    parser.add_argument('--dpi', type=int, default=100, help='resolution of png plots')
     args = parser.parse_args()
     return args
 
@@ -40,10 +50,31 @@ def scatter_plot(num, x, y, c, s, cm, xlabel, ylabel, label, filename, norm=None
     cbar.set_label(label)
     fig.savefig(filename)
 
-def event_display(ev, input_file, write_dir):
 
-    norm = plt.Normalize()
+def parse_events(events):
+    """Returns the event indices given as a comma separated list of indices and inclusive ranges, e.g. 1,5,10-20"""
+    indices = []
+    for part in events.split(','):
+        first, _, last = part.partition('-')
+        indices.extend(range(int(first), int(last or first) + 1))
+    return indices
+
+
+GEOMETRY_PLOTS = ["pos_arc_z_disp_all_tubes", "pos_x_y_disp_all_tubes", "pos_arc_z_disp_wall_tubes",
+                  "pos_arc_z_disp_wall_tubes_color_row", "pos_arc_z_disp_wall_tubes_color_col",
+                  "pos_x_y_disp_top_tubes", "pos_x_y_disp_bottom_tubes"]
+
 
+def geometry_plots_up_to_date(input_file, write_dir, fmt):
+    input_time = os.path.getmtime(input_file)
+    for plot in GEOMETRY_PLOTS:
+        filename = os.path.join(write_dir, plot + "." + fmt)
+        if not os.path.isfile(filename) or os.path.getmtime(filename) < input_time:
+            return False
+    return True
+
+
+def category_colormaps():
     cm = matplotlib.cm.plasma
 
     cmaplist = [cm(i) for i in range(cm.N)]
@@ -56,39 +87,24 @@ def event_display(ev, input_file, write_dir):
     cm_cat_module_col = lsc.from_list('Custom cmap', cmaplist, cm.N)
     bounds_cat_module_col = np.linspace(0, 40, 41)
     norm_cat_module_col = matplotlib.colors.BoundaryNorm(bounds_cat_module_col, cm_cat_module_col.N)
+    return (cm_cat_pmt_in_module, norm_cat_pmt_in_module, cm_cat_module_row, norm_cat_module_row, cm_cat_module_col,
+            norm_cat_module_col)
 
-    wcsim = WCSimFile(input_file)
-
-    np_pos_x_all_tubes = np.zeros(wcsim.num_pmts)
-    np_pos_y_all_tubes = np.zeros(wcsim.num_pmts)
-    np_pos_z_all_tubes = np.zeros(wcsim.num_pmts)
-
-    np_pmt_in_module_id_all_tubes = np.zeros(wcsim.num_pmts)
-    np_pmt_index_all_tubes = np.arange(wcsim.num_pmts)
-
-    np.random.shuffle(np_pmt_index_all_tubes)
 
-    np_module_index_all_tubes = module_index(np_pmt_index_all_tubes)
+def geometry_display(geometry, write_dir, fmt="pdf"):
+    (cm_cat_pmt_in_module, norm_cat_pmt_in_module, cm_cat_module_row, norm_cat_module_row, cm_cat_module_col,
+     norm_cat_module_col) = category_colormaps()
 
-    for i in range(len(np_pmt_index_all_tubes)):
-        pmt_tube_in_module_id = np_pmt_index_all_tubes[i] % 19
-        np_pmt_in_module_id_all_tubes[i] = pmt_tube_in_module_id
-        pmt = wcsim.geo.GetPMT(int(np_pmt_index_all_tubes[i]))
+    np_pmt_in_module_id_all_tubes = geometry["pmt_in_module"]
 
-        np_pos_x_all_tubes[i] = pmt.GetPosition(2)
-        np_pos_y_all_tubes[i] = pmt.GetPosition(0)
-        np_pos_z_all_tubes[i] = pmt.GetPosition(1)
+    np_pos_x_all_tubes = geometry["display_x"]
+    np_pos_y_all_tubes = geometry["display_y"]
+    np_pos_z_all_tubes = geometry["display_z"]
+    np_pos_arc_all_tubes = geometry["display_arc"]
 
-    np_pos_r_all_tubes = np.hypot(np_pos_x_all_tubes, np_pos_y_all_tubes)
-
-    r_max = np.amax(np_pos_r_all_tubes)
-
-    np_pos_phi_all_tubes = np.arctan2(np_pos_y_all_tubes, np_pos_x_all_tubes)
-    np_pos_arc_all_tubes = r_max * np_pos_phi_all_tubes
-
-    np_wall_indices = np.where(is_barrel(np_module_index_all_tubes))
-    np_top_indices = np.where(is_top(np_module_index_all_tubes))
-    np_bottom_indices = np.where(is_bottom(np_module_index_all_tubes))
+    np_wall_indices = np.where(geometry["region"] == REGION_BARREL)
+    np_top_indices = np.where(geometry["region"] == REGION_TOP)
+    np_bottom_indices = np.where(geometry["region"] == REGION_BOTTOM)
 
     np_pmt_in_module_id_wall_tubes = np_pmt_in_module_id_all_tubes[np_wall_indices]
     np_pmt_in_module_id_top_tubes = np_pmt_in_module_id_all_tubes[np_top_indices]
@@ -100,88 +116,78 @@ def event_display(ev, input_file, write_dir):
     np_pos_x_bottom_tubes = np_pos_x_all_tubes[np_bottom_indices]
     np_pos_y_bottom_tubes = np_pos_y_all_tubes[np_bottom_indices]
 
-    np_wall_row, np_wall_col = row_col(np_module_index_all_tubes[np_wall_indices])
+    np_wall_row = geometry["row"][np_wall_indices]
+    np_wall_col = geometry["col"][np_wall_indices]
 
     np_pos_arc_wall_tubes = np_pos_arc_all_tubes[np_wall_indices]
 
     scatter_plot(101, np_pos_arc_all_tubes, np_pos_z_all_tubes, np_pmt_in_module_id_all_tubes, 5, cm_cat_pmt_in_module,
-                 'arc along the wall', 'z', "pmt in module", os.path.join(write_dir,"pos_arc_z_disp_all_tubes.pdf"),
+                 'arc along the wall', 'z', "pmt in module", os.path.join(write_dir,"pos_arc_z_disp_all_tubes."+fmt),
                  norm_cat_pmt_in_module, range(20))
 
     scatter_plot(102, np_pos_x_all_tubes, np_pos_y_all_tubes, np_pmt_in_module_id_all_tubes, 5, cm_cat_pmt_in_module,
-                 'x', 'y', "pmt in module", os.path.join(write_dir,"pos_x_y_disp_all_tubes.pdf"), norm_cat_pmt_in_module, range(20))
+                 'x', 'y', "pmt in module", os.path.join(write_dir,"pos_x_y_disp_all_tubes."+fmt),
+                 norm_cat_pmt_in_module, range(20))
 
     scatter_plot(103, np_pos_arc_wall_tubes, np_pos_z_wall_tubes, np_pmt_in_module_id_wall_tubes, 5,
                  cm_cat_pmt_in_module, 'arc along the wall', 'z', "pmt in module",
-                 os.path.join(write_dir,"pos_arc_z_disp_wall_tubes.pdf"), norm_cat_pmt_in_module, range(20))
+                 os.path.join(write_dir,"pos_arc_z_disp_wall_tubes."+fmt), norm_cat_pmt_in_module, range(20))
 
     scatter_plot(104, np_pos_arc_wall_tubes, np_pos_z_wall_tubes, np_wall_row, 5, cm_cat_module_row,
-                 'arc along the wall', 'z', "wall module row", os.path.join(write_dir,"pos_arc_z_disp_wall_tubes_color_row.pdf"),
-                 norm_cat_module_row, range(16))
+                 'arc along the wall', 'z', "wall module row",
+                 os.path.join(write_dir,"pos_arc_z_disp_wall_tubes_color_row."+fmt), norm_cat_module_row, range(16))
 
     scatter_plot(105, np_pos_arc_wall_tubes, np_pos_z_wall_tubes, np_wall_col, 5, cm_cat_module_col,
-                 'arc along the wall', 'z', "wall module column", os.path.join(write_dir,"pos_arc_z_disp_wall_tubes_color_col.pdf"),
-                 norm_cat_module_col, range(40))
+                 'arc along the wall', 'z', "wall module column",
+                 os.path.join(write_dir,"pos_arc_z_disp_wall_tubes_color_col."+fmt), norm_cat_module_col, range(40))
 
     scatter_plot(106, np_pos_x_top_tubes, np_pos_y_top_tubes, np_pmt_in_module_id_top_tubes, 5, cm_cat_pmt_in_module,
-                 'x', 'y', "pmt in module", os.path.join(write_dir,"pos_x_y_disp_top_tubes.pdf"), norm_cat_pmt_in_module, range(20))
-
-    scatter_plot(107, np_pos_x_bottom_tubes, np_pos_y_bottom_tubes, np_pmt_in_module_id_bottom_tubes, 5,
-                 cm_cat_pmt_in_module, 'x', 'y', "pmt in module", os.path.join(write_dir,"pos_x_y_disp_bottom_tubes.pdf"),
+                 'x', 'y', "pmt in module", os.path.join(write_dir,"pos_x_y_disp_top_tubes."+fmt),
                  norm_cat_pmt_in_module, range(20))
 
-    wcsim.get_event(ev)
+    scatter_plot(107, np_pos_x_bottom_tubes, np_pos_y_bottom_tubes, np_pmt_in_module_id_bottom_tubes, 5,
+                 cm_cat_pmt_in_module, 'x', 'y', "pmt in module",
+                 os.path.join(write_dir,"pos_x_y_disp_bottom_tubes."+fmt), norm_cat_pmt_in_module, range(20))
+
+def read_event(wcsim, ev):
+    """
+    Returns the digitized hits of the first trigger of an event, with their PMT positions and orientations, extracted by
+    the compiled code of WCSim.extract_range
+    """
+    data = wcsim.extract_range(ev, ev + 1, ("triggers", "digi_hits"))
     print("number of triggers: " + str(wcsim.ntrigger))
     trigger = wcsim.get_first_trigger()
     print("event date and number: " + str(trigger.GetHeader().GetDate()) + " " + str(trigger.GetHeader().GetEvtNum()))
-    ncherenkovdigihits = trigger.GetNcherenkovdigihits()
-    print("Ncherenkovdigihits " + str(ncherenkovdigihits))
-    if ncherenkovdigihits == 0:
-        print("event, trigger has no hits " + str(ev) + " " + str(wcsim.current_trigger))
-
-    np_pos_x = np.zeros(ncherenkovdigihits)
-    np_pos_y = np.zeros(ncherenkovdigihits)
-    np_pos_z = np.zeros(ncherenkovdigihits)
-
-    np_dir_u = np.zeros(ncherenkovdigihits)
-    np_dir_v = np.zeros(ncherenkovdigihits)
-    np_dir_w = np.zeros(ncherenkovdigihits)
-
-    np_q = np.zeros(ncherenkovdigihits)
-    np_t = np.zeros(ncherenkovdigihits)
-
-    np_pmt_index = np.zeros(ncherenkovdigihits, dtype=np.int32)
-
-    for i in range(ncherenkovdigihits):
-        wcsimrootcherenkovdigihit = trigger.GetCherenkovDigiHits().At(i)
-
-        hit_q = wcsimrootcherenkovdigihit.GetQ()
-        hit_t = wcsimrootcherenkovdigihit.GetT()
-        hit_tube_id = wcsimrootcherenkovdigihit.GetTubeId() - 1
-
-        np_pmt_index[i] = hit_tube_id
-
-        # if i<10:
-        #    print("q t id: "+str(hit_q)+" "+str(hit_t)+" "+str(hit_tube_id)+" ")
-
-        pmt = wcsim.geo.GetPMT(hit_tube_id)
-
-        # if i<10:
-        #    print("pmt tube no: "+str(pmt.GetTubeNo()) #+" " +pmt.GetPMTName())
-        #    print("pmt cyl loc: "+str(pmt.GetCylLoc()))
+    in_trigger = data["digi_hit_trigger"] == wcsim.current_trigger
+    print("Ncherenkovdigihits " + str(np.count_nonzero(in_trigger)))
+    np_pmt_index = data["digi_hit_pmt"][in_trigger]
+    return {
+        "trigger": wcsim.current_trigger,
+        "pmt": np_pmt_index,
+        "charge": data["digi_hit_charge"][in_trigger],
+        "time": data["digi_hit_time"][in_trigger],
+        "position": wcsim.pmt_positions[np_pmt_index],
+        "orientation": wcsim.pmt_orientations[np_pmt_index]
+    }
+
+
+def event_display(ev, hits, r_max, write_dir, fmt="pdf"):
+    norm = plt.Normalize()
 
-        # np_cylloc[i]=pmt.GetCylLoc()
+    cm = matplotlib.cm.plasma
 
-        np_pos_x[i] = pmt.GetPosition(2)
-        np_pos_y[i] = pmt.GetPosition(0)
-        np_pos_z[i] = pmt.GetPosition(1)
+    trig = hits["trigger"]
+    np_pmt_index = hits["pmt"]
+    np_q = hits["charge"]
+    np_t = hits["time"]
 
-        np_dir_u[i] = pmt.GetOrientation(2)
-        np_dir_v[i] = pmt.GetOrientation(0)
-        np_dir_w[i] = pmt.GetOrientation(1)
+    np_pos_x = hits["position"][:, 2]
+    np_pos_y = hits["position"][:, 0]
+    np_pos_z = hits["position"][:, 1]
 
-        np_q[i] = hit_q
-        np_t[i] = hit_t
+    np_dir_u = hits["orientation"][:, 2]
+    np_dir_v = hits["orientation"][:, 0]
+    np_dir_w = hits["orientation"][:, 1]
 
     np_module_index = module_index(np_pmt_index)
     np_pmt_in_module_id = pmt_in_module_id(np_pmt_index)
@@ -230,7 +236,7 @@ def event_display(ev, input_file, write_dir):
     ax1.set_zlabel('z')
     cb_ev_disp = fig1.colorbar(ev_disp, pad=0.03)
     cb_ev_disp.set_label("charge")
-    fig1.savefig(os.path.join(write_dir,"ev_disp_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+    fig1.savefig(os.path.join(write_dir,"ev_disp_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     fig2 = plt.figure(num=2, clear=True)
     fig2.set_size_inches(10, 8)
@@ -244,18 +250,18 @@ def event_display(ev, input_file, write_dir):
     ax2.set_zlabel('z')
     sm = matplotlib.cm.ScalarMappable(cmap=cm, norm=norm)
     sm.set_array([])
-    cb_ev_disp_2 = fig2.colorbar(sm, pad=0.03)
+    cb_ev_disp_2 = fig2.colorbar(sm, ax=ax2, pad=0.03)
     cb_ev_disp_2.set_label("time")
-    fig2.savefig(os.path.join(write_dir,"ev_disp_quiver_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+    fig2.savefig(os.path.join(write_dir,"ev_disp_quiver_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     scatter_plot(3, np_pos_arc_wall, np_pos_z_wall, np_q_wall, 2, cm, 'arc along the wall', 'z', "charge",
-                 os.path.join(write_dir,"ev_disp_wall_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+                 os.path.join(write_dir,"ev_disp_wall_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     scatter_plot(4, np_pos_x_top, np_pos_y_top, np_q_top, 2, cm, 'x', 'y', "charge",
-                 os.path.join(write_dir,"ev_disp_top_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+                 os.path.join(write_dir,"ev_disp_top_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     scatter_plot(5, np_pos_x_bottom, np_pos_y_bottom, np_q_bottom, 2, cm, 'x', 'y', "charge",
-                 os.path.join(write_dir,"ev_disp_bottom_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+                 os.path.join(write_dir,"ev_disp_bottom_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     fig6 = plt.figure(num=6, clear=True)
     fig6.set_size_inches(10, 4)
@@ -265,7 +271,7 @@ def event_display(ev, input_file, write_dir):
     ax6.set_ylabel('z index')
     cb_q_sum_disp = fig6.colorbar(q_sum_disp, pad=0.1)
     cb_q_sum_disp.set_label("total charge in module")
-    fig6.savefig(os.path.join(write_dir,"q_sum_disp_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+    fig6.savefig(os.path.join(write_dir,"q_sum_disp_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     fig7 = plt.figure(num=7, clear=True)
     fig7.set_size_inches(10, 4)
@@ -275,7 +281,7 @@ def event_display(ev, input_file, write_dir):
     ax7.set_ylabel('z index')
     cb_q_max_disp = fig7.colorbar(q_max_disp, pad=0.1)
     cb_q_max_disp.set_label("maximum charge in module")
-    fig7.savefig(os.path.join(write_dir,"q_max_disp_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+    fig7.savefig(os.path.join(write_dir,"q_max_disp_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     fig8 = plt.figure(num=8, clear=True)
     fig8.set_size_inches(10, 8)
@@ -283,7 +289,7 @@ def event_display(ev, input_file, write_dir):
     plt.hist(np_q, 50, density=True, facecolor='blue', alpha=0.75)
     ax8.set_xlabel('charge')
     ax8.set_ylabel("PMT's above threshold")
-    fig8.savefig(os.path.join(write_dir,"q_pmt_disp_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+    fig8.savefig(os.path.join(write_dir,"q_pmt_disp_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     fig9 = plt.figure(num=9, clear=True)
     fig9.set_size_inches(10, 8)
@@ -291,7 +297,7 @@ def event_display(ev, input_file, write_dir):
     plt.hist(np_t, 50, density=True, facecolor='blue', alpha=0.75)
     ax9.set_xlabel('time')
     ax9.set_ylabel("PMT's above threshold")
-    fig9.savefig(os.path.join(write_dir,"t_pmt_disp_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+    fig9.savefig(os.path.join(write_dir,"t_pmt_disp_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     fig10 = plt.figure(num=10, clear=True)
     fig10.set_size_inches(15, 5)
@@ -307,7 +313,7 @@ def event_display(ev, input_file, write_dir):
         grid_q[i].imshow(np.flip(np_wall_data_rect[:, :, i], axis=0), cmap=cm)
         q_disp = grid_q[19].imshow(np.flip(np_wall_q_max_module, axis=0), cmap=cm)
         grid_q.cbar_axes[0].colorbar(q_disp)
-    fig10.savefig(os.path.join(write_dir,"q_disp_grid_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+    fig10.savefig(os.path.join(write_dir,"q_disp_grid_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
 
     fig11 = plt.figure(num=11, clear=True)
     fig11.set_size_inches(15, 5)
@@ -321,7 +327,55 @@ def event_display(ev, input_file, write_dir):
                        )
     for i in range(19):
         grid_t[i].imshow(np.flip(np_wall_data_rect[:, :, i + 19], axis=0), cmap=cm)
-    fig11.savefig(os.path.join(write_dir,"t_disp_grid_ev_{}_trig_{}.pdf".format(ev, wcsim.current_trigger)))
+    fig11.savefig(os.path.join(write_dir,"t_disp_grid_ev_{}_trig_{}.{}".format(ev, trig, fmt)))
+
+
+def render_task(task):
+    ev, hits, r_max, write_dir, fmt = task
+    event_display(ev, hits, r_max, write_dir, fmt)
+    return ev
+
+
+def display_events(requests, output_dir, workers=1, fmt="pdf"):
+    """
+    Displays the events of a list of (name, ROOT file, events) requests, reading each file's geometry once and rendering
+    the events in a pool of worker processes
+    """
+    # Start the workers before opening any ROOT file, so that they do not inherit it
+    pool = Pool(workers) if workers > 1 else None
+    wcsim_file = None
+    for name, input_file, events in requests:
+        labels = ["gamma", "e-", "mu-", "pi0"]
+        write_dir = os.path.join(output_dir, labels[get_label(input_file)] + '_' + str(name))
+        if not os.path.isdir(write_dir):
+            os.mkdir(write_dir)
+
+        if input_file != wcsim_file:
+            wcsim = WCSimFile(input_file)
+            wcsim_file = input_file
+            geometry = wcsim.geometry
+        if geometry_plots_up_to_date(input_file, write_dir, fmt):
+            print("geometry plots in " + write_dir + " are up to date")
+        else:
+            geometry_display(geometry, write_dir, fmt)
+
+        tasks = []
+        for ev in events:
+            print("now processing " + input_file + " at index " + str(ev))
+            hits = read_event(wcsim, ev)
+            if hits["pmt"].size == 0:
+                print("event, trigger has no hits " + str(ev) + " " + str(hits["trigger"]) + ", skipping")
+                continue
+            tasks.append((ev, hits, float(geometry["display_r_max"]), write_dir, fmt))
+        if pool is None:
+            for task in tasks:
+                render_task(task)
+        else:
+            for ev in pool.imap_unordered(render_task, tasks):
+                print("rendered event " + str(ev) + " of " + input_file)
+    if pool is not None:
+        pool.close()
+        pool.join()
 
 
 if __name__ == '__main__':
@@ -332,23 +386,16 @@ if __name__ == '__main__':
         os.mkdir(config.output_dir)
     if not os.path.isdir(config.output_dir):
         raise argparse.ArgumentTypeError("Cannot access or create output directory" + config.output_dir)
+    matplotlib.rcParams['savefig.dpi'] = config.dpi
 
     print("Reading request from: " + str(config.input_file))
 
-    wl = open(config.input_file, 'r')
-    for line in wl:
-        splits = line.split()
-        name = splits[0].strip()
-        input_file = splits[1].strip()
-        ev = int(splits[2].strip())
-
-        print("now processing " + input_file + " at index " + str(ev))
-
-        labels = ["gamma", "e-", "mu-", "pi0"]
-        write_dir = os.path.join(config.output_dir, labels[get_label(input_file)] + '_' + str(name))
-        if not os.path.isdir(write_dir):
-            os.mkdir(write_dir)
-
-        event_display(ev, input_file, write_dir)
+    requests = []
+    with open(config.input_file, 'r') as wl:
+        for line in wl:
+            splits = line.split()
+            if not splits:
+                continue
+            requests.append((splits[0].strip(), splits[1].strip(), parse_events(splits[2].strip())))
 
-    wl.close()
\ No newline at end of file
+    display_events(requests, config.output_dir, config.workers, config.format)
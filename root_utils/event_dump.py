@@ -1,133 +1,392 @@
 """
 Python 3 script for processing a list of ROOT files into .npz files
 
-To keep references to the original ROOT files, the file path is stored in the output.
+To keep references to the original ROOT files, the file paths are stored in the output in root_files, and the index of
+each event's file in that table is stored in root_file_index.
 An index is saved for every event in the output npz file corresponding to the event index within that ROOT file (ev).
 
+Hits, photons, tracks and triggers are stored as one flat array per field, with the entries of event i of a field in
+the family "x" at indices x_offsets[i] to x_offsets[i+1]-1 (see ragged_utils). Along with the triggers, first_trigger
+stores the index within each event of its earliest trigger, or -1 if it has none.
+With --fields, only the requested families are stored, and only the data they need is extracted from the ROOT files,
+e.g. "--fields truth digi_hits" for the inputs of np_to_grid_hdf5.py.
+The arrays are compressed with zlib by default, giving files that np.load can read. Other codecs and filters can be
+chosen for all arrays or for each array with --compression (see compression.py), e.g.
+"--compression zstd:3 digi_hit_pmt=zstd:3+delta", whose output must be read with compression.load_npz.
+With --selection, only the events passing a selection expression over their truth info and trigger hit counts are
+stored, e.g. "--selection 'first_ndigihits > 20 and r < 300'" (see selection.py). The selection is evaluated on the
+triggers and tracks of each batch of events before the hits of the events passing it are extracted, so rejected events
+cost little more than reading their headers and tracks, and the number of events passing each cut is stored in
+cut_names and cut_counts, with event_id the index of each stored event within its ROOT file.
+
 Authors: Nick Prouse
 """
 
 import argparse
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
 from root_utils.root_file_utils import *
 from root_utils.pos_utils import *
-
-ROOT.gROOT.SetBatch(True)
+from root_utils.truth_utils import range_event_info
+from root_utils.ragged_utils import concatenate_offsets, offsets_from_counts, segment_argmin
+from root_utils.npz_writer import NpzStreamWriter
+from root_utils.compression import Compression, save_npz
+from root_utils.selection import EventSelection, CUT_NAMES, CUT_COUNTS
+from root_utils.manifest import Manifest, file_stat
+from root_utils.profiling import Profiler, NULL_PROFILER
+
+# Fields with a variable number of entries per event, stored as one flat array each, grouped by the name of the
+# offsets array giving where each event's entries start
+RAGGED_FIELDS = {
+    "digi_hit_offsets": ["digi_hit_pmt", "digi_hit_charge", "digi_hit_time", "digi_hit_trigger"],
+    "true_hit_offsets": ["true_hit_pmt", "true_hit_time", "true_hit_pos", "true_hit_start_time", "true_hit_start_pos",
+                         "true_hit_parent"],
+    "track_offsets": ["track_id", "track_pid", "track_start_time", "track_energy", "track_start_position",
+                      "track_stop_position", "track_parent", "track_flag"],
+    "trigger_offsets": ["trigger_time", "trigger_ndigihits"]
+}
+# Families of output fields that can be selected with --fields, with the families of WCSim.extract_range each needs.
+# The truth info of each event (pid, position, direction and energy) is found from its tracks.
+DUMP_FIELDS = {
+    "truth": ("tracks",),
+    "triggers": ("triggers",),
+    "digi_hits": ("digi_hits",),
+    "true_hits": ("true_hits",),
+    "tracks": ("tracks",)
+}
+# Output family of each offsets array of RAGGED_FIELDS
+RAGGED_FAMILIES = {
+    "digi_hit_offsets": "digi_hits",
+    "true_hit_offsets": "true_hits",
+    "track_offsets": "tracks",
+    "trigger_offsets": "triggers"
+}
+
+
+def extract_fields(fields):
+    """Returns the families of fields that WCSim.extract_range needs to extract for the given output fields"""
+    return check_fields({f for field in fields for f in DUMP_FIELDS[field]})
 
 
 def get_args():
     parser = argparse.ArgumentParser(description='dump WCSim data into numpy .npz file')
     parser.add_argument('input_files', type=str, nargs='+')
     parser.add_argument('-d', '--output_dir', type=str, default=None)
+    parser.add_argument('-u', '--uproot', action='store_true',
+                        help='read files with uproot instead of PyROOT, for use without libWCSimRoot')
+    parser.add_argument('-b', '--batch_size', type=int, default=1000,
+                        help='number of events to extract from the ROOT file in each batch')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of worker processes converting files and event ranges in parallel')
+    parser.add_argument('-s', '--shard_size', type=int, default=10000,
+                        help='maximum number of events of one file converted by each parallel task')
+    parser.add_argument('-c', '--chunk_events', type=int, default=None,
+                        help='write output in chunks of this many events instead of holding whole files in memory')
+    parser.add_argument('-m', '--manifest', type=str, default=None,
+                        help='manifest file recording converted files, which are skipped if unchanged when rerun')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='continue files left incomplete by an interrupted run from their last checkpointed chunk '
+                             '(requires --chunk_events)')
+    parser.add_argument('-p', '--profile', type=str, default=None,
+                        help='record the time spent in each stage of the conversion and write it to this JSON file')
+    parser.add_argument('--report_interval', type=float, default=30.,
+                        help='seconds between events/s progress lines when profiling')
+    parser.add_argument('-f', '--fields', type=str, nargs='+', choices=list(DUMP_FIELDS), default=list(DUMP_FIELDS),
+                        help='families of fields to store in the output, only the data they need is extracted '
+                             '(default: all)')
+    parser.add_argument('--compression', type=str, nargs='+', default=['zlib'],
+                        help='codec of the output arrays as name[:level][+filter...], with none, zlib, lz4, zstd or '
+                             'blosc and filters shuffle and delta, optionally followed by array=codec for single '
+                             'arrays')
+    parser.add_argument('--compression_threads', type=int, default=1,
+                        help='number of threads compressing each array')
+    parser.add_argument('--selection', type=str, default=None,
+                        help='only store events passing this expression over ntriggers, ndigihits, first_ndigihits, '
+                             'pid, energy, x, y, z, r and dir_x/y/z, e.g. "first_ndigihits > 20 and r < 300"')
     args = parser.parse_args()
+    if args.resume and args.chunk_events is None:
+        parser.error("--resume requires --chunk_events, since only outputs written in chunks are checkpointed")
     return args
 
 
-def dump_file(infile, outfile):
-
-    wcsim = WCSimFile(infile)
-    nevents = wcsim.nevent
-
-    # All data arrays are initialized here
-
-    event_id = np.empty(nevents, dtype=np.int32)
-    root_file = np.empty(nevents, dtype=object)
-
-    pid = np.empty(nevents, dtype=np.int32)
-    position = np.empty((nevents, 3), dtype=np.float64)
-    direction = np.empty((nevents, 3), dtype=np.float64)
-    energy = np.empty(nevents,dtype=np.float64)
-
-    digi_hit_pmt = np.empty(nevents, dtype=object)
-    digi_hit_charge = np.empty(nevents, dtype=object)
-    digi_hit_time = np.empty(nevents, dtype=object)
-    digi_hit_trigger = np.empty(nevents, dtype=object)
-
-    true_hit_pmt = np.empty(nevents, dtype=object)
-    true_hit_time = np.empty(nevents, dtype=object)
-    true_hit_pos = np.empty(nevents, dtype=object)
-    true_hit_start_time = np.empty(nevents, dtype=object)
-    true_hit_start_pos = np.empty(nevents, dtype=object)
-    true_hit_parent = np.empty(nevents, dtype=object)
-
-    track_id = np.empty(nevents, dtype=object)
-    track_pid = np.empty(nevents, dtype=object)
-    track_start_time = np.empty(nevents, dtype=object)
-    track_energy = np.empty(nevents, dtype=object)
-    track_start_position = np.empty(nevents, dtype=object)
-    track_stop_position = np.empty(nevents, dtype=object)
-    track_parent = np.empty(nevents, dtype=object)
-    track_flag = np.empty(nevents, dtype=object)
-
-    trigger_time = np.empty(nevents, dtype=object)
-
-    for ev in range(wcsim.nevent):
-        wcsim.get_event(ev)
-
-        event_info = wcsim.get_event_info()
-        pid[ev] = event_info["pid"]
-        position[ev] = event_info["position"]
-        direction[ev] = event_info["direction"]
-        energy[ev] = event_info["energy"]
-
-        true_hits = wcsim.get_hit_photons()
-        true_hit_pmt[ev] = true_hits["pmt"]
-        true_hit_time[ev] = true_hits["end_time"]
-        true_hit_pos[ev] = true_hits["end_position"]
-        true_hit_start_time[ev] = true_hits["start_time"]
-        true_hit_start_pos[ev] = true_hits["start_position"]
-        true_hit_parent[ev] = true_hits["track"]
-
-        digi_hits = wcsim.get_digitized_hits()
-        digi_hit_pmt[ev] = digi_hits["pmt"]
-        digi_hit_charge[ev] = digi_hits["charge"]
-        digi_hit_time[ev] = digi_hits["time"]
-        digi_hit_trigger[ev] = digi_hits["trigger"]
-
-        tracks = wcsim.get_tracks()
-        track_id[ev] = tracks["id"]
-        track_pid[ev] = tracks["pid"]
-        track_start_time[ev] = tracks["start_time"]
-        track_energy[ev] = tracks["energy"]
-        track_start_position[ev] = tracks["start_position"]
-        track_stop_position[ev] = tracks["stop_position"]
-        track_parent[ev] = tracks["parent"]
-        track_flag[ev] = tracks["flag"]
-
-        trigger_time[ev] = wcsim.get_trigger_times()
-
-        event_id[ev] = ev
-        root_file[ev] = infile
-
-    np.savez_compressed(outfile,
-                        event_id=event_id,
-                        root_file=root_file,
-                        pid=pid,
-                        position=position,
-                        direction=direction,
-                        energy=energy,
-                        digi_hit_pmt=digi_hit_pmt,
-                        digi_hit_charge=digi_hit_charge,
-                        digi_hit_time=digi_hit_time,
-                        digi_hit_trigger=digi_hit_trigger,
-                        true_hit_pmt=true_hit_pmt,
-                        true_hit_time=true_hit_time,
-                        true_hit_pos=true_hit_pos,
-                        true_hit_start_time=true_hit_start_time,
-                        true_hit_start_pos=true_hit_start_pos,
-                        true_hit_parent=true_hit_parent,
-                        track_id=track_id,
-                        track_pid=track_pid,
-                        track_start_time=track_start_time,
-                        track_energy=track_energy,
-                        track_start_position=track_start_position,
-                        track_stop_position=track_stop_position,
-                        track_parent=track_parent,
-                        track_flag=track_flag,
-                        trigger_time=trigger_time
-                        )
+def open_file(infile, use_uproot=False, fields=tuple(DUMP_FIELDS), selection=None):
+    """Opens a file, reading only the data needed for the given output fields and selection"""
+    read_fields = extract_fields(fields)
+    if selection is not None:
+        read_fields = check_fields(read_fields + selection.fields)
+    if use_uproot:
+        from root_utils.uproot_file_utils import WCSimUprootFile
+        return WCSimUprootFile(infile, fields=read_fields)
+    return WCSimFile(infile, read_fields)
+
+
+def count_events(infile, use_uproot=False):
+    """Returns the number of events in a file, reading only the tree header"""
+    if use_uproot:
+        import uproot
+        return uproot.open(infile)["wcsimT"].num_entries
+    return count_entries(infile)
+
+
+def dump_file(infile, outfile, use_uproot=False, batch_size=1000, chunk_events=None, resume=False,
+              profiler=NULL_PROFILER, fields=tuple(DUMP_FIELDS), compression=None, selection=None):
+    with profiler.stage("open_file"):
+        wcsim = open_file(infile, use_uproot, fields, selection)
+    wcsim.profiler = profiler
+    if chunk_events is None:
+        data = dump_events(wcsim, infile, 0, wcsim.nevent, batch_size, fields, selection)
+        with profiler.stage("save_npz", wcsim.nevent):
+            save_file(outfile, data, compression)
+    else:
+        writer = EventWriter(outfile, infile, resume, compression)
+        if writer.next_event > 0:
+            print("Resuming from event " + str(writer.next_event))
+        starts = range(writer.next_event, wcsim.nevent, chunk_events)
+        if wcsim.nevent == 0:
+            # A file without events is written as one empty chunk, to give an empty output
+            starts = [0]
+        for start in starts:
+            stop = min(start + chunk_events, wcsim.nevent)
+            data = dump_events(wcsim, infile, start, stop, batch_size, fields, selection)
+            with profiler.stage("write_chunk", stop - start):
+                writer.append(data, stop)
+        with profiler.stage("save_npz", wcsim.nevent):
+            writer.close()
     del wcsim
 
 
+def dump_events(wcsim, infile, start, stop, batch_size=1000, fields=tuple(DUMP_FIELDS), selection=None):
+    """
+    Returns a dictionary of the output arrays of the requested fields for events start to stop-1 of an open file, or
+    for those of them passing an EventSelection, with its cut flow
+    """
+    profiler = wcsim.profiler
+    parts = []
+    for batch_start in range(start, stop, batch_size) or [start]:
+        batch_stop = min(batch_start + batch_size, stop)
+        if selection is None:
+            data = wcsim.extract_range(batch_start, batch_stop, extract_fields(fields))
+            events = np.arange(batch_start, batch_stop)
+        else:
+            data, events, cut_counts = select_events(wcsim, batch_start, batch_stop, fields, selection)
+        part = {
+            "event_id": events.astype(np.int32),
+            "root_files": np.array([infile]),
+            "root_file_index": np.zeros(len(events), dtype=np.int32)
+        }
+        if selection is not None:
+            part.update(selection.cut_flow(cut_counts))
+        if "truth" in fields:
+            with profiler.stage("range_event_info", len(events)):
+                part.update(range_event_info(data))
+        if "triggers" in fields:
+            part["first_trigger"] = segment_argmin(data["trigger_time"], data["trigger_offsets"]).astype(np.int32)
+        for offsets, ragged_fields in RAGGED_FIELDS.items():
+            if RAGGED_FAMILIES[offsets] not in fields:
+                continue
+            part[offsets] = data[offsets]
+            for field in ragged_fields:
+                part[field] = data[field]
+        parts.append(part)
+        profiler.progress(batch_stop - batch_start)
+    with profiler.stage("merge_events", stop - start):
+        return merge_events(parts)
+
+
+def select_events(wcsim, start, stop, fields, selection):
+    """
+    Returns the arrays of the requested fields of the events start to stop-1 of an open file passing a selection, the
+    indices of those events and the cut flow counts. Only the fields needed by the selection are extracted for all events,
+    the others only for the events passing it.
+    """
+    profiler = wcsim.profiler
+    summary = wcsim.extract_range(start, stop, selection.fields)
+    with profiler.stage("select_events", stop - start):
+        selected, cut_counts = selection.select_range(summary)
+    needed = extract_fields(fields)
+    data = take_events({name: summary[name] for field in needed if field in selection.fields
+                        for name in EXTRACT_ARRAYS[field]}, selected)
+    remaining = [field for field in needed if field not in selection.fields]
+    if remaining:
+        data.update(wcsim.extract_entries(start + selected, remaining))
+    return data, start + selected, cut_counts
+
+
+def save_file(outfile, data, compression=None):
+    save_npz(outfile, data, compression)
+
+
+class EventWriter:
+    """
+    Streams consecutive event ranges of one file to an output .npz file, chunk by chunk
+
+    A checkpoint is saved after each chunk. If resume is True and an interrupted run on the same unchanged input left a
+    checkpoint, writing continues from it and next_event is the first event still to be converted. The arrays are
+    compressed as given by compression when the writer is closed.
+    """
+    def __init__(self, outfile, infile, resume=False, compression=None):
+        self.writer = NpzStreamWriter(outfile, compression, resume)
+        self.input = file_stat(infile)
+        state = self.writer.state
+        if state is not None and state["input"] != self.input:
+            print("Input " + infile + " changed since the last checkpoint, restarting")
+            self.writer = NpzStreamWriter(outfile, compression)
+            state = None
+        if state is None:
+            self.next_event = 0
+            self.root_files = None
+            self.first_chunk = True
+            # Running total of entries of each ragged family, to shift each chunk's offsets by
+            self.totals = {k: 0 for k in RAGGED_FIELDS}
+            self.cut_names = None
+            self.cut_counts = None
+        else:
+            self.next_event = state["next_event"]
+            self.root_files = np.array(state["root_files"])
+            self.first_chunk = False
+            self.totals = state["totals"]
+            self.cut_names = state.get("cut_names")
+            self.cut_counts = state.get("cut_counts")
+
+    @staticmethod
+    def resume_event(outfile, infile):
+        """Returns the event that an EventWriter resuming the output of infile would continue from"""
+        checkpoint = NpzStreamWriter.read_checkpoint(outfile)
+        if checkpoint is None or checkpoint["state"]["input"] != file_stat(infile):
+            return 0
+        return checkpoint["state"]["next_event"]
+
+    def append(self, data, next_event):
+        """Appends the data of a range of events, ending just before next_event, and saves a checkpoint"""
+        chunk = {}
+        for key, array in data.items():
+            if key == "root_files":
+                self.root_files = array
+            elif key == CUT_NAMES:
+                self.cut_names = array.tolist()
+            elif key == CUT_COUNTS:
+                # The cut flow is of the whole file, so it is summed over chunks and written when closing
+                self.cut_counts = array.tolist() if self.cut_counts is None else (array + self.cut_counts).tolist()
+            elif key in RAGGED_FIELDS:
+                # The first chunk writes the initial zero offset, later ones continue from the running total
+                chunk[key] = array if self.first_chunk else array[1:] + self.totals[key]
+                self.totals[key] += int(array[-1])
+            else:
+                chunk[key] = array
+        self.writer.append(**chunk)
+        self.first_chunk = False
+        self.next_event = next_event
+        self.writer.checkpoint({"input": self.input, "next_event": next_event, "totals": self.totals,
+                                "root_files": self.root_files.tolist(), "cut_names": self.cut_names,
+                                "cut_counts": self.cut_counts})
+
+    def close(self):
+        self.writer.append(root_files=self.root_files)
+        if self.cut_names is not None:
+            self.writer.append(**{CUT_NAMES: np.array(self.cut_names), CUT_COUNTS: np.array(self.cut_counts)})
+        self.writer.close()
+
+
+def merge_events(parts):
+    """Merges the output arrays of consecutive event ranges, in order"""
+    merged = {}
+    for key in parts[0]:
+        if key in RAGGED_FIELDS:
+            merged[key] = concatenate_offsets([p[key] for p in parts])
+        elif key == CUT_NAMES:
+            merged[key] = parts[0][key]
+        elif key == CUT_COUNTS:
+            merged[key] = np.sum([p[key] for p in parts], axis=0)
+        elif key not in ("root_files", "root_file_index"):
+            merged[key] = np.concatenate([p[key] for p in parts])
+    # Keep one entry per distinct file in the file table and remap each event's index into it
+    root_files, file_index = np.unique(np.concatenate([p["root_files"] for p in parts]), return_inverse=True)
+    file_offsets = offsets_from_counts([len(p["root_files"]) for p in parts])
+    merged["root_files"] = root_files
+    merged["root_file_index"] = np.concatenate([file_index[o + p["root_file_index"]]
+                                                for o, p in zip(file_offsets, parts)]).astype(np.int32)
+    return merged
+
+
+# Each worker process keeps its most recently used file open, since consecutive tasks are usually from the same file
+worker_file = {}
+
+
+def dump_task(task):
+    infile, start, stop, use_uproot, batch_size, fields, selection = task
+    if worker_file.get("name") != infile:
+        worker_file.clear()
+        worker_file["wcsim"] = open_file(infile, use_uproot, fields, selection)
+        worker_file["name"] = infile
+    return dump_events(worker_file["wcsim"], infile, start, stop, batch_size, fields, selection)
+
+
+def imap_bounded(pool, function, tasks, max_pending):
+    """
+    Yields function(task) for each task in order, like pool.imap, but with at most max_pending tasks submitted to the
+    pool and not yet yielded, so that finished results do not pile up while the caller is still writing earlier ones
+    """
+    tasks = iter(tasks)
+    pending = deque(pool.apply_async(function, (task,)) for task in islice(tasks, max_pending))
+    while pending:
+        result = pending.popleft()
+        pending.extend(pool.apply_async(function, (task,)) for task in islice(tasks, 1))
+        yield result.get()
+
+
+def dump_files_parallel(files, workers, use_uproot=False, batch_size=1000, shard_size=10000, chunk_events=None,
+                        resume=False, manifest=None, profiler=NULL_PROFILER, fields=tuple(DUMP_FIELDS),
+                        compression=None, selection=None):
+    """
+    Converts a list of (input, output) file pairs using a pool of worker processes
+
+    Each file is split into tasks of at most shard_size consecutive events, and files without events into one empty
+    task, so that they get an empty output as in a serial run. Results are collected in task order, giving the same
+    output as a serial run, with at most two tasks per worker submitted ahead of the results being written. Each file's
+    parts are merged and saved as soon as they are all complete or, if chunk_events is set, tasks are chunk_events long
+    and each is streamed to the output as soon as it is complete, bounding the memory used, and with resume, files are
+    continued from their last checkpointed chunk. Finished files are recorded in manifest.
+    Only the main process is profiled, so the workers' extraction shows up as time waiting for their results.
+    """
+    if chunk_events is not None:
+        shard_size = chunk_events
+    tasks = []
+    task_files = []
+    for infile, outfile in files:
+        nevents = count_events(infile, use_uproot)
+        first_event = EventWriter.resume_event(outfile, infile) if chunk_events is not None and resume else 0
+        shards = [(infile, s, min(s + shard_size, nevents), use_uproot, batch_size, fields, selection)
+                  for s in range(first_event, nevents, shard_size)]
+        if nevents == 0:
+            shards = [(infile, 0, 0, use_uproot, batch_size, fields, selection)]
+        tasks.extend(shards)
+        task_files.append((infile, outfile, first_event, shards))
+    with Pool(workers) as pool:
+        results = imap_bounded(pool, dump_task, tasks, 2*workers)
+        for file_index, (infile, outfile, first_event, shards) in enumerate(task_files):
+            if chunk_events is None:
+                parts = []
+                for shard in shards:
+                    with profiler.stage("wait_workers", shard[2] - shard[1]):
+                        parts.append(next(results))
+                    profiler.progress(shard[2] - shard[1])
+                with profiler.stage("save_npz"):
+                    save_file(outfile, merge_events(parts), compression)
+            else:
+                writer = EventWriter(outfile, infile, resume, compression)
+                for shard in shards:
+                    with profiler.stage("wait_workers", shard[2] - shard[1]):
+                        data = next(results)
+                    with profiler.stage("write_chunk", shard[2] - shard[1]):
+                        writer.append(data, shard[2])
+                    profiler.progress(shard[2] - shard[1])
+                with profiler.stage("save_npz"):
+                    writer.close()
+            if manifest is not None:
+                manifest.record([infile], outfile)
+            print("Finished converting file " + outfile + " (" + str(file_index+1) + "/" + str(len(task_files)) + ")")
+
 if __name__ == '__main__':
 
     config = get_args()
@@ -141,9 +400,7 @@ if __name__ == '__main__':
     else:
         print("output directory not provided... output files will be in same locations as input files")
 
-    file_count = len(config.input_files)
-    current_file = 0
-
+    files = []
     for input_file in config.input_files:
         if os.path.splitext(input_file)[1].lower() != '.root':
             print("File " + input_file + " is not a .root file, skipping")
@@ -154,13 +411,41 @@ if __name__ == '__main__':
             output_file = os.path.splitext(input_file)[0] + '.npz'
         else:
             output_file = os.path.join(config.output_dir, os.path.splitext(os.path.basename(input_file))[0] + '.npz')
+        files.append((input_file, output_file))
+
+    profiler = NULL_PROFILER if config.profile is None else Profiler(config.report_interval)
+    compression = Compression.parse(config.compression, config.compression_threads)
+    selection = None if config.selection is None else EventSelection(config.selection)
+    manifest = None
+    if config.manifest is not None:
+        manifest = Manifest(config.manifest)
+        unconverted = [(i, o) for i, o in files if not manifest.is_converted([i], o)]
+        print("Skipping " + str(len(files) - len(unconverted)) + " files already converted according to manifest "
+              + config.manifest)
+        files = unconverted
+
+    if config.workers > 1:
+        print("\nProcessing " + str(len(files)) + " files with " + str(config.workers) + " workers")
+        dump_files_parallel(files, config.workers, config.uproot, config.batch_size, config.shard_size,
+                            config.chunk_events, config.resume, manifest, profiler, config.fields, compression,
+                            selection)
+    else:
+        file_count = len(files)
+        current_file = 0
+
+        for input_file, output_file in files:
+            print("\nNow processing " + input_file)
+            print("Outputting to " + output_file)
 
-        print("\nNow processing " + input_file)
-        print("Outputting to " + output_file)
+            dump_file(input_file, output_file, config.uproot, config.batch_size, config.chunk_events, config.resume,
+                      profiler, config.fields, compression, selection)
+            if manifest is not None:
+                manifest.record([input_file], output_file)
 
-        dump_file(input_file, output_file)
+            current_file += 1
+            print("Finished converting file " + output_file + " (" + str(current_file) + "/" + str(file_count) + ")")
 
-        current_file += 1
-        print("Finished converting file " + output_file + " (" + str(current_file) + "/" + str(file_count) + ")")
+    if config.profile is not None:
+        profiler.dump(config.profile)
 
     print("\n=========== ALL FILES CONVERTED ===========\n")
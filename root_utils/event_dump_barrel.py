@@ -11,22 +11,39 @@ Authors: Wojtek Fedorko, Julian Ding, Nick Prouse
 import argparse
 from root_utils.root_file_utils import *
 from root_utils.pos_utils import *
-
-ROOT.gROOT.SetBatch(True)
+from root_utils.barrel_grid import to_sparse
+import root_utils.ragged_utils as ru
+from root_utils.profiling import Profiler, NULL_PROFILER
+from root_utils.compression import Compression, save_npz
 
 
 def get_args():
     parser = argparse.ArgumentParser(description='dump WCSim data into numpy .npz file')
     parser.add_argument('input_files', type=str, nargs='+')
     parser.add_argument('-d', '--output_dir', type=str, default=None)
+    parser.add_argument('-s', '--sparse', action='store_true',
+                        help='store only the non-zero entries of event_data, as event_data_index, event_data_values '
+                             'and event_data_offsets arrays, instead of the dense images')
+    parser.add_argument('-p', '--profile', type=str, default=None,
+                        help='record the time spent in each stage of the conversion and write it to this JSON file')
+    parser.add_argument('--report_interval', type=float, default=30.,
+                        help='seconds between events/s progress lines when profiling')
+    parser.add_argument('--compression', type=str, nargs='+', default=['zlib'],
+                        help='codec of the output arrays as name[:level][+filter...], with none, zlib, lz4, zstd or '
+                             'blosc and filters shuffle and delta, optionally followed by array=codec for single '
+                             'arrays')
+    parser.add_argument('--compression_threads', type=int, default=1,
+                        help='number of threads compressing each array')
     args = parser.parse_args()
     return args
 
 
-def dump_file(infile, outfile):
+def dump_file(infile, outfile, sparse=False, profiler=NULL_PROFILER, compression=None):
     label = get_label(infile)
 
-    wcsim = WCSimFile(infile)
+    with profiler.stage("open_file"):
+        wcsim = WCSimFile(infile)
+    wcsim.profiler = profiler
 
     # All data arrays are initialized here
     ev_ids = []
@@ -64,35 +81,37 @@ def dump_file(infile, outfile):
 
         np_pmt_index = np.zeros(ncherenkovdigihits, dtype=np.int32)
 
-        for i in range(ncherenkovdigihits):
-            wcsimrootcherenkovdigihit = trigger.GetCherenkovDigiHits().At(i)
+        with profiler.stage("digi_hits", ncherenkovdigihits):
+            for i in range(ncherenkovdigihits):
+                wcsimrootcherenkovdigihit = trigger.GetCherenkovDigiHits().At(i)
 
-            hit_q = wcsimrootcherenkovdigihit.GetQ()
-            hit_t = wcsimrootcherenkovdigihit.GetT()
-            hit_tube_id = wcsimrootcherenkovdigihit.GetTubeId() - 1
+                hit_q = wcsimrootcherenkovdigihit.GetQ()
+                hit_t = wcsimrootcherenkovdigihit.GetT()
+                hit_tube_id = wcsimrootcherenkovdigihit.GetTubeId() - 1
 
-            np_pmt_index[i] = hit_tube_id
-            np_q[i] = hit_q
-            np_t[i] = hit_t
+                np_pmt_index[i] = hit_tube_id
+                np_q[i] = hit_q
+                np_t[i] = hit_t
 
-        np_module_index = module_index(np_pmt_index)
-        np_pmt_in_module_id = pmt_in_module_id(np_pmt_index)
+        with profiler.stage("grid"):
+            np_module_index = module_index(np_pmt_index)
+            np_pmt_in_module_id = pmt_in_module_id(np_pmt_index)
 
-        np_wall_indices = np.where(is_barrel(np_module_index))
+            np_wall_indices = np.where(is_barrel(np_module_index))
 
-        np_q_wall = np_q[np_wall_indices]
-        np_t_wall = np_t[np_wall_indices]
+            np_q_wall = np_q[np_wall_indices]
+            np_t_wall = np_t[np_wall_indices]
 
-        np_wall_row, np_wall_col = row_col(np_module_index[np_wall_indices])
-        np_pmt_in_module_id_wall = np_pmt_in_module_id[np_wall_indices]
+            np_wall_row, np_wall_col = row_col(np_module_index[np_wall_indices])
+            np_pmt_in_module_id_wall = np_pmt_in_module_id[np_wall_indices]
 
-        np_wall_data_rect = np.zeros((16, 40, 38))
-        np_wall_data_rect[np_wall_row,
-                          np_wall_col,
-                          np_pmt_in_module_id_wall] = np_q_wall
-        np_wall_data_rect[np_wall_row,
-                          np_wall_col,
-                          np_pmt_in_module_id_wall + 19] = np_t_wall
+            np_wall_data_rect = np.zeros((16, 40, 38))
+            np_wall_data_rect[np_wall_row,
+                              np_wall_col,
+                              np_pmt_in_module_id_wall] = np_q_wall
+            np_wall_data_rect[np_wall_row,
+                              np_wall_col,
+                              np_pmt_in_module_id_wall + 19] = np_t_wall
 
         np_wall_data_rect_ev = np.expand_dims(np_wall_data_rect, axis=0)
 
@@ -106,6 +125,7 @@ def dump_file(infile, outfile):
 
         ev_ids.append(ev)
         files.append(infile)
+        profiler.progress(1)
 
     # Readying all data arrays for saving
     all_events = np.concatenate(ev_data)
@@ -116,8 +136,16 @@ def dump_file(infile, outfile):
     all_energies = np.asarray(energies)
     all_ids = np.asarray(ev_ids)
     all_files = np.asarray(files, dtype=object)
-    np.savez_compressed(outfile, event_data=all_events, labels=all_labels, pids=all_pids, positions=all_positions,
-                        directions=all_directions, energies=all_energies, event_ids=all_ids, root_files=all_files)
+    if sparse:
+        index, values, counts = to_sparse(all_events)
+        event_data = {"event_data_index": index, "event_data_values": values,
+                      "event_data_offsets": ru.offsets_from_counts(counts)}
+    else:
+        event_data = {"event_data": all_events}
+    with profiler.stage("save_npz", len(all_ids)):
+        save_npz(outfile, dict(**event_data, labels=all_labels, pids=all_pids, positions=all_positions,
+                               directions=all_directions, energies=all_energies, event_ids=all_ids,
+                               root_files=all_files), compression)
     del wcsim
 
 
@@ -134,6 +162,8 @@ if __name__ == '__main__':
     else:
         print("output directory not provided... output files will be in same locations as input files")
 
+    profiler = NULL_PROFILER if config.profile is None else Profiler(config.report_interval)
+    compression = Compression.parse(config.compression, config.compression_threads)
     file_count = len(config.input_files)
     current_file = 0
 
@@ -151,9 +181,12 @@ if __name__ == '__main__':
         print("\nNow processing " + input_file)
         print("Outputting to " + output_file)
 
-        dump_file(input_file, output_file)
+        dump_file(input_file, output_file, config.sparse, profiler, compression)
 
         current_file += 1
         print("Finished converting file " + output_file + " (" + str(current_file) + "/" + str(file_count) + ")")
 
+    if config.profile is not None:
+        profiler.dump(config.profile)
+
     print("\n=========== ALL FILES CONVERTED ===========\n")
@@ -2,8 +2,6 @@ from root_utils.root_file_utils import *
 import argparse
 import numpy as np
 
-ROOT.gROOT.SetBatch(True)
-
 
 def get_args():
     parser = argparse.ArgumentParser(description='dump geometry data from WCSim into numpy .npz file')
@@ -17,29 +15,14 @@ def geodump(input_file, output_file):
     print("input file:", input_file)
     print("output file:", output_file)
 
-    file = WCSimFile(input_file)
-
-    geo = file.geo
-
-    num_pmts = geo.GetWCNumPMT()
-
-    tube_no = np.zeros(num_pmts, dtype=int)
-    position = np.zeros((num_pmts, 3))
-    orientation = np.zeros((num_pmts, 3))
-
-    for i in range(num_pmts):
-        pmt = geo.GetPMT(i)
-        tube_no[i] = pmt.GetTubeNo()
-        for j in range(3):
-            position[i][j] = pmt.GetPosition(j)
-            orientation[i][j] = pmt.GetOrientation(j)
+    geometry = WCSimFile(input_file).geometry
 
-    np.savez_compressed(output_file, tube_no=tube_no, position=position, orientation=orientation)
+    np.savez_compressed(output_file, tube_no=geometry["tube_no"], position=geometry["position"],
+                        orientation=geometry["orientation"])
 
 
 if __name__ == '__main__':
 
-    ROOT.gSystem.Load(os.environ['WCSIMDIR'] + "/libWCSimRoot.so")
     config = get_args()
 
     if os.path.splitext(config.input_file)[1].lower() != '.root':
@@ -0,0 +1,116 @@
+"""
+PMT geometry of a WCSim detector configuration, with the quantities derived from it by the conversion and display tools
+
+The geometry of a file is read once per detector configuration: it is identified by a key, the hash of the
+WCSimRootGeom object as streamed by ROOT (see WCSim.geometry_key), and saved to a .npz file named by that key in a cache
+directory, which is $DATATOOLS_GEOMETRY_CACHE or ~/.cache/datatools/geometry by default. Later files with the same
+geometry load the cached arrays instead of reading every PMT through PyROOT.
+
+The geometry is a dictionary of arrays indexed by the 0-indexed PMT number:
+    tube_no, position, orientation: as stored by WCSim
+    module, pmt_in_module: mPMT module and position of the PMT within it (see pos_utils)
+    region: REGION_BARREL, REGION_BOTTOM or REGION_TOP
+    row, col: module row and column in the barrel image (see barrel_grid), or -1 outside the barrel
+    display_x, display_y, display_z: position in the frame of the event displays, with z along the tank axis
+    display_arc: distance along the barrel wall in the event displays
+and display_r_max, the largest distance of a PMT from the tank axis.
+"""
+
+import os
+
+import numpy as np
+
+import root_utils.pos_utils as pu
+
+REGION_BARREL = 0
+REGION_BOTTOM = 1
+REGION_TOP = 2
+
+# Increased whenever the derived quantities change, so that older cached files are not used
+GEOMETRY_VERSION = 1
+
+
+def cache_dir():
+    default = os.path.join(os.path.expanduser("~"), ".cache", "datatools", "geometry")
+    return os.environ.get("DATATOOLS_GEOMETRY_CACHE", default)
+
+
+def read_pmts(geo):
+    """Returns the tube numbers, positions and orientations of all PMTs of a WCSimRootGeom, read one PMT at a time"""
+    num_pmts = geo.GetWCNumPMT()
+    tube_no = np.empty(num_pmts, dtype=np.int32)
+    position = np.empty((num_pmts, 3), dtype=np.float64)
+    orientation = np.empty((num_pmts, 3), dtype=np.float64)
+    for i in range(num_pmts):
+        pmt = geo.GetPMT(i)
+        tube_no[i] = pmt.GetTubeNo()
+        for j in range(3):
+            position[i, j] = pmt.GetPosition(j)
+            orientation[i, j] = pmt.GetOrientation(j)
+    return tube_no, position, orientation
+
+
+def derive_geometry(tube_no, position, orientation):
+    """Returns the geometry dictionary of PMTs with the given tube numbers, positions and orientations"""
+    position = np.asarray(position, dtype=np.float64)
+    pmt = np.arange(len(tube_no))
+    module = pu.module_index(pmt)
+    region = np.full(len(pmt), REGION_BARREL, dtype=np.int8)
+    region[pu.is_bottom(module)] = REGION_BOTTOM
+    region[pu.is_top(module)] = REGION_TOP
+    barrel = region == REGION_BARREL
+    row = np.full(len(pmt), -1, dtype=np.int32)
+    col = np.full(len(pmt), -1, dtype=np.int32)
+    row[barrel], col[barrel] = pu.row_col(module[barrel])
+    display_x = position[:, 2]
+    display_y = position[:, 0]
+    r_max = np.amax(np.hypot(display_x, display_y)) if len(pmt) else 0.
+    return {
+        "tube_no": np.asarray(tube_no, dtype=np.int32),
+        "position": position,
+        "orientation": np.asarray(orientation, dtype=np.float64),
+        "module": module.astype(np.int32),
+        "pmt_in_module": pu.pmt_in_module_id(pmt).astype(np.int32),
+        "region": region,
+        "row": row,
+        "col": col,
+        "display_x": display_x,
+        "display_y": display_y,
+        "display_z": position[:, 1],
+        "display_arc": r_max * np.arctan2(display_y, display_x),
+        "display_r_max": np.float64(r_max)
+    }
+
+
+def cache_file(key, directory=None):
+    directory = cache_dir() if directory is None else directory
+    return os.path.join(directory, "geometry_v{}_{}.npz".format(GEOMETRY_VERSION, key))
+
+
+def save_geometry(filename, geometry):
+    """Saves a geometry, writing to a temporary file first so that concurrent jobs never read a partial file"""
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    tmp_filename = "{}.{}.tmp.npz".format(filename[:-len(".npz")], os.getpid())
+    np.savez(tmp_filename, **geometry)
+    os.replace(tmp_filename, filename)
+
+
+def load_geometry(filename):
+    with np.load(filename) as f:
+        return {k: f[k] for k in f.files}
+
+
+def cached_geometry(key, read, directory=None):
+    """
+    Returns the geometry with the given key from the cache, or derives it from the tube numbers, positions and
+    orientations returned by read and saves it to the cache. If key is None, the geometry is derived without caching.
+    """
+    if key is None:
+        return derive_geometry(*read())
+    filename = cache_file(key, directory)
+    if os.path.isfile(filename):
+        return load_geometry(filename)
+    geometry = derive_geometry(*read())
+    save_geometry(filename, geometry)
+    return geometry
+
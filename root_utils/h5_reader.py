@@ -0,0 +1,210 @@
+"""
+Random access batch reader for the HDF5 files written by np_to_grid_hdf5.py
+
+Batches of rows are requested by index list. The rows of chunked datasets are read a whole chunk at a time, each chunk
+needed by a batch being read once in file order, and decoded chunks are kept in a least recently used cache with a
+memory budget so that shuffled access does not re-read the same chunks from disk. Datasets that are not chunked, as
+written by np_to_grid_hdf5.py without compression, are read directly, only the requested rows in runs of consecutive
+rows, since reading them a block at a time would mostly read rows that shuffled access does not need again soon.
+Batches can be prefetched on a background thread while the previous batch is being used. Event data stored in sparse
+form is densified on read.
+"""
+
+import threading
+from collections import OrderedDict
+from queue import Queue
+
+import h5py
+import numpy as np
+
+from root_utils.barrel_grid import densify, is_sparse, GRID_SHAPE
+from root_utils.compression import register_hdf5_filters
+
+SPARSE_DATASETS = ("event_data_offsets", "event_data_index", "event_data_values")
+
+
+class ChunkCache:
+    """Least recently used cache of arrays, evicting the oldest entries once their total size exceeds max_bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        """Returns the cached arrays for key, calling load() to read and cache them if they are not cached"""
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        value = load()
+        size = sum(a.nbytes for a in value) if isinstance(value, tuple) else value.nbytes
+        self.entries[key] = value
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= sum(a.nbytes for a in old) if isinstance(old, tuple) else old.nbytes
+        return value
+
+
+class H5BatchReader:
+    """
+    Reads batches of rows of the datasets of a converted HDF5 file
+
+    Parameters
+    ----------
+    filename : str
+        HDF5 file written by np_to_grid_hdf5.py, with event data in dense or sparse form
+    datasets : sequence of str, optional
+        Names of the datasets to read, by default all datasets of the file. Sparse event data is read as "event_data".
+    cache_bytes : int
+        Memory budget of the cache of decoded chunks
+    chunk_rows : int
+        Number of rows of sparse event data read and cached at once
+    prefetch : int
+        Number of batches read ahead on a background thread by iter_batches
+    """
+
+    def __init__(self, filename, datasets=None, cache_bytes=1 << 30, chunk_rows=64, prefetch=2):
+        register_hdf5_filters()
+        self.file = h5py.File(filename, "r")
+        self.sparse = is_sparse(self.file)
+        if datasets is None:
+            datasets = [d for d in self.file.keys() if d not in SPARSE_DATASETS]
+            if self.sparse:
+                datasets.append("event_data")
+        self.datasets = list(datasets)
+        self.nrows = self.file["labels"].shape[0]
+        self.chunk_rows = {}
+        for name in self.datasets:
+            if name == "event_data" and self.sparse:
+                self.chunk_rows[name] = chunk_rows
+                continue
+            chunks = self.file[name].chunks
+            # Datasets that are not chunked are read row by row, without the cache
+            self.chunk_rows[name] = chunks[0] if chunks is not None else None
+        if self.sparse:
+            self.event_data_offsets = self.file["event_data_offsets"][...]
+        self.cache = ChunkCache(cache_bytes)
+        self.prefetch = prefetch
+        # h5py serializes file access anyway, the lock also protects the cache when batches are prefetched
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.nrows
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_chunk(self, name, chunk):
+        rows = self.chunk_rows[name]
+        start = chunk * rows
+        stop = min(start + rows, self.nrows)
+        if name == "event_data" and self.sparse:
+            first, last = self.event_data_offsets[start], self.event_data_offsets[stop]
+            return (self.file["event_data_index"][first:last], self.file["event_data_values"][first:last],
+                    self.event_data_offsets[start:stop+1] - first)
+        return self.file[name][start:stop]
+
+    def read_rows(self, name, indices):
+        """
+        Reads the rows at indices of a dataset that is not chunked, in one read of the distinct rows in file order, in
+        which HDF5 merges runs of consecutive rows
+        """
+        rows, inverse = np.unique(indices, return_inverse=True)
+        dataset = self.file[name]
+        if len(rows) == 0:
+            return dataset[0:0]
+        return dataset[rows][inverse.reshape(-1)]
+
+    def read_dataset(self, name, indices):
+        rows = self.chunk_rows[name]
+        if rows is None:
+            return self.read_rows(name, indices)
+        chunk_of_row = indices // rows
+        # Read each chunk the batch needs once, in file order
+        chunks, inverse = np.unique(chunk_of_row, return_inverse=True)
+        row_in_chunk = indices - chunk_of_row * rows
+        sparse = name == "event_data" and self.sparse
+        out = None
+        for i, chunk in enumerate(chunks):
+            data = self.cache.get((name, chunk), lambda: self.read_chunk(name, chunk))
+            selected = inverse == i
+            if sparse:
+                if out is None:
+                    out = np.empty((len(indices),) + GRID_SHAPE, dtype=np.float32)
+                index, values, offsets = data
+                out[selected] = densify(index, values, offsets, row_in_chunk[selected])
+            else:
+                if out is None:
+                    out = np.empty((len(indices),) + data.shape[1:], dtype=data.dtype)
+                out[selected] = data[row_in_chunk[selected]]
+        if out is None:
+            shape = (0,) + (GRID_SHAPE if sparse else self.file[name].shape[1:])
+            out = np.empty(shape, dtype=np.float32 if sparse else self.file[name].dtype)
+        return out
+
+    def get_batch(self, indices):
+        """Returns a dictionary of the rows of each dataset at the given indices, in the order given"""
+        indices = np.asarray(indices, dtype=np.int64)
+        if np.any((indices < 0) | (indices >= self.nrows)):
+            raise IndexError("Batch indices out of range for " + str(self.nrows) + " rows")
+        with self.lock:
+            return {name: self.read_dataset(name, indices) for name in self.datasets}
+
+    def iter_batches(self, batches):
+        """
+        Yields the batches of rows for each list of indices in batches, reading up to prefetch batches ahead on a
+        background thread
+        """
+        if self.prefetch < 1:
+            for indices in batches:
+                yield self.get_batch(indices)
+            return
+        queue = Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def producer():
+            try:
+                for indices in batches:
+                    if stop.is_set():
+                        return
+                    queue.put((True, self.get_batch(indices)))
+                queue.put((False, None))
+            except Exception as e:
+                queue.put((False, e))
+
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        try:
+            while True:
+                ok, item = queue.get()
+                if not ok:
+                    if item is not None:
+                        raise item
+                    break
+                yield item
+        finally:
+            stop.set()
+            # Unblock the producer if it is waiting to queue a batch that will not be used
+            while thread.is_alive():
+                while not queue.empty():
+                    queue.get()
+                thread.join(0.1)
+
+    def epoch(self, batch_size, shuffle=True, seed=None):
+        """Yields batches covering every row once, in shuffled order if shuffle is True, prefetched by iter_batches"""
+        order = np.arange(self.nrows)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        batches = (order[i:i+batch_size] for i in range(0, self.nrows, batch_size))
+        return self.iter_batches(batches)
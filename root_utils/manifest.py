@@ -0,0 +1,128 @@
+"""
+Manifest of converted files, so that reruns of a conversion skip inputs that were already converted
+
+The manifest is a JSON file recording, for each output file, the size, modification time and content hash of each
+input it was produced from, and the size of the output. An output is up to date if it exists with that size and its
+inputs still match the recorded entries. The content hash is only computed when an input's size or modification time
+has changed, so checking an unchanged input does not need to read it, and the new modification time of an input whose
+content is unchanged is saved so that it is only hashed once.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+
+def file_hash(path, block_size=16 * 1024 * 1024):
+    """Returns the SHA-256 hex digest of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_stat(path):
+    """Returns the size and modification time of a file, as recorded in the manifest and in checkpoints"""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def file_signature(path):
+    """Returns the size, modification time and content hash of a file"""
+    signature = file_stat(path)
+    signature["sha256"] = file_hash(path)
+    return signature
+
+
+class Manifest:
+    """
+    Manifest saved at path, which can be shared by concurrent jobs, e.g. the tasks of a SLURM job array: it is saved
+    under a lock, merging the entries changed by this job into those saved by the others since it was read
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.outputs = {}
+        # Outputs whose entries were recorded or updated by this job and are still to be saved
+        self.changed = set()
+        self.modified = False
+        if os.path.isfile(path):
+            self.outputs = self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            return json.load(f)["outputs"]
+
+    @contextmanager
+    def locked(self):
+        """Holds an exclusive lock on the manifest, on a separate lock file since the manifest itself is replaced"""
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def input_matches(self, path, recorded):
+        if not os.path.isfile(path):
+            return False
+        stat = file_stat(path)
+        if stat["size"] != recorded["size"]:
+            return False
+        if stat["mtime"] == recorded["mtime"]:
+            return True
+        # The file was touched, it is still converted if its content is unchanged
+        if file_hash(path) != recorded["sha256"]:
+            return False
+        # Record the new modification time, so that the next check does not hash the file again
+        recorded["mtime"] = stat["mtime"]
+        self.modified = True
+        return True
+
+    def is_converted(self, inputs, output):
+        """
+        Returns True if output exists with its recorded size and was produced from the given list of inputs in their
+        current state
+        """
+        key = os.path.abspath(output)
+        entry = self.outputs.get(key)
+        if entry is None or not os.path.isfile(output) or os.path.getsize(output) != entry["output_size"]:
+            return False
+        recorded = entry["inputs"]
+        paths = [os.path.abspath(i) for i in inputs]
+        if [r["path"] for r in recorded] != paths:
+            return False
+        self.modified = False
+        converted = all(self.input_matches(p, r) for p, r in zip(paths, recorded))
+        if converted and self.modified:
+            self.changed.add(key)
+            self.save()
+        return converted
+
+    def record(self, inputs, output):
+        """Records that output was produced from the given list of inputs, and saves the manifest"""
+        entries = []
+        for path in inputs:
+            entry = {"path": os.path.abspath(path)}
+            entry.update(file_signature(path))
+            entries.append(entry)
+        key = os.path.abspath(output)
+        self.outputs[key] = {"inputs": entries, "output_size": os.path.getsize(output)}
+        self.changed.add(key)
+        self.save()
+
+    def save(self):
+        """Saves the entries changed by this job, keeping those saved by other jobs since the manifest was read"""
+        with self.locked():
+            outputs = self.load() if os.path.isfile(self.path) else {}
+            outputs.update({key: self.outputs[key] for key in self.changed})
+            # Write to a temporary file first so that a job killed while saving cannot leave a truncated manifest
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"outputs": outputs}, f, indent=1)
+            os.replace(tmp_path, self.path)
+        self.outputs = outputs
+        self.changed.clear()
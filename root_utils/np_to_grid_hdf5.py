@@ -1,94 +1,463 @@
 import numpy as np
 import os
+import json
+import time
 import argparse
 import h5py
-import root_utils.pos_utils as pu
+from multiprocessing import Pool, Process, Queue, Event, TimeoutError
+from queue import Full
+import root_utils.ragged_utils as ru
+from root_utils.barrel_grid import grid_events, to_sparse, GRID_SHAPE
+from root_utils.manifest import Manifest, file_stat
+from root_utils.profiling import Profiler, NULL_PROFILER
+from root_utils.compression import Compression, as_compression, load_npz, register_hdf5_filters
+from root_utils.selection import EventSelection, npz_quantities, print_cut_flow
+
+# Rows of each chunk of the dense event data when it is compressed, which H5BatchReader reads and caches whole
+EVENT_DATA_CHUNK_ROWS = 16
+# Seconds between checks that the writer process is still alive while waiting on it
+WRITER_CHECK_INTERVAL = 1.
 
 def get_args():
     parser = argparse.ArgumentParser(description='convert and merge .npz files to hdf5')
     parser.add_argument('input_files', type=str, nargs='+')
     parser.add_argument('-o', '--output_file', type=str)
+    parser.add_argument('-b', '--block_size', type=int, default=1024,
+                        help='number of events to grid and write to the output at once')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of worker processes reading and gridding input files in parallel')
+    parser.add_argument('-s', '--sparse', action='store_true',
+                        help='store only the non-zero entries of event_data, as event_data_index, event_data_values '
+                             'and event_data_offsets datasets, instead of the dense images')
+    parser.add_argument('-m', '--manifest', type=str, default=None,
+                        help='manifest file recording converted outputs, which are skipped if unchanged when rerun')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='continue an output left incomplete by an interrupted run, skipping the input files that '
+                             'were completely written')
+    parser.add_argument('-p', '--profile', type=str, default=None,
+                        help='record the time spent in each stage of the conversion and write it to this JSON file')
+    parser.add_argument('--report_interval', type=float, default=30.,
+                        help='seconds between events/s progress lines when profiling')
+    parser.add_argument('--compression', type=str, nargs='+', default=['none'],
+                        help='codec of the output datasets as name[:level][+shuffle], with none, zlib, lz4, zstd or '
+                             'blosc, optionally followed by dataset=codec for single datasets. lz4, zstd and blosc '
+                             'need hdf5plugin to write and read the output')
+    parser.add_argument('--selection', type=str, default=None,
+                        help='only convert events passing this expression over ntriggers, ndigihits, first_ndigihits, '
+                             'pid, energy, x, y, z, r and dir_x/y/z, e.g. "first_ndigihits > 20 and r < 300", '
+                             'storing the number of events passing each cut in the cut_names and cut_counts attributes')
     args = parser.parse_args()
     return args
 
-if __name__ == '__main__':
-    config = get_args()
-    print("ouput file:", config.output_file)
-    f = h5py.File(config.output_file, 'w')
 
-    total_rows = 0
-    for input_file in config.input_files:
+def create_datasets(f, total_rows, sparse=False, compression="none"):
+    """Creates the output datasets, compressed with their codec of compression, with chunks chosen by h5py if needed"""
+    compression = as_compression(compression)
+    f.create_dataset("labels",
+                     shape=(total_rows,),
+                     dtype=np.int32,
+                     **compression.codec("labels").h5py_options())
+    # The strings of variable length datasets are stored outside the chunks, so they are not compressed
+    f.create_dataset("root_files",
+                     shape=(total_rows,),
+                     dtype=h5py.special_dtype(vlen=str))
+    f.create_dataset("event_ids",
+                     shape=(total_rows,),
+                     dtype=np.int32,
+                     **compression.codec("event_ids").h5py_options())
+    if sparse:
+        # The non-zero entries of event i are at event_data_offsets[i] to event_data_offsets[i+1]-1 of the index
+        # (row, column, channel) and values datasets, which grow as blocks are appended
+        f.create_dataset("event_data_offsets",
+                         shape=(total_rows+1,),
+                         dtype=np.int64,
+                         **compression.codec("event_data_offsets").h5py_options())
+        f.create_dataset("event_data_index",
+                         shape=(0, 3),
+                         maxshape=(None, 3),
+                         chunks=(65536, 3),
+                         dtype=np.uint8,
+                         **compression.codec("event_data_index").h5py_options())
+        f.create_dataset("event_data_values",
+                         shape=(0,),
+                         maxshape=(None,),
+                         chunks=(65536,),
+                         dtype=np.float32,
+                         **compression.codec("event_data_values").h5py_options())
+    else:
+        options = compression.codec("event_data").h5py_options()
+        if options:
+            options["chunks"] = (min(EVENT_DATA_CHUNK_ROWS, max(total_rows, 1)),)+GRID_SHAPE
+        f.create_dataset("event_data",
+                         shape=(total_rows,)+GRID_SHAPE,
+                         dtype=np.float32,
+                         **options)
+    f.create_dataset("energies",
+                     shape=(total_rows, 1),
+                     dtype=np.float32,
+                     **compression.codec("energies").h5py_options())
+    f.create_dataset("positions",
+                     shape=(total_rows, 1, 3),
+                     dtype=np.float32,
+                     **compression.codec("positions").h5py_options())
+    f.create_dataset("angles",
+                     shape=(total_rows, 2),
+                     dtype=np.float32,
+                     **compression.codec("angles").h5py_options())
+
+
+def convert_file(input_file, block_size, block_buffer=None, sparse=False, profiler=NULL_PROFILER, events=None):
+    """
+    Yields blocks of output rows for one input file, as the index of the block's first row and a dictionary of arrays
+    of the rows of each dataset. The event data is gridded block_size events at a time, into block_buffer if given.
+    If sparse is True, the event data blocks are instead the non-zero entries of the images and their per-event counts.
+    If events is given, only the rows of those events of the file are converted, e.g. those passing a selection.
+    """
+    load_start = time.perf_counter()
+    # Files from older versions of event_dump store per-event object arrays, which need pickle to load
+    npz_file = load_npz(input_file, allow_pickle=True)
+    event_id = npz_file['event_id']
+    if 'root_files' in npz_file:
+        root_file = npz_file['root_files'][npz_file['root_file_index']]
+    else:
+        root_file = npz_file['root_file']
+    pid = npz_file['pid']
+    position = npz_file['position']
+    direction = npz_file['direction']
+    energy = npz_file['energy']
+    hit_time, hit_offsets = ru.load_field(npz_file, 'digi_hit_time', 'digi_hit_offsets')
+    hit_charge, _ = ru.load_field(npz_file, 'digi_hit_charge', 'digi_hit_offsets')
+    hit_pmt, _ = ru.load_field(npz_file, 'digi_hit_pmt', 'digi_hit_offsets')
+    if events is not None:
+        event_id, root_file, pid, position, direction, energy = (
+            a[events] for a in (event_id, root_file, pid, position, direction, energy))
+        hit_time, selected_offsets = ru.gather_events(hit_time, hit_offsets, events)
+        hit_charge, _ = ru.gather_events(hit_charge, hit_offsets, events)
+        hit_pmt, _ = ru.gather_events(hit_pmt, hit_offsets, events)
+        hit_offsets = selected_offsets
+
+    labels = np.full(pid.shape[0], -1)
+    labels[pid==22] = 0
+    labels[pid==11] = 1
+    labels[pid==13] = 2
+
+    polar = np.arccos(direction[:,1])
+    azimuth = np.arctan2(direction[:,2], direction[:,0])
+    profiler.record("load_npz", time.perf_counter() - load_start)
+
+    yield 0, {
+        "event_ids": event_id,
+        "root_files": root_file,
+        "energies": energy.reshape(-1,1),
+        "positions": position.reshape(-1,1,3),
+        "labels": labels,
+        "angles": np.hstack((polar.reshape(-1,1),azimuth.reshape(-1,1)))
+    }
+
+    nevents = event_id.shape[0]
+    for start in range(0, nevents, block_size):
+        stop = min(start + block_size, nevents)
+        out = None if block_buffer is None else block_buffer[:stop-start]
+        with profiler.stage("grid_events", stop-start):
+            event_data = grid_events(hit_pmt, hit_charge, hit_time, hit_offsets, start, stop, out=out)
+        if sparse:
+            with profiler.stage("to_sparse", stop-start):
+                index, values, counts = to_sparse(event_data)
+            yield start, {"event_data_index": index, "event_data_values": values, "event_data_counts": counts}
+        else:
+            yield start, {"event_data": event_data}
+
+
+def is_sparse_block(block):
+    return "event_data_counts" in block
+
+
+def block_rows(block):
+    if is_sparse_block(block):
+        return block["event_data_counts"].shape[0]
+    return next(iter(block.values())).shape[0]
+
+
+def write_block(f, offset, block):
+    for name, rows in block.items():
+        f[name][offset:offset+rows.shape[0]] = rows
+
+
+def append_sparse_block(f, offset, block):
+    """Appends a block of sparse event data, which must start at the row following the last appended block"""
+    values = f["event_data_values"]
+    index = f["event_data_index"]
+    counts = block["event_data_counts"]
+    start = values.shape[0]
+    stop = start + block["event_data_values"].shape[0]
+    f["event_data_offsets"][offset+1:offset+1+counts.shape[0]] = start + np.cumsum(counts)
+    values.resize((stop,))
+    index.resize((stop, 3))
+    values[start:stop] = block["event_data_values"]
+    index[start:stop] = block["event_data_index"]
+
+
+def count_rows(input_files):
+    rows = []
+    for input_file in input_files:
         if not os.path.isfile(input_file):
             raise ValueError(input_file+" does not exist")
-        npz_file = np.load(input_file)
-        total_rows += npz_file['event_id'].shape[0]
-
-    dset_labels=f.create_dataset("labels",
-                                 shape=(total_rows,),
-                                 dtype=np.int32)
-    dset_PATHS=f.create_dataset("root_files",
-                                shape=(total_rows,),
-                                dtype=h5py.special_dtype(vlen=str))
-    dset_IDX=f.create_dataset("event_ids",
-                              shape=(total_rows,),
-                              dtype=np.int32)
-    dset_event_data=f.create_dataset("event_data",
-                                     shape=(total_rows, 16, 40, 38),
-                                     dtype=np.float32)
-    dset_energies=f.create_dataset("energies",
-                                   shape=(total_rows, 1),
-                                   dtype=np.float32)
-    dset_positions=f.create_dataset("positions",
-                                    shape=(total_rows, 1, 3),
-                                    dtype=np.float32)
-    dset_angles=f.create_dataset("angles",
-                                 shape=(total_rows, 2),
-                                 dtype=np.float32)
+        with load_npz(input_file) as npz_file:
+            rows.append(npz_file['event_id'].shape[0])
+    return rows
+
+
+def select_rows(input_files, selection):
+    """Returns the indices of the events of each input file passing a selection, and their total cut flow counts"""
+    events = []
+    cut_counts = 0
+    for input_file in input_files:
+        with load_npz(input_file, allow_pickle=True) as npz_file:
+            quantities = npz_quantities(npz_file, selection.names)
+            passed, counts = selection.select(quantities, npz_file['event_id'].shape[0])
+        events.append(np.flatnonzero(passed))
+        cut_counts = cut_counts + counts
+    return events, cut_counts
+
+
+def resumable(output_file, inputs, sparse, selection=None):
+    """
+    Returns True if output_file is an incomplete output of the given inputs, with event data in the same form and the
+    same selection
+    """
+    try:
+        with h5py.File(output_file, 'r') as f:
+            return (f.attrs.get("inputs") == json.dumps(inputs) and ("event_data_values" in f) == sparse
+                    and f.attrs.get("selection", "") == ("" if selection is None else str(selection)))
+    except (OSError, KeyError):
+        return False
+
+
+def prepare_output(output_file, input_files, file_rows, sparse=False, resume=False, compression="none", selection=None,
+                   cut_counts=None):
+    """
+    Creates the output file with its datasets compressed as given by compression, or with resume, reopens the
+    incomplete output of an interrupted run on the same inputs, keeping its compression. With a selection, its
+    expression and cut flow counts are stored in the selection, cut_names and cut_counts attributes.
+    Returns the array of flags of which input files are already completely written. The flags are stored in the
+    "converted" attribute of the output and updated as each input file is completed, see mark_converted.
+    """
+    register_hdf5_filters()
+    inputs = [dict(path=os.path.abspath(i), **file_stat(i)) for i in input_files]
+    if resume and os.path.isfile(output_file) and resumable(output_file, inputs, sparse, selection):
+        with h5py.File(output_file, 'a') as f:
+            converted = f.attrs["converted"].astype(bool)
+            if sparse:
+                # Sparse event data is written in row order, so only the leading completed files are kept
+                incomplete = np.flatnonzero(~converted)
+                if incomplete.size > 0:
+                    converted[incomplete[0]:] = False
+                    next_row = int(np.sum(file_rows[:incomplete[0]]))
+                    entries = f["event_data_offsets"][next_row]
+                    f["event_data_values"].resize((entries,))
+                    f["event_data_index"].resize((entries, 3))
+                f.attrs["converted"] = converted.astype(np.int8)
+        return converted
+    with h5py.File(output_file, 'w') as f:
+        create_datasets(f, sum(file_rows), sparse, compression)
+        f.attrs["inputs"] = json.dumps(inputs)
+        if selection is not None:
+            f.attrs["selection"] = str(selection)
+            for name, array in selection.cut_flow(cut_counts).items():
+                f.attrs[name] = array.astype(h5py.string_dtype()) if array.dtype.kind == "U" else array
+        converted = np.array(file_rows) == 0
+        f.attrs["converted"] = converted.astype(np.int8)
+    return converted
+
+
+def mark_converted(f, file_index):
+    """Records that all rows of an input file are written, flushing the output so that a resumed run can skip it"""
+    converted = f.attrs["converted"]
+    converted[file_index] = 1
+    f.attrs["converted"] = converted
+    f.flush()
+
+
+def prepare_rows(input_files, selection=None):
+    """
+    Returns the number of output rows of each input file, the indices of the events of each file to convert, or None
+    for all of them, and the cut flow counts of the selection
+    """
+    file_rows = count_rows(input_files)
+    if selection is None:
+        return file_rows, [None]*len(input_files), None
+    file_events, cut_counts = select_rows(input_files, selection)
+    print_cut_flow(**selection.cut_flow(cut_counts))
+    return [len(e) for e in file_events], file_events, cut_counts
+
+
+def convert_serial(input_files, output_file, block_size, sparse=False, resume=False, profiler=NULL_PROFILER,
+                   compression="none", selection=None):
+    file_rows, file_events, cut_counts = prepare_rows(input_files, selection)
+    converted = prepare_output(output_file, input_files, file_rows, sparse, resume, compression, selection, cut_counts)
+    f = h5py.File(output_file, 'a')
+    block_buffer = np.zeros((block_size,)+GRID_SHAPE, dtype=np.float32)
     offset = 0
-    offset_next = 0
-    label_map = {22: 0, 11: 1, 13: 2}
-    for input_file in config.input_files:
-        npz_file = np.load(input_file)
-        event_id = npz_file['event_id']
-        root_file = npz_file['root_file']
-        pid = npz_file['pid']
-        position = npz_file['position']
-        direction = npz_file['direction']
-        energy = npz_file['energy']
-        hit_time = npz_file['digi_hit_time']
-        hit_charge = npz_file['digi_hit_charge']
-        hit_pmt = npz_file['digi_hit_pmt']
-        hit_trigger = npz_file['digi_hit_trigger']
-        trigger_time = npz_file['trigger_time']
-
-        offset_next += event_id.shape[0]
-
-        dset_IDX[offset:offset_next] = event_id
-        dset_PATHS[offset:offset_next] = root_file
-        dset_energies[offset:offset_next,:] = energy.reshape(-1,1)
-        dset_positions[offset:offset_next,:,:] = position.reshape(-1,1,3)
-
-        labels = np.full(pid.shape[0], -1)
-        labels[pid==22] = 0
-        labels[pid==11] = 1
-        labels[pid==13] = 2
-        dset_labels[offset:offset_next] = labels
-
-        polar = np.arccos(direction[:,1])
-        azimuth = np.arctan2(direction[:,2], direction[:,0])
-        dset_angles[offset:offset_next,:] = np.hstack((polar.reshape(-1,1),azimuth.reshape(-1,1)))
-
-        for i in range(hit_pmt.shape[0]):
-            first_trigger = np.argmin(trigger_time[i])
-            module_index = pu.module_index(hit_pmt[i])
-            wall_indices = np.where((hit_trigger[i]==first_trigger) & pu.is_barrel(module_index))
-            wall_indices = np.where(pu.is_barrel(module_index))
-            pmt_in_module = pu.pmt_in_module_id(hit_pmt[i][wall_indices])
-            wall_row, wall_col = pu.row_col(module_index[wall_indices])
-            event_data = np.zeros((16, 40, 38))
-            event_data[wall_row, wall_col, pmt_in_module] = hit_charge[i][wall_indices]
-            event_data[wall_row, wall_col, pmt_in_module + 19] = hit_time[i][wall_indices]
-            dset_event_data[offset+i,:] = event_data
-
-        offset = offset_next
+    for file_index, (input_file, rows, events) in enumerate(zip(input_files, file_rows, file_events)):
+        if not converted[file_index]:
+            for start, block in convert_file(input_file, block_size, block_buffer, sparse, profiler, events):
+                with profiler.stage("write_block", block_rows(block)):
+                    if is_sparse_block(block):
+                        append_sparse_block(f, offset+start, block)
+                    else:
+                        write_block(f, offset+start, block)
+                if "event_data" in block or is_sparse_block(block):
+                    profiler.progress(block_rows(block))
+            mark_converted(f, file_index)
+        offset += rows
     f.close()
+
+
+# Queue of finished blocks and event set if the writer process has failed, passed to each worker process by the pool
+# initializer
+block_queue = None
+writer_failed = None
+
+
+def init_worker(queue, failed):
+    global block_queue, writer_failed
+    block_queue = queue
+    writer_failed = failed
+
+
+def put_block(queue, item, writer_alive):
+    """
+    Puts an item in the bounded queue of the writer process, checking regularly while the queue is full that the writer
+    is still alive, so that a failed writer raises an error instead of blocking forever
+    """
+    while True:
+        try:
+            queue.put(item, timeout=WRITER_CHECK_INTERVAL)
+            return
+        except Full:
+            if not writer_alive():
+                raise RuntimeError("HDF5 writer process exited before all blocks were written")
+
+
+def grid_task(task):
+    input_file, offset, block_size, sparse, events = task
+    for start, block in convert_file(input_file, block_size, sparse=sparse, events=events):
+        put_block(block_queue, (offset+start, block), lambda: not writer_failed.is_set())
+    return input_file
+
+
+def writer_process(queue, output_file, file_offsets, converted):
+    """
+    Owns the output file, writing each finished block at its row offset until None is received. Sparse event data can
+    only be appended in row order, so sparse blocks that arrive early are held until all preceding rows are written.
+    Each input file is marked as converted once all the rows of each of its datasets are written.
+    """
+    register_hdf5_filters()
+    f = h5py.File(output_file, 'a')
+    # Number of rows still to be written for each file, counting the rows of the event data and of the other datasets
+    remaining = 2*np.diff(file_offsets)
+    remaining[converted] = 0
+    pending_sparse = {}
+    incomplete = np.flatnonzero(~converted)
+    next_row = int(file_offsets[incomplete[0]]) if incomplete.size > 0 else int(file_offsets[-1])
+
+    def written(offset, block):
+        file_index = np.searchsorted(file_offsets, offset, side='right') - 1
+        remaining[file_index] -= block_rows(block)
+        if remaining[file_index] == 0:
+            mark_converted(f, file_index)
+
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        offset, block = item
+        if not is_sparse_block(block):
+            write_block(f, offset, block)
+            written(offset, block)
+            continue
+        pending_sparse[offset] = block
+        while next_row in pending_sparse:
+            block = pending_sparse.pop(next_row)
+            append_sparse_block(f, next_row, block)
+            written(next_row, block)
+            next_row += block_rows(block)
+    f.close()
+    if pending_sparse:
+        raise RuntimeError("Sparse event data blocks from row " + str(next_row) + " were never written")
+
+
+def convert_parallel(input_files, output_file, block_size, workers, sparse=False, resume=False,
+                     profiler=NULL_PROFILER, compression="none", selection=None):
+    """
+    Converts the input files in a pool of worker processes, each reading and gridding whole files, while a single
+    writer process places each finished block at the rows precomputed for its file, so the output is deterministic.
+    Only the main process is profiled, recording the time waiting for each file to be gridded. If the writer process
+    fails, the workers are terminated and a RuntimeError is raised. If a worker raises, the other workers and the writer
+    are terminated and the worker's exception is raised.
+    """
+    file_rows, file_events, cut_counts = prepare_rows(input_files, selection)
+    file_offsets = ru.offsets_from_counts(file_rows)
+    converted = prepare_output(output_file, input_files, file_rows, sparse, resume, compression, selection, cut_counts)
+    # Bound the number of finished blocks waiting to be written, to limit memory use
+    queue = Queue(maxsize=2*workers)
+    writer = Process(target=writer_process, args=(queue, output_file, file_offsets, converted))
+    writer.start()
+    tasks = [(input_file, int(offset), block_size, sparse, events)
+             for input_file, offset, events, done in zip(input_files, file_offsets, file_events, converted) if not done]
+    failed = Event()
+    pool = Pool(workers, initializer=init_worker, initargs=(queue, failed))
+    rows = dict(zip(input_files, file_rows))
+    finished = False
+    try:
+        results = pool.imap_unordered(grid_task, tasks)
+        for _ in tasks:
+            with profiler.stage("wait_workers"):
+                while True:
+                    try:
+                        input_file = results.next(timeout=WRITER_CHECK_INTERVAL)
+                        break
+                    except TimeoutError:
+                        if not writer.is_alive():
+                            raise RuntimeError("HDF5 writer process failed with exit code " + str(writer.exitcode))
+            profiler.progress(rows[input_file])
+        # Let the workers exit cleanly so that all their queued blocks are flushed to the writer
+        pool.close()
+        pool.join()
+        put_block(queue, None, writer.is_alive)
+        finished = True
+    finally:
+        if not finished:
+            # A worker raised or the writer failed: stop the workers, which may be blocked on the full queue, and the
+            # writer, which would otherwise wait forever for the end of the blocks and keep the interpreter from exiting
+            failed.set()
+            pool.terminate()
+            pool.join()
+            writer.terminate()
+        writer.join()
+    if writer.exitcode != 0:
+        raise RuntimeError("HDF5 writer process failed with exit code " + str(writer.exitcode))
+
+
+if __name__ == '__main__':
+    config = get_args()
+    print("ouput file:", config.output_file)
+    compression = Compression.parse(config.compression)
+    selection = None if config.selection is None else EventSelection(config.selection)
+    profiler = NULL_PROFILER if config.profile is None else Profiler(config.report_interval)
+    manifest = None
+    if config.manifest is not None:
+        manifest = Manifest(config.manifest)
+        if manifest.is_converted(config.input_files, config.output_file):
+            print("Output is already converted from the same input files according to manifest", config.manifest)
+            exit(0)
+    if config.workers > 1:
+        convert_parallel(config.input_files, config.output_file, config.block_size, config.workers,
+                         config.sparse, config.resume, profiler, compression, selection)
+    else:
+        convert_serial(config.input_files, config.output_file, config.block_size, config.sparse, config.resume,
+                       profiler, compression, selection)
+    if manifest is not None:
+        manifest.record(config.input_files, config.output_file)
+    if config.profile is not None:
+        profiler.dump(config.profile)
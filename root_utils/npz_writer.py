@@ -0,0 +1,107 @@
+"""
+Incremental writer of .npz files, for outputs too large to hold in memory before saving
+
+Each array is built up by appending chunks of rows, which are spooled to one raw file per array in a directory next to
+the output. When the writer is closed, each spooled array is streamed into the .npz archive with its codec (see
+compression.py), so that with the default zlib codec the result can be read with np.load exactly like a file written by
+np.savez_compressed.
+
+The writer can save a checkpoint of the arrays written so far, with some state of the caller. A writer created with
+resume=True after the process was killed continues from the last checkpoint, discarding anything appended after it.
+"""
+
+import json
+import os
+import shutil
+import zipfile
+
+import numpy as np
+
+from root_utils.compression import as_compression, block_rows, write_member
+
+
+class NpzStreamWriter:
+    def __init__(self, filename, compression=None, resume=False):
+        self.filename = filename
+        self.compression = as_compression(compression)
+        self.spool_dir = filename + ".parts"
+        # name -> [dtype, shape of each row, number of rows]
+        self.arrays = {}
+        # State saved by the caller with the checkpoint that was resumed from, if any
+        self.state = self.restore() if resume else None
+        if self.state is None:
+            # Discard anything spooled by an earlier run that is not being resumed
+            if os.path.isdir(self.spool_dir):
+                shutil.rmtree(self.spool_dir)
+            os.makedirs(self.spool_dir)
+
+    def spool_file(self, name):
+        return os.path.join(self.spool_dir, name + ".raw")
+
+    @staticmethod
+    def read_checkpoint(filename):
+        """Returns the contents of the last checkpoint of the output filename, or None if there is none"""
+        checkpoint_file = os.path.join(filename + ".parts", "checkpoint.json")
+        if not os.path.isfile(checkpoint_file):
+            return None
+        with open(checkpoint_file) as f:
+            return json.load(f)
+
+    def checkpoint(self, state):
+        """Records the arrays written so far, together with the caller's state, which must be JSON serializable"""
+        arrays = {name: [np.lib.format.dtype_to_descr(dtype), list(row_shape), rows]
+                  for name, (dtype, row_shape, rows) in self.arrays.items()}
+        checkpoint_file = os.path.join(self.spool_dir, "checkpoint.json")
+        with open(checkpoint_file + ".tmp", "w") as f:
+            json.dump({"arrays": arrays, "state": state}, f)
+        os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+    def restore(self):
+        """Truncates the spooled arrays back to the last checkpoint, returning its state, or None if there is none"""
+        checkpoint = self.read_checkpoint(self.filename)
+        if checkpoint is None:
+            return None
+        for name, (descr, row_shape, rows) in checkpoint["arrays"].items():
+            dtype = np.lib.format.descr_to_dtype(descr)
+            row_shape = tuple(row_shape)
+            os.truncate(self.spool_file(name), rows * dtype.itemsize * int(np.prod(row_shape)))
+            self.arrays[name] = [dtype, row_shape, rows]
+        for spooled in os.listdir(self.spool_dir):
+            name, ext = os.path.splitext(spooled)
+            if ext == ".raw" and name not in self.arrays:
+                os.remove(os.path.join(self.spool_dir, spooled))
+        return checkpoint["state"]
+
+    def append(self, **arrays):
+        """Appends rows to the end of each named array, creating the array if this is its first chunk"""
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            if name not in self.arrays:
+                if array.dtype.hasobject:
+                    raise TypeError("Cannot stream object array " + name + " to npz file")
+                self.arrays[name] = [array.dtype, array.shape[1:], 0]
+            dtype, row_shape, rows = self.arrays[name]
+            if array.shape[1:] != row_shape:
+                raise ValueError("Chunk of array " + name + " has shape " + str(array.shape)
+                                 + " but rows of shape " + str(row_shape) + " were expected")
+            with open(self.spool_file(name), "ab") as f:
+                np.ascontiguousarray(array, dtype=dtype).tofile(f)
+            self.arrays[name][2] = rows + array.shape[0]
+
+    @staticmethod
+    def spooled_blocks(f, dtype, row_shape, rows):
+        """Yields the rows of an array spooled to the open file f, in the blocks compressed by write_member"""
+        rows_per_block = block_rows(dtype, row_shape)
+        items_per_row = int(np.prod(row_shape, dtype=np.int64))
+        for start in range(0, rows, rows_per_block):
+            count = min(rows_per_block, rows - start)
+            yield np.fromfile(f, dtype=dtype, count=count * items_per_row).reshape((count,) + row_shape)
+
+    def close(self):
+        """Writes the spooled arrays to the output .npz file and removes the spool directory"""
+        with zipfile.ZipFile(self.filename, mode="w", allowZip64=True) as npz:
+            for name, (dtype, row_shape, rows) in self.arrays.items():
+                with open(self.spool_file(name), "rb") as f:
+                    write_member(npz, name, self.compression.codec(name), dtype, (rows,) + row_shape,
+                                 self.spooled_blocks(f, dtype, row_shape, rows))
+        shutil.rmtree(self.spool_dir)
@@ -0,0 +1,130 @@
+"""
+Opt-in instrumentation of the conversion tools
+
+A Profiler accumulates the wall time, number of calls, number of items processed and resident memory of each named
+stage of a conversion, prints a periodic events/s progress line, and can write everything to a JSON file at the end.
+Code that is instrumented but not being profiled uses NULL_PROFILER, whose methods do nothing.
+"""
+
+import functools
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+
+def rss_mb():
+    """Returns the current resident memory of the process in MB, or the peak if the current value is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+class Profiler:
+    """
+    Parameters
+    ----------
+    report_interval : float
+        Minimum number of seconds between progress lines printed by progress, or None to not print them
+    """
+
+    def __init__(self, report_interval=30.):
+        self.report_interval = report_interval
+        self.start_time = time.perf_counter()
+        self.last_report_time = self.start_time
+        self.last_report_events = 0
+        self.events = 0
+        # stage name -> {"seconds", "calls", "items", "max_rss_mb"}
+        self.stages = {}
+
+    def record(self, name, seconds, items=0):
+        stage = self.stages.setdefault(name, {"seconds": 0., "calls": 0, "items": 0, "max_rss_mb": 0.})
+        stage["seconds"] += seconds
+        stage["calls"] += 1
+        stage["items"] += int(items)
+        stage["max_rss_mb"] = max(stage["max_rss_mb"], rss_mb())
+
+    @contextmanager
+    def stage(self, name, items=0):
+        """Context manager timing one call of a stage that processes the given number of items"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, items)
+
+    def progress(self, events):
+        """Counts events as processed, printing a progress line if report_interval has passed since the last one"""
+        self.events += events
+        now = time.perf_counter()
+        if self.report_interval is None or now - self.last_report_time < self.report_interval:
+            return
+        rate = (self.events - self.last_report_events) / (now - self.last_report_time)
+        print("[profile] {} events, {:.1f} events/s (overall {:.1f} events/s), RSS {:.0f} MB".format(
+            self.events, rate, self.events / (now - self.start_time), rss_mb()), flush=True)
+        self.last_report_time = now
+        self.last_report_events = self.events
+
+    def summary(self):
+        wall = time.perf_counter() - self.start_time
+        return {
+            "command": sys.argv,
+            "wall_seconds": wall,
+            "events": self.events,
+            "events_per_second": self.events / wall if wall > 0 else 0.,
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+            "stages": self.stages
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        print("[profile] {} events in {:.1f} s, {:.1f} events/s, peak RSS {:.0f} MB".format(
+            summary["events"], summary["wall_seconds"], summary["events_per_second"], summary["max_rss_mb"]))
+        print("[profile] {:<28}{:>12}{:>10}{:>12}{:>12}".format("stage", "seconds", "calls", "items", "RSS MB"))
+        for name, stage in sorted(self.stages.items(), key=lambda s: -s[1]["seconds"]):
+            print("[profile] {:<28}{:>12.3f}{:>10}{:>12}{:>12.0f}".format(
+                name, stage["seconds"], stage["calls"], stage["items"], stage["max_rss_mb"]))
+
+    def dump(self, filename):
+        """Prints the summary of all stages and writes it to a JSON file"""
+        self.print_summary()
+        with open(filename, "w") as f:
+            json.dump(self.summary(), f, indent=1)
+
+
+class NullProfiler:
+    """Profiler that records nothing"""
+
+    def record(self, name, seconds, items=0):
+        pass
+
+    @contextmanager
+    def stage(self, name, items=0):
+        yield
+
+    def progress(self, events):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def profiled(name, items=None):
+    """
+    Decorator timing a method as the stage name of the profiler attribute of its object, with the number of items
+    processed given by calling items on the method's return value
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.profiler is NULL_PROFILER:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            self.profiler.record(name, time.perf_counter() - start, 0 if items is None else items(result))
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,71 @@
+"""
+Utilities for per-event variable length data stored in a flat (CSR) layout
+
+A field with a different number of entries per event (e.g. hits) is stored as one array of the values of all events
+concatenated, together with an offsets array shared by the fields of the same family, where the values of event i are
+values[offsets[i]:offsets[i+1]].
+"""
+
+import numpy as np
+
+
+def offsets_from_counts(counts):
+    """Returns the array of offsets of each segment, with a final entry for the total, given the segment lengths"""
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def concatenate_offsets(offsets_list):
+    """Returns the offsets of consecutive ranges of events joined together, given the offsets of each range"""
+    counts = [np.diff(o) for o in offsets_list]
+    return offsets_from_counts(np.concatenate(counts) if counts else [])
+
+
+def event_range(values, offsets, start, stop):
+    """Returns the values of events start to stop-1 and their offsets relative to the first value"""
+    return values[offsets[start]:offsets[stop]], offsets[start:stop+1] - offsets[start]
+
+
+def gather_segments(starts, counts):
+    """Returns the indices of all elements of the segments with given starts and lengths, in segment order"""
+    segment_offsets = offsets_from_counts(counts)
+    return np.repeat(starts - segment_offsets[:-1], counts) + np.arange(segment_offsets[-1])
+
+
+def gather_events(values, offsets, events):
+    """Returns the values of the given list of events, in that order, and their offsets relative to the first value"""
+    counts = offsets[np.asarray(events) + 1] - offsets[events]
+    return values[gather_segments(offsets[events], counts)], offsets_from_counts(counts)
+
+
+def event_index(offsets):
+    """Returns the index of the event of each value"""
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def segment_argmin(values, offsets):
+    """Returns the index within each segment of its smallest value, the first in case of ties, or -1 if it is empty"""
+    event = event_index(offsets)
+    # lexsort is stable, so ties go to the lowest index
+    order = np.lexsort((values, event))
+    counts = np.diff(offsets)
+    first = np.full(len(counts), -1, dtype=np.int64)
+    not_empty = counts > 0
+    first[not_empty] = order[offsets[:-1][not_empty]] - offsets[:-1][not_empty]
+    return first
+
+
+def from_object_array(array):
+    """Converts an object array of one array per event, as in old event_dump outputs, to values and offsets"""
+    offsets = offsets_from_counts([len(a) for a in array])
+    if len(array) == 0:
+        return np.empty(0), offsets
+    return np.concatenate(array), offsets
+
+
+def load_field(npz_file, name, offsets_name):
+    """Returns the values and offsets of a per-event field of an event_dump output file in either layout"""
+    if offsets_name in npz_file:
+        return npz_file[name], npz_file[offsets_name]
+    return from_object_array(npz_file[name])
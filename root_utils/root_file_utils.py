@@ -1,54 +1,285 @@
-import ROOT
+import hashlib
 import os
 import numpy as np
+from root_utils.profiling import NULL_PROFILER, profiled
+from root_utils.geometry import cached_geometry, read_pmts
+from root_utils.ragged_utils import offsets_from_counts, gather_events
 
-ROOT.gSystem.Load(os.environ['WCSIMDIR'] + "/libWCSimRoot.so")
+
+wcsim_library_loaded = False
+
+
+def load_root():
+    """
+    Imports ROOT in batch mode and loads libWCSimRoot, if not already done, and returns the ROOT module
+
+    This is deferred until ROOT is first used, so that tools that only need the numpy parts of root_utils start without
+    the cost of initializing ROOT, and work where ROOT or WCSim is not available.
+    """
+    global wcsim_library_loaded
+    import ROOT as root
+    if not wcsim_library_loaded:
+        if "WCSIMDIR" not in os.environ:
+            raise RuntimeError("WCSIMDIR must be set to the WCSim build directory to read WCSim files with ROOT")
+        root.gROOT.SetBatch(True)
+        if root.gSystem.Load(os.path.join(os.environ['WCSIMDIR'], "libWCSimRoot.so")) < 0:
+            raise RuntimeError("Failed to load libWCSimRoot.so from " + os.environ['WCSIMDIR'])
+        wcsim_library_loaded = True
+    return root
+
+
+class LazyROOT:
+    """Stand-in for the ROOT module that calls load_root the first time any of its attributes is used"""
+    def __getattr__(self, name):
+        return getattr(load_root(), name)
+
+
+ROOT = LazyROOT()
+
+# Arrays filled by extract_range for each family of fields, with their dtypes
+EXTRACT_ARRAYS = {
+    "triggers": {
+        "trigger_offsets": np.int64,
+        "trigger_time": np.float64,
+        "trigger_ndigihits": np.int32
+    },
+    "digi_hits": {
+        "digi_hit_offsets": np.int64,
+        "digi_hit_pmt": np.int32,
+        "digi_hit_charge": np.float64,
+        "digi_hit_time": np.float64,
+        "digi_hit_trigger": np.int32
+    },
+    "true_hits": {
+        "true_hit_offsets": np.int64,
+        "true_hit_pmt": np.int32,
+        "true_hit_time": np.float64,
+        "true_hit_pos": np.float64,
+        "true_hit_start_time": np.float64,
+        "true_hit_start_pos": np.float64,
+        "true_hit_parent": np.int32,
+        "true_hit_trigger": np.int32
+    },
+    "tracks": {
+        "track_offsets": np.int64,
+        "track_id": np.int32,
+        "track_pid": np.int32,
+        "track_start_time": np.float64,
+        "track_energy": np.float64,
+        "track_momentum": np.float64,
+        "track_direction": np.float64,
+        "track_start_position": np.float64,
+        "track_stop_position": np.float64,
+        "track_parent": np.int32,
+        "track_flag": np.int32,
+        "track_trigger": np.int32
+    }
+}
+EXTRACT_VECTORS = {"true_hit_pos", "true_hit_start_pos", "track_direction", "track_start_position",
+                   "track_stop_position"}
+EXTRACT_FIELDS = tuple(EXTRACT_ARRAYS.keys())
+EXTRACT_TYPES = {name: dtype for arrays in EXTRACT_ARRAYS.values() for name, dtype in arrays.items()}
+
+# Fields returned by get_hit_photons, with the array of the true_hits family of extract_range holding each
+PHOTON_FIELDS = {
+    "start_position": "true_hit_start_pos",
+    "end_position": "true_hit_pos",
+    "start_time": "true_hit_start_time",
+    "end_time": "true_hit_time",
+    "track": "true_hit_parent",
+    "pmt": "true_hit_pmt",
+    "trigger": "true_hit_trigger"
+}
+# Photon fields only stored by the new tracking branch of WCSim, which are zero for files without them
+PHOTON_POSITION_FIELDS = ("start_position", "end_position", "start_time")
+
+# Branch of the events tree holding the events read by WCSim, other branches (e.g. the OD events of hybrid detectors)
+# are switched off
+EVENT_BRANCH = "wcsimrootevent"
+# Size in bytes of the read-ahead cache (TTreeCache) of the events tree, which fetches the baskets of many consecutive
+# entries in one read instead of one read per entry
+TREE_CACHE_SIZE = 64 * 1024 * 1024
+
+
+def check_fields(fields):
+    """Returns the requested families of fields as a tuple in the order of EXTRACT_FIELDS, checking they all exist"""
+    unknown = set(fields) - set(EXTRACT_FIELDS)
+    if unknown:
+        raise ValueError("Unknown fields " + ", ".join(sorted(unknown)) + ", expected some of "
+                         + ", ".join(EXTRACT_FIELDS))
+    return tuple(f for f in EXTRACT_FIELDS if f in fields)
+
+
+def load_extract_kernel():
+    """Compiles the C++ batch extraction code used by WCSim.extract_range, if not already done"""
+    if hasattr(ROOT, "wcsim_extract"):
+        return
+    ROOT.gInterpreter.AddIncludePath(os.path.join(os.environ['WCSIMDIR'], "include"))
+    if hasattr(ROOT.WCSimRootCherenkovHitTime, "GetPhotonStartPos"):  # Only in new tracking branch of WCSim
+        ROOT.gInterpreter.Declare("#define WCSIM_PHOTON_POSITIONS")
+    kernel = os.path.join(os.path.dirname(os.path.abspath(__file__)), "WCSimExtract.C")
+    if not ROOT.gInterpreter.Declare('#include "' + kernel + '"'):
+        raise RuntimeError("Failed to compile " + kernel)
+
+
+def copy_arrays(data, names):
+    """Returns numpy copies of the named vectors of a wcsim_extract.RangeData, with vector quantities of shape (n, 3)"""
+    arrays = {}
+    for name in names:
+        vector = getattr(data, name)
+        array = np.empty(vector.size(), dtype=EXTRACT_TYPES[name])
+        ROOT.wcsim_extract.copy_to(vector, array)
+        arrays[name] = array.reshape(-1, 3) if name in EXTRACT_VECTORS else array
+    return arrays
+
+
+def take_events(data, events):
+    """Returns the arrays returned by extract_range for the given list of its events, in that order"""
+    taken = {}
+    for arrays in EXTRACT_ARRAYS.values():
+        offsets_name = next(iter(arrays))
+        if offsets_name not in data:
+            continue
+        offsets = data[offsets_name]
+        for name in arrays:
+            if name != offsets_name:
+                taken[name], taken[offsets_name] = gather_events(data[name], offsets, events)
+    return taken
+
+
+def count_entries(filename, tree_name="wcsimT"):
+    """Returns the number of entries of a tree in a ROOT file, reading only the tree header"""
+    file = ROOT.TFile.Open(filename, "read")
+    nentries = file.Get(tree_name).GetEntries()
+    file.Close()
+    return nentries
 
 
 class WCSim:
-    def __init__(self, tree):
+    # Replaced by a Profiler to record the time spent in each method
+    profiler = NULL_PROFILER
+
+    def __init__(self, tree, fields=EXTRACT_FIELDS, cache_size=TREE_CACHE_SIZE):
+        """
+        Reads the events of tree, extracting the given families of fields of EXTRACT_ARRAYS by default. Only the events
+        branch is read, through a read-ahead cache of cache_size bytes, or without a cache if cache_size is 0.
+        """
+        self.fields = check_fields(fields)
         print("number of entries in the geometry tree: " + str(self.geotree.GetEntries()))
         self.geotree.GetEntry(0)
         self.geo = self.geotree.wcsimrootgeom
         self.num_pmts = self.geo.GetWCNumPMT()
+        self.load_pmt_geometry()
         self.tree = tree
         self.nevent = self.tree.GetEntries()
         print("number of entries in the tree: " + str(self.nevent))
-        # Get first event and trigger to prevent segfault when later deleting trigger to prevent memory leak
-        self.tree.GetEvent(0)
+        self.prune_branches()
+        self.set_cache(cache_size)
+        self.own_event()
         self.current_event = 0
-        self.event = self.tree.wcsimrootevent
-        self.ntrigger = self.event.GetNumberOfEvents()
-        self.trigger = self.event.GetTrigger(0)
-        self.current_trigger = 0
+        if self.nevent > 0:
+            self.tree.GetEvent(0)
+            self.read_trigger_table()
+            self.get_trigger(0)
+        else:
+            # An event object that never read an entry has no list of triggers to ask for, so the table is left empty
+            self.ntrigger = 0
+            self.triggers = []
+            self.trigger_times = np.zeros(0, dtype=np.float64)
+            self.trigger_ndigihits = np.zeros(0, dtype=np.int32)
+            self.first_trigger = -1
+            self.trigger = None
+            self.current_trigger = 0
+
+    def own_event(self):
+        """
+        Reads events into an event object owned by this reader, rather than one owned by the tree. Reading an event
+        allocates new triggers without deleting the previous ones, which then leak unless deleted by release_triggers.
+        A tree deletes its own event object along with it when a chain moves on to the next file, so the previous
+        triggers could not safely be deleted then, but an event object set with SetBranchAddress is never deleted by
+        the tree and is kept across file changes.
+        """
+        self.event = ROOT.WCSimRootEvent()
+        self.tree.SetBranchAddress(EVENT_BRANCH, ROOT.AddressOf(self.event))
+
+    def prune_branches(self):
+        """
+        Switches off all branches of the events tree except the events branch, so that reading an entry does not
+        decompress them. The families of fields within an event are streamed together in the events branch, so fields
+        not requested are still read from the file but are skipped by extract_range.
+        """
+        for branch in self.tree.GetListOfBranches() or []:
+            if branch.GetName() != EVENT_BRANCH:
+                self.tree.SetBranchStatus(branch.GetName(), False)
+
+    def set_cache(self, cache_size):
+        """Sets up the read-ahead cache of the events branch, which a chain keeps for each file it moves on to"""
+        self.tree.SetCacheSize(cache_size)
+        if cache_size > 0:
+            self.tree.AddBranchToCache(EVENT_BRANCH, True)
+            # The cached branches are already known, so there is no need to learn them from the first entries read
+            self.tree.StopCacheLearningPhase()
+
+    def release_triggers(self, previous):
+        """Deletes the triggers in previous that were not reused by the event that has since been read"""
+        current = {ROOT.addressof(self.event.GetTrigger(i)) for i in range(self.event.GetNumberOfEvents())}
+        for trigger in previous:
+            if ROOT.addressof(trigger) not in current:
+                trigger.Delete()
+
+    def geometry_key(self):
+        """
+        Returns the hash identifying the detector configuration, under which its geometry is cached: the MD5 of the
+        geometry object as streamed by ROOT, computed without the compiled extraction code, which this does not need
+        """
+        buffer = ROOT.TBufferFile(ROOT.TBuffer.kWrite)
+        self.geo.Streamer(buffer)
+        # Read the streamed bytes back into a numpy array, a char* return value would be converted to a python string
+        streamed = np.empty(buffer.Length(), dtype=np.uint8)
+        buffer.SetReadMode()
+        buffer.SetBufferOffset(0)
+        buffer.ReadFastArray(streamed, len(streamed))
+        return hashlib.md5(streamed.tobytes()).hexdigest()
+
+    def load_pmt_geometry(self):
+        # Load all PMT positions once so that hit positions can be gathered with a single fancy-index per event
+        self.geometry = cached_geometry(self.geometry_key(), lambda: read_pmts(self.geo))
+        self.pmt_tube_no = self.geometry["tube_no"]
+        self.pmt_positions = self.geometry["position"]
+        self.pmt_orientations = self.geometry["orientation"]
 
+    @profiled("get_event")
     def get_event(self, ev):
-        # Delete previous triggers to prevent memory leak (only if file does not change)
-        triggers = [self.event.GetTrigger(i) for i in range(self.ntrigger)]
-        oldfile = self.tree.GetCurrentFile()
-        self.tree.GetEvent(ev)
-        if self.tree.GetCurrentFile() == oldfile:
-            [t.Delete() for t in triggers]
+        # Delete the previous event's triggers once the new event is read, to prevent memory leak (see own_event)
+        triggers = self.triggers
+        with self.profiler.stage("tree.GetEvent"):
+            self.tree.GetEvent(ev)
+        self.release_triggers(triggers)
         self.current_event = ev
-        self.event = self.tree.wcsimrootevent
+        self.read_trigger_table()
+
+    def read_trigger_table(self):
+        """
+        Reads the table of the triggers of the current event once, for reuse by get_trigger and the extractors: the
+        trigger objects, their times and numbers of digitized hits, and the index of the earliest trigger, or -1 if the
+        event has no triggers
+        """
         self.ntrigger = self.event.GetNumberOfEvents()
+        self.triggers = [self.event.GetTrigger(i) for i in range(self.ntrigger)]
+        self.trigger_times = np.array([t.GetHeader().GetDate() for t in self.triggers], dtype=np.float64)
+        self.trigger_ndigihits = np.array([t.GetNcherenkovdigihits() for t in self.triggers], dtype=np.int32)
+        self.first_trigger = int(np.argmin(self.trigger_times)) if self.ntrigger > 0 else -1
 
     def get_trigger(self, trig):
-        self.trigger = self.event.GetTrigger(trig)
+        # Events without triggers still give WCSimRootEvent's own answer for trigger 0
+        self.trigger = self.triggers[trig] if trig < self.ntrigger else self.event.GetTrigger(trig)
         self.current_trigger = trig
         return self.trigger
 
     def get_first_trigger(self):
-        first_trigger = 0
-        first_trigger_time = 9999999.0
-        for index in range(self.ntrigger):
-            self.get_trigger(index)
-            trigger_time = self.trigger.GetHeader().GetDate()
-            if trigger_time < first_trigger_time:
-                first_trigger_time = trigger_time
-                first_trigger = index
-        return self.get_trigger(first_trigger)
+        return self.get_trigger(max(self.first_trigger, 0))
 
+    @profiled("get_truth_info")
     def get_truth_info(self):  # deprecated: should now use get_event_info instead, leaving here for use with old files
         self.get_trigger(0)
         tracks = self.trigger.GetTracks()
@@ -65,6 +296,7 @@ class WCSim:
                 energy.append(tracks[i].GetE())
         return direction, energy, pid, position
 
+    @profiled("get_event_info")
     def get_event_info(self):
         self.get_trigger(0)
         tracks = self.trigger.GetTracks()
@@ -105,95 +337,81 @@ class WCSim:
             "energy": sum(p.GetE() for p in particles)  # sum of energies
         }
 
-    def get_digitized_hits(self):
-        position = []
+    @profiled("get_digitized_hits", lambda hits: len(hits["pmt"]))
+    def get_digitized_hits(self, positions=True):
         charge = []
         time = []
         pmt = []
         trigger = []
-        for t in range(self.ntrigger):
-            self.get_trigger(t)
-            for hit in self.trigger.GetCherenkovDigiHits():
+        for t, event_trigger in enumerate(self.triggers):
+            if self.trigger_ndigihits[t] == 0:
+                continue
+            for hit in event_trigger.GetCherenkovDigiHits():
                 pmt_id = hit.GetTubeId() - 1
-                position.append([self.geo.GetPMT(pmt_id).GetPosition(j) for j in range(3)])
                 charge.append(hit.GetQ())
                 time.append(hit.GetT())
                 pmt.append(pmt_id)
                 trigger.append(t)
         hits = {
-            "position": np.asarray(position, dtype=np.float64),
             "charge": np.asarray(charge, dtype=np.float64),
             "time": np.asarray(time, dtype=np.float64),
             "pmt": np.asarray(pmt, dtype=np.int32),
             "trigger": np.asarray(trigger, dtype=np.int32)
         }
+        if positions:
+            hits["position"] = self.pmt_positions[hits["pmt"]]
         return hits
 
-    def get_true_hits(self):
-        position = []
+    @profiled("get_true_hits", lambda hits: len(hits["pmt"]))
+    def get_true_hits(self, positions=True):
         track = []
         pmt = []
         PE = []
         trigger = []
-        for t in range(self.ntrigger):
-            self.get_trigger(t)
-            for hit in self.trigger.GetCherenkovHits():
+        for t, event_trigger in enumerate(self.triggers):
+            hit_times = event_trigger.GetCherenkovHitTimes()
+            for hit in event_trigger.GetCherenkovHits():
                 pmt_id = hit.GetTubeID() - 1
                 tracks = set()
                 for j in range(hit.GetTotalPe(0), hit.GetTotalPe(0)+hit.GetTotalPe(1)):
-                    pe = self.trigger.GetCherenkovHitTimes().At(j)
+                    pe = hit_times.At(j)
                     tracks.add(pe.GetParentID())
-                position.append([self.geo.GetPMT(pmt_id).GetPosition(k) for k in range(3)])
                 track.append(tracks.pop() if len(tracks) == 1 else -2)
                 pmt.append(pmt_id)
                 PE.append(hit.GetTotalPe(1))
                 trigger.append(t)
         hits = {
-            "position": np.asarray(position, dtype=np.float64),
             "track": np.asarray(track, dtype=np.int32),
             "pmt": np.asarray(pmt, dtype=np.int32),
             "PE": np.asarray(PE, dtype=np.int32),
             "trigger": np.asarray(trigger, dtype=np.int32)
         }
+        if positions:
+            hits["position"] = self.pmt_positions[hits["pmt"]]
         return hits
 
-    def get_hit_photons(self):
-        start_position = []
-        end_position = []
-        start_time = []
-        end_time = []
-        track = []
-        pmt = []
-        trigger = []
-        for t in range(self.ntrigger):
-            self.get_trigger(t)
-            for hit in self.trigger.GetCherenkovHits():
-                pmt_id = hit.GetTubeID() - 1
-                for j in range(hit.GetTotalPe(0), hit.GetTotalPe(0)+hit.GetTotalPe(1)):
-                    pe = self.trigger.GetCherenkovHitTimes().At(j)
-                    try:  # Only works with new tracking branch of WCSim
-                        start_position.append([pe.GetPhotonStartPos(j)/10 for j in range(3)])
-                        end_position.append([pe.GetPhotonEndPos(j)/10 for j in range(3)])
-                        start_time.append(pe.GetPhotonStartTime())
-                    except AttributeError:
-                        start_position.append([0, 0, 0])
-                        end_position.append([0, 0, 0])
-                        start_time.append(0)
-                    end_time.append(pe.GetTruetime())
-                    track.append(pe.GetParentID())
-                    pmt.append(pmt_id)
-                    trigger.append(t)
-        photons = {
-            "start_position": np.asarray(start_position, dtype=np.float64),
-            "end_position": np.asarray(end_position, dtype=np.float64),
-            "start_time": np.asarray(start_time, dtype=np.float64),
-            "end_time": np.asarray(end_time, dtype=np.float64),
-            "track": np.asarray(track, dtype=np.int32),
-            "pmt": np.asarray(pmt, dtype=np.int32),
-            "trigger": np.asarray(trigger, dtype=np.int32)
-        }
-        return photons
+    def extract_photons(self, positions=True):
+        """
+        Returns the arrays of the true_hits family of extract_range for the photons of the current event, leaving out
+        the start and end points and start times unless positions is True
+        """
+        load_extract_kernel()
+        data = ROOT.wcsim_extract.RangeData()
+        ROOT.wcsim_extract.extract_photons(self.event, positions, data)
+        position_arrays = {PHOTON_FIELDS[f] for f in PHOTON_POSITION_FIELDS}
+        return copy_arrays(data, [n for n in EXTRACT_ARRAYS["true_hits"]
+                                  if n != "true_hit_offsets" and (positions or n not in position_arrays)])
 
+    @profiled("get_hit_photons", lambda photons: len(next(iter(photons.values()), [])))
+    def get_hit_photons(self, fields=tuple(PHOTON_FIELDS)):
+        """
+        Returns the requested fields of all photons of the current event, extracted in one pass of compiled code. Only
+        asking for the fields that are needed avoids copying the start and end points, which are most of the data.
+        """
+        arrays = self.extract_photons(any(f in PHOTON_POSITION_FIELDS for f in fields))
+        return {f: arrays[PHOTON_FIELDS[f]] for f in fields}
+
+    @profiled("get_tracks", lambda tracks: len(tracks["id"]))
     def get_tracks(self):
         id = []
         pid = []
@@ -203,9 +421,8 @@ class WCSim:
         stop_position = []
         parent = []
         flag = []
-        for t in range(self.ntrigger):
-            self.get_trigger(t)
-            for track in self.trigger.GetTracks():
+        for event_trigger in self.triggers:
+            for track in event_trigger.GetTracks():
                 id.append(track.GetId())
                 pid.append(track.GetIpnu())
                 start_time.append(track.GetTime())
@@ -226,33 +443,119 @@ class WCSim:
         }
         return tracks
 
+    @profiled("get_trigger_times")
     def get_trigger_times(self):
-        trigger_times = np.empty(self.ntrigger, dtype=np.float64)
-        for t in range(self.ntrigger):
-            self.get_trigger(t)
-            trigger_times[t] = self.trigger.GetHeader().GetDate()
-        return trigger_times
+        return self.trigger_times.copy()
+
+    def extract_range(self, start, stop, fields=None):
+        """
+        Extracts the requested families of fields of events start to stop-1 in one pass of compiled C++ code, by default
+        the families the reader was created with
+
+        Returns a dictionary of flat arrays named as in EXTRACT_ARRAYS, where each family's offsets array gives the
+        index of the first element of each event, with a final entry for the total. Vector quantities have shape (n, 3).
+        """
+        fields = self.fields if fields is None else check_fields(fields)
+        load_extract_kernel()
+        data = ROOT.wcsim_extract.RangeData()
+        with self.profiler.stage("extract_range", stop - start):
+            ROOT.wcsim_extract.extract_range(self.tree, start, stop,
+                                             "digi_hits" in fields, "true_hits" in fields, "tracks" in fields, data)
+        if stop > start:
+            # The event object is left at the last event of the range with its triggers still alive
+            self.current_event = stop - 1
+            self.read_trigger_table()
+            self.get_trigger(0)
+        with self.profiler.stage("extract_range.copy", stop - start):
+            return copy_arrays(data, [name for field in fields for name in EXTRACT_ARRAYS[field]])
+
+    def extract_entries(self, entries, fields=None):
+        """Returns the same arrays as extract_range for a list of events, in that order, read in one pass"""
+        fields = self.fields if fields is None else check_fields(fields)
+        entries = np.ascontiguousarray(entries, dtype=np.int64)
+        load_extract_kernel()
+        data = ROOT.wcsim_extract.RangeData()
+        with self.profiler.stage("extract_entries", len(entries)):
+            ROOT.wcsim_extract.extract_entries(self.tree, entries, len(entries), "digi_hits" in fields,
+                                               "true_hits" in fields, "tracks" in fields, data)
+        if len(entries) > 0:
+            self.current_event = int(entries[-1])
+            self.read_trigger_table()
+            self.get_trigger(0)
+        with self.profiler.stage("extract_entries.copy", len(entries)):
+            return copy_arrays(data, [name for field in fields for name in EXTRACT_ARRAYS[field]])
 
 
 class WCSimFile(WCSim):
-    def __init__(self, filename):
+    def __init__(self, filename, fields=EXTRACT_FIELDS, cache_size=TREE_CACHE_SIZE):
         self.file = ROOT.TFile(filename, "read")
         tree = self.file.Get("wcsimT")
         self.geotree = self.file.Get("wcsimGeoT")
-        super().__init__(tree)
+        super().__init__(tree, fields, cache_size)
 
     def __del__(self):
+        # Stop the tree writing into the event object owned by this reader before both are deleted
+        self.tree.ResetBranchAddresses()
         self.file.Close()
 
 
 class WCSimChain(WCSim):
-    def __init__(self, filenames):
+    """
+    Reads a list of WCSim files as one sequence of events
+
+    Unless the number of entries of each file is already known and given as entries, every file is opened once when the
+    chain is created to read its number of entries from the tree header. The first file is also kept open for the
+    geometry. Global event numbers are mapped to a file and the entry within it by binary search over the cumulative
+    entries, so looking up an event does not open any other file.
+    """
+    def __init__(self, filenames, entries=None, fields=EXTRACT_FIELDS, cache_size=TREE_CACHE_SIZE):
+        self.filenames = list(filenames)
+        if entries is None:
+            entries = [count_entries(f) for f in self.filenames]
+        self.file_entries = np.asarray(entries, dtype=np.int64)
+        # Global event number of the first event of each file, with a final entry for the total
+        self.file_offsets = offsets_from_counts(self.file_entries)
         self.chain = ROOT.TChain("wcsimT")
-        for file in filenames:
-            self.chain.Add(file)
-        self.file = self.GetFile()
+        for file, nentries in zip(self.filenames, self.file_entries):
+            self.chain.Add(file, int(nentries))
+        # The geometry is the same for all files of the chain, so it is read from the first
+        self.file = ROOT.TFile(self.filenames[0], "read")
         self.geotree = self.file.Get("wcsimGeoT")
-        super().__init__(self.chain)
+        super().__init__(self.chain, fields, cache_size)
+
+    def locate(self, ev):
+        """Returns the index of the file containing the global event number ev, and the event's entry in that file"""
+        if not 0 <= ev < self.nevent:
+            raise IndexError("Event " + str(ev) + " out of range for chain of " + str(self.nevent) + " events")
+        file_index = int(np.searchsorted(self.file_offsets, ev, side="right")) - 1
+        return file_index, int(ev - self.file_offsets[file_index])
+
+    def global_event(self, file_index, entry):
+        """Returns the global event number of an entry of one of the files of the chain"""
+        return int(self.file_offsets[file_index]) + entry
+
+    def iter_range(self, start=0, stop=None):
+        """Reads events start to stop-1 in order, yielding each event number once it is the current event"""
+        stop = self.nevent if stop is None else min(stop, self.nevent)
+        for ev in range(start, stop):
+            self.get_event(ev)
+            yield ev
+
+    def iter_events(self, events):
+        """
+        Reads each distinct event of a list of global event numbers, in chain order so that each file is opened only
+        once, yielding each event number once it is the current event
+        """
+        events = np.unique(np.asarray(events, dtype=np.int64))
+        if events.size > 0 and (events[0] < 0 or events[-1] >= self.nevent):
+            raise IndexError("Events out of range for chain of " + str(self.nevent) + " events")
+        for ev in events:
+            self.get_event(int(ev))
+            yield int(ev)
+
+    def __del__(self):
+        self.chain.ResetBranchAddresses()
+        self.file.Close()
 
 def get_label(infile):
     if "_gamma" in infile:
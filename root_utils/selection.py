@@ -0,0 +1,276 @@
+"""
+Selection of events by an expression over cheap per-event quantities, evaluated before their hits are extracted
+
+A selection is a python expression over the names of QUANTITIES, e.g.
+    "first_ndigihits > 0 and 100 < energy < 1000 and pid in (11, 13) and r < 300 and abs(y) < 250"
+using comparisons (including chained comparisons and in / not in a tuple of values), and, or, not, arithmetic and the
+functions of FUNCTIONS. It is evaluated on whole arrays of events at once. Each term of the top level "and" is a cut,
+and the cut flow counts how many events pass all cuts up to each one, which the conversion scripts store in their
+output as the CUT_NAMES and CUT_COUNTS arrays, the first count being of all events before any cut.
+
+The quantities are computed from the triggers and tracks families of WCSim.extract_range by range_quantities, so the
+events are selected before their hits and photons are extracted, or from the arrays of an event_dump.py output by
+npz_quantities.
+"""
+
+import ast
+import io
+import tokenize
+
+import numpy as np
+
+import root_utils.ragged_utils as ru
+from root_utils.truth_utils import range_event_info
+
+# Quantities that can be used in a selection, with the families of fields of WCSim.extract_range they are found from
+QUANTITIES = {
+    "ntriggers": ("triggers",),  # number of triggers
+    "ndigihits": ("triggers",),  # number of digitized hits of all triggers
+    "first_ndigihits": ("triggers",),  # number of digitized hits of the earliest trigger
+    "pid": ("tracks",),  # truth info of the event, as found by WCSim.get_event_info
+    "energy": ("tracks",),
+    "x": ("tracks",),  # vertex position, with y along the tank axis
+    "y": ("tracks",),
+    "z": ("tracks",),
+    "r": ("tracks",),  # distance of the vertex from the tank axis
+    "dir_x": ("tracks",),
+    "dir_y": ("tracks",),
+    "dir_z": ("tracks",)
+}
+FUNCTIONS = {"abs": np.abs, "sqrt": np.sqrt}
+CUT_NAMES = "cut_names"
+CUT_COUNTS = "cut_counts"
+
+COMPARISONS = {
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.In: lambda a, b: np.isin(a, b),
+    ast.NotIn: lambda a, b: ~np.isin(a, b)
+}
+# Literals are ast.Constant nodes from python 3.8, and ast.Num, ast.Str or ast.NameConstant nodes before
+LITERALS = ("Constant", "Num", "Str", "NameConstant")
+OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Mod: np.mod,
+    ast.Pow: np.power
+}
+
+
+def split_cuts(expression):
+    """
+    Returns the source of each term of the top level "and" of an expression, splitting it at the "and" tokens outside
+    of brackets other than those around the whole expression, since the end of each term's source is not recorded by
+    ast before python 3.8
+    """
+    line_starts = [0]
+    for line in expression.splitlines(True):
+        line_starts.append(line_starts[-1] + len(line))
+    # Each token with the number of brackets it is in, counting a bracket as outside itself
+    tokens = []
+    depth = 0
+    for token in tokenize.generate_tokens(io.StringIO(expression).readline):
+        if token.type in (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER, tokenize.COMMENT):
+            continue
+        if token.type == tokenize.OP and token.string in ")]}":
+            depth -= 1
+        tokens.append((token, depth))
+        if token.type == tokenize.OP and token.string in "([{":
+            depth += 1
+    split_depth = min(d for t, d in tokens if t.type == tokenize.NAME and t.string == "and")
+    cuts = []
+    start = end = None
+    for token, depth in tokens:
+        if depth < split_depth:
+            continue
+        if depth == split_depth and token.type == tokenize.NAME and token.string == "and":
+            cuts.append(expression[start:end])
+            start = None
+            continue
+        if start is None:
+            start = line_starts[token.start[0] - 1] + token.start[1]
+        end = line_starts[token.end[0] - 1] + token.end[1]
+    cuts.append(expression[start:end])
+    return cuts
+
+
+def truth_quantities(pid, position, direction, energy):
+    return {
+        "pid": pid,
+        "energy": energy,
+        "x": position[:, 0],
+        "y": position[:, 1],
+        "z": position[:, 2],
+        "r": np.hypot(position[:, 0], position[:, 2]),
+        "dir_x": direction[:, 0],
+        "dir_y": direction[:, 1],
+        "dir_z": direction[:, 2]
+    }
+
+
+def trigger_quantities(trigger_offsets, trigger_time, trigger_ndigihits, first_trigger=None):
+    nevents = len(trigger_offsets) - 1
+    if first_trigger is None:
+        first_trigger = ru.segment_argmin(trigger_time, trigger_offsets)
+    has_trigger = first_trigger >= 0
+    first_ndigihits = np.zeros(nevents, dtype=np.int64)
+    first_ndigihits[has_trigger] = trigger_ndigihits[trigger_offsets[:-1][has_trigger] + first_trigger[has_trigger]]
+    return {
+        "ntriggers": np.diff(trigger_offsets),
+        "ndigihits": np.bincount(ru.event_index(trigger_offsets), trigger_ndigihits, nevents).astype(np.int64),
+        "first_ndigihits": first_ndigihits
+    }
+
+
+def range_quantities(data, names):
+    """Returns the named quantities of the events of the arrays returned by WCSim.extract_range"""
+    quantities = {}
+    if any(QUANTITIES[n] == ("triggers",) for n in names):
+        quantities.update(trigger_quantities(data["trigger_offsets"], data["trigger_time"],
+                                             data["trigger_ndigihits"]))
+    if any(QUANTITIES[n] == ("tracks",) for n in names):
+        info = range_event_info(data)
+        quantities.update(truth_quantities(info["pid"], info["position"], info["direction"], info["energy"]))
+    return {n: quantities[n] for n in names}
+
+
+def npz_quantities(npz_file, names):
+    """Returns the named quantities of the events of an event_dump.py output file"""
+    quantities = {}
+    if any(QUANTITIES[n] == ("triggers",) for n in names):
+        if "trigger_ndigihits" in npz_file:
+            quantities.update(trigger_quantities(npz_file["trigger_offsets"], npz_file["trigger_time"],
+                                                 npz_file["trigger_ndigihits"], npz_file["first_trigger"]))
+        elif "trigger_time" in npz_file and "digi_hit_trigger" in npz_file:
+            # Files from older versions of event_dump, possibly with one object array per field, count the hits of
+            # each trigger from the trigger of each hit
+            trigger_time, trigger_offsets = ru.load_field(npz_file, "trigger_time", "trigger_offsets")
+            hit_trigger, hit_offsets = ru.load_field(npz_file, "digi_hit_trigger", "digi_hit_offsets")
+            hit_global_trigger = (trigger_offsets[ru.event_index(hit_offsets)] + hit_trigger).astype(np.int64)
+            trigger_hits = np.bincount(hit_global_trigger, minlength=trigger_offsets[-1])
+            quantities.update(trigger_quantities(trigger_offsets, trigger_time, trigger_hits))
+        else:
+            # Without the trigger times, the earliest trigger is unknown, so all hits of each event are counted as
+            # those of a single trigger
+            _, hit_offsets = ru.load_field(npz_file, 'digi_hit_time', 'digi_hit_offsets')
+            ndigihits = np.diff(hit_offsets)
+            quantities.update(ntriggers=np.ones_like(ndigihits), ndigihits=ndigihits, first_ndigihits=ndigihits)
+    if any(QUANTITIES[n] == ("tracks",) for n in names):
+        quantities.update(truth_quantities(npz_file["pid"], npz_file["position"], npz_file["direction"],
+                                           npz_file["energy"]))
+    return {n: quantities[n] for n in names}
+
+
+class EventSelection:
+    """
+    Selection of events by an expression (see the module docstring), with the cut flow of the events it was applied to
+
+    names are the quantities used by the expression, fields the families of fields of WCSim.extract_range needed to
+    compute them and cuts the source of each cut.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        tree = ast.parse(expression.strip(), mode="eval").body
+        terms = tree.values if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And) else [tree]
+        for node in ast.walk(tree):
+            self.check(node)
+        self.terms = terms
+        self.cuts = split_cuts(expression.strip()) if len(terms) > 1 else [expression.strip()]
+        self.names = sorted({n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and n.id not in FUNCTIONS})
+        if not self.names:
+            raise ValueError("Selection " + expression + " uses none of the quantities " + ", ".join(QUANTITIES))
+        for term, cut in zip(terms, self.cuts):
+            if not self.is_condition(term):
+                raise ValueError("Cut " + cut + " of selection is not a comparison or a boolean operation of them")
+        self.fields = tuple(sorted({f for n in self.names for f in QUANTITIES[n]}))
+
+    @staticmethod
+    def check(node):
+        allowed = ((ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd, ast.BinOp, ast.Compare,
+                    ast.Call, ast.Name, ast.Load, ast.Tuple, ast.List)
+                   + tuple(COMPARISONS) + tuple(OPERATORS))
+        if not isinstance(node, allowed) and type(node).__name__ not in LITERALS:
+            raise ValueError("Unsupported syntax in selection: " + ast.dump(node))
+        if isinstance(node, ast.Name) and node.id not in QUANTITIES and node.id not in FUNCTIONS:
+            raise ValueError("Unknown quantity " + node.id + " in selection, expected one of " + ", ".join(QUANTITIES))
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS
+                                               and len(node.args) == 1 and not node.keywords):
+            raise ValueError("Only the functions " + ", ".join(FUNCTIONS) + " of one argument can be used in selection")
+
+    @classmethod
+    def is_condition(cls, node):
+        """Returns whether a node gives a boolean for each event: a comparison, or and, or, not of conditions"""
+        if isinstance(node, ast.Compare):
+            return True
+        if isinstance(node, ast.BoolOp):
+            return all(cls.is_condition(v) for v in node.values)
+        return isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not) and cls.is_condition(node.operand)
+
+    def evaluate(self, node, quantities):
+        if type(node).__name__ in LITERALS:
+            return ast.literal_eval(node)
+        if isinstance(node, (ast.Tuple, ast.List)):
+            return [self.evaluate(e, quantities) for e in node.elts]
+        if isinstance(node, ast.Name):
+            return quantities[node.id]
+        if isinstance(node, ast.Call):
+            return FUNCTIONS[node.func.id](self.evaluate(node.args[0], quantities))
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            return combine.reduce([self.evaluate(v, quantities) for v in node.values])
+        if isinstance(node, ast.UnaryOp):
+            operand = self.evaluate(node.operand, quantities)
+            if isinstance(node.op, ast.Not):
+                return np.logical_not(operand)
+            return np.negative(operand) if isinstance(node.op, ast.USub) else operand
+        if isinstance(node, ast.BinOp):
+            return OPERATORS[type(node.op)](self.evaluate(node.left, quantities), self.evaluate(node.right, quantities))
+        # Chained comparisons a < b < c are a < b and b < c
+        left = self.evaluate(node.left, quantities)
+        result = True
+        for op, comparator in zip(node.ops, node.comparators):
+            right = self.evaluate(comparator, quantities)
+            result = np.logical_and(result, COMPARISONS[type(op)](left, right))
+            left = right
+        return result
+
+    def select(self, quantities, nevents):
+        """
+        Returns the mask of the events passing the selection, given the arrays of the quantities of nevents events, and
+        the cut flow counts of those events
+        """
+        passed = np.ones(nevents, dtype=bool)
+        counts = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        counts[0] = nevents
+        for i, term in enumerate(self.terms):
+            passed &= np.broadcast_to(self.evaluate(term, quantities), (nevents,))
+            counts[i + 1] = np.count_nonzero(passed)
+        return passed, counts
+
+    def select_range(self, data):
+        """
+        Returns the indices of the events passing the selection among the arrays returned by WCSim.extract_range, and
+        their cut flow counts
+        """
+        nevents = len(data[next(k for k in data if k.endswith("_offsets"))]) - 1
+        passed, counts = self.select(range_quantities(data, self.names), nevents)
+        return np.flatnonzero(passed), counts
+
+    def cut_flow(self, counts):
+        """Returns the arrays storing the given cut flow counts in an output"""
+        return {CUT_NAMES: np.array(["all events"] + self.cuts), CUT_COUNTS: np.asarray(counts, dtype=np.int64)}
+
+    def __str__(self):
+        return self.expression
+
+
+def print_cut_flow(cut_names, cut_counts):
+    for name, count in zip(cut_names, cut_counts):
+        print("{:>12}  {}".format(count, name))
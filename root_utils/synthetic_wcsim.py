@@ -0,0 +1,489 @@
+"""
+Synthetic WCSim events, for running and benchmarking the conversion tools without WCSim
+
+SyntheticEvents generates events with configurable numbers of triggers, digitized hits, true hits, photons and tracks
+on the IWCD mPMT geometry, stored as flat arrays. The events can be read through stand-in objects mimicking the
+WCSimRoot API used by root_file_utils (tree, event, trigger, hit, photon, track and geometry classes), written to .npz
+files in the event_dump.py format, or extracted with the same arrays as WCSim.extract_range. SyntheticWCSim reads them
+through the WCSim class, which does not need ROOT as long as no WCSimRoot object is created.
+"""
+
+import numpy as np
+
+import root_utils.pos_utils as pu
+import root_utils.ragged_utils as ru
+from root_utils.truth_utils import range_event_info
+from root_utils.root_file_utils import (WCSim, EXTRACT_FIELDS, PHOTON_FIELDS, PHOTON_POSITION_FIELDS, check_fields,
+                                       take_events)
+
+NUM_MODULES = 832
+NUM_PMTS = NUM_MODULES * 19
+BARREL_RADIUS = 370.
+BARREL_HALF_HEIGHT = 300.
+MODULE_SIZE = 58.
+
+
+def pmt_geometry():
+    """
+    Returns the approximate positions and orientations of the IWCD mPMTs, with each module's 19 PMTs spread around its
+    centre on the barrel or end-cap wall, following the module ordering of pos_utils
+    """
+    module = np.arange(NUM_MODULES)
+    centres = np.zeros((NUM_MODULES, 3))
+    normals = np.zeros((NUM_MODULES, 3))
+    barrel = pu.is_barrel(module)
+    row, col = pu.row_col(module[barrel])
+    angle = 2 * np.pi * (col + 0.5) / 40
+    centres[barrel, 0] = BARREL_RADIUS * np.cos(angle)
+    centres[barrel, 2] = BARREL_RADIUS * np.sin(angle)
+    centres[barrel, 1] = BARREL_HALF_HEIGHT - (row + 0.5) * 2 * BARREL_HALF_HEIGHT / 16
+    normals[barrel, 0] = -np.cos(angle)
+    normals[barrel, 2] = -np.sin(angle)
+    for cap, sign in ((pu.is_bottom(module), -1), (pu.is_top(module), 1)):
+        # Spread the end-cap modules over a disc on a sunflower spiral
+        n = np.arange(np.count_nonzero(cap))
+        radius = (BARREL_RADIUS - MODULE_SIZE / 2) * np.sqrt((n + 0.5) / len(n))
+        cap_angle = n * np.pi * (3 - np.sqrt(5))
+        centres[cap, 0] = radius * np.cos(cap_angle)
+        centres[cap, 2] = radius * np.sin(cap_angle)
+        centres[cap, 1] = sign * BARREL_HALF_HEIGHT
+        normals[cap, 1] = -sign
+    pmt = np.arange(NUM_PMTS)
+    in_module = pu.pmt_in_module_id(pmt)
+    # Centre PMT, then inner and outer rings, offset within the plane of the module
+    ring_radius = np.where(in_module == 0, 0., np.where(in_module > 12, MODULE_SIZE / 6, MODULE_SIZE / 3))
+    ring_angle = 2 * np.pi * np.where(in_module > 12, (in_module - 12) / 6, in_module / 12)
+    module_normal = normals[pu.module_index(pmt)]
+    first_axis = np.where(np.abs(module_normal[:, 1:2]) > 0.5, [[1., 0., 0.]], [[0., 1., 0.]])
+    second_axis = np.cross(module_normal, first_axis)
+    offsets = ring_radius[:, None] * (np.cos(ring_angle)[:, None] * first_axis
+                                      + np.sin(ring_angle)[:, None] * second_axis)
+    positions = centres[pu.module_index(pmt)] + offsets
+    return positions, module_normal.copy()
+
+
+class SyntheticEvents:
+    """
+    Randomly generated events, stored as flat arrays in event, trigger and hit order
+
+    Parameters
+    ----------
+    nevents : int
+        Number of events
+    digi_hits : float
+        Mean number of digitized hits per event
+    true_hits : float
+        Mean number of PMTs with true hits per event
+    photons : float
+        Mean number of photons per true hit, at least 1
+    tracks : float
+        Mean number of tracks per event in addition to the primary particle, all in the first trigger
+    triggers : float
+        Mean number of triggers per event, at least 1
+    seed : int
+        Seed of the random generator
+    """
+
+    def __init__(self, nevents, digi_hits=2000, true_hits=2000, photons=1.5, tracks=10, triggers=1.2, seed=0):
+        rng = np.random.default_rng(seed)
+        self.nevents = nevents
+        self.pmt_positions, self.pmt_orientations = pmt_geometry()
+
+        # Triggers of each event, with random times so that the first trigger is not always the first in the list
+        trigger_counts = 1 + rng.poisson(triggers - 1, nevents)
+        self.trigger_offsets = ru.offsets_from_counts(trigger_counts)
+        ntriggers = self.trigger_offsets[-1]
+        self.trigger_event = ru.event_index(self.trigger_offsets)
+        self.trigger_time = rng.uniform(0, 1000, ntriggers)
+        # Share the hits of each event between its triggers
+        share = rng.dirichlet(np.ones(2), ntriggers)[:, 0]
+        share[np.diff(self.trigger_offsets)[self.trigger_event] == 1] = 1
+
+        # Digitized hits
+        digi_counts = rng.poisson(digi_hits * share)
+        self.digi_offsets = ru.offsets_from_counts(digi_counts)
+        ndigi = self.digi_offsets[-1]
+        self.digi_pmt = rng.integers(0, NUM_PMTS, ndigi).astype(np.int32)
+        self.digi_charge = rng.exponential(2., ndigi)
+        self.digi_time = rng.normal(950., 50., ndigi)
+
+        # True hits, each the photons hitting one PMT, whose photons are at TotalPe(0) to TotalPe(0)+TotalPe(1)-1 of
+        # the trigger's hit times
+        hit_counts = rng.poisson(true_hits * share)
+        self.hit_offsets = ru.offsets_from_counts(hit_counts)
+        nhits = self.hit_offsets[-1]
+        self.hit_pmt = rng.integers(0, NUM_PMTS, nhits).astype(np.int32)
+        self.hit_npe = (1 + rng.poisson(photons - 1, nhits)).astype(np.int32)
+        self.photon_offsets = ru.offsets_from_counts(self.hit_npe)
+        hit_trigger = ru.event_index(self.hit_offsets)
+        self.hit_first_pe = (self.photon_offsets[:-1]
+                             - self.photon_offsets[self.hit_offsets[hit_trigger]]).astype(np.int32)
+        nphotons = self.photon_offsets[-1]
+        self.photon_pmt = np.repeat(self.hit_pmt, self.hit_npe)
+        self.photon_time = rng.normal(950., 50., nphotons)
+        self.photon_end_pos = self.pmt_positions[self.photon_pmt]
+        self.photon_start_pos = rng.uniform(-300, 300, (nphotons, 3))
+        self.photon_start_time = self.photon_time - rng.uniform(0, 20, nphotons)
+        self.photon_parent = rng.integers(1, tracks + 2, nphotons).astype(np.int32)
+
+        # Tracks, in the first trigger only: the primary particle with flag -1, then secondaries
+        track_counts = np.zeros(ntriggers, dtype=np.int64)
+        track_counts[self.trigger_offsets[:-1]] = 1 + rng.poisson(tracks, nevents)
+        self.track_offsets = ru.offsets_from_counts(track_counts)
+        ntracks = self.track_offsets[-1]
+        first_track = self.track_offsets[self.trigger_offsets[:-1]]
+        self.track_id = (np.arange(ntracks) - np.repeat(self.track_offsets[:-1], track_counts) + 1).astype(np.int32)
+        self.track_pid = rng.choice(np.array([11, -11, 13, 22, 2112, 2212]), ntracks).astype(np.int32)
+        self.track_pid[first_track] = rng.choice(np.array([11, 13, 22]), nevents)
+        self.track_flag = np.zeros(ntracks, dtype=np.int32)
+        self.track_flag[first_track] = -1
+        self.track_parent = rng.integers(0, 3, ntracks).astype(np.int32)
+        self.track_parent[first_track] = 0
+        self.track_energy = rng.exponential(100., ntracks)
+        self.track_energy[first_track] = rng.uniform(100., 1000., nevents)
+        self.track_momentum = self.track_energy.copy()
+        direction = rng.normal(size=(ntracks, 3))
+        self.track_direction = direction / np.linalg.norm(direction, axis=1, keepdims=True)
+        self.track_start_position = rng.uniform(-300, 300, (ntracks, 3))
+        self.track_stop_position = self.track_start_position + self.track_direction * rng.exponential(50., (ntracks, 1))
+        self.track_start_time = rng.uniform(0, 10, ntracks)
+
+    def extract_range(self, start, stop, fields=EXTRACT_FIELDS):
+        """Returns the same dictionary of flat arrays as WCSim.extract_range for events start to stop-1"""
+        first_trigger, last_trigger = self.trigger_offsets[start], self.trigger_offsets[stop]
+        triggers = slice(first_trigger, last_trigger)
+        event_triggers = self.trigger_offsets[start:stop+1]
+        trigger_in_event = (np.arange(first_trigger, last_trigger)
+                            - self.trigger_offsets[self.trigger_event[triggers]]).astype(np.int32)
+        data = {}
+        if "triggers" in fields:
+            data["trigger_offsets"] = event_triggers - first_trigger
+            data["trigger_time"] = self.trigger_time[triggers]
+            data["trigger_ndigihits"] = np.diff(self.digi_offsets)[triggers].astype(np.int32)
+
+        def family(offsets, prefix, arrays):
+            values = slice(offsets[first_trigger], offsets[last_trigger])
+            data[prefix + "_offsets"] = offsets[event_triggers] - offsets[first_trigger]
+            data[prefix + "_trigger"] = np.repeat(trigger_in_event, np.diff(offsets[first_trigger:last_trigger+1]))
+            for name, array in arrays.items():
+                data[prefix + "_" + name] = array[values]
+
+        if "digi_hits" in fields:
+            family(self.digi_offsets, "digi_hit",
+                   {"pmt": self.digi_pmt, "charge": self.digi_charge, "time": self.digi_time})
+        if "true_hits" in fields:
+            family(self.photon_offsets[self.hit_offsets], "true_hit",
+                   {"pmt": self.photon_pmt, "time": self.photon_time, "pos": self.photon_end_pos,
+                    "start_time": self.photon_start_time, "start_pos": self.photon_start_pos,
+                    "parent": self.photon_parent})
+        if "tracks" in fields:
+            family(self.track_offsets, "track",
+                   {"id": self.track_id, "pid": self.track_pid, "start_time": self.track_start_time,
+                    "energy": self.track_energy, "momentum": self.track_momentum,
+                    "direction": self.track_direction, "start_position": self.track_start_position,
+                    "stop_position": self.track_stop_position, "parent": self.track_parent,
+                    "flag": self.track_flag})
+        return data
+
+    def save_npz(self, filename, root_file="synthetic.root"):
+        """Writes the events to a .npz file in the format of event_dump.py"""
+        data = self.extract_range(0, self.nevents)
+        event_info = range_event_info(data)
+        data.update({
+            "event_id": np.arange(self.nevents, dtype=np.int32),
+            "root_files": np.array([root_file]),
+            "root_file_index": np.zeros(self.nevents, dtype=np.int32),
+            "pid": event_info["pid"],
+            "position": event_info["position"],
+            "direction": event_info["direction"],
+            "energy": event_info["energy"]
+        })
+        np.savez_compressed(filename, **data)
+
+    def tree(self):
+        """Returns a stand-in for the wcsimT tree of the events"""
+        return SyntheticTree(self)
+
+    def geotree(self):
+        """Returns a stand-in for the wcsimGeoT tree of the geometry"""
+        return SyntheticGeoTree(self)
+
+
+class SyntheticArray(list):
+    """Stand-in for a TClonesArray"""
+
+    def At(self, i):
+        return self[i]
+
+    def GetEntries(self):
+        return len(self)
+
+    def GetEntriesFast(self):
+        return len(self)
+
+
+class SyntheticHeader:
+    def __init__(self, date, event_number):
+        self.date = date
+        self.event_number = event_number
+
+    def GetDate(self):
+        return self.date
+
+    def GetEvtNum(self):
+        return self.event_number
+
+
+class SyntheticDigiHit:
+    def __init__(self, events, i):
+        self.events = events
+        self.i = i
+
+    def GetTubeId(self):
+        return int(self.events.digi_pmt[self.i]) + 1
+
+    def GetQ(self):
+        return float(self.events.digi_charge[self.i])
+
+    def GetT(self):
+        return float(self.events.digi_time[self.i])
+
+
+class SyntheticHit:
+    def __init__(self, events, i):
+        self.events = events
+        self.i = i
+
+    def GetTubeID(self):
+        return int(self.events.hit_pmt[self.i]) + 1
+
+    def GetTotalPe(self, i):
+        return int(self.events.hit_first_pe[self.i] if i == 0 else self.events.hit_npe[self.i])
+
+
+class SyntheticHitTime:
+    def __init__(self, events, i):
+        self.events = events
+        self.i = i
+
+    def GetTruetime(self):
+        return float(self.events.photon_time[self.i])
+
+    def GetParentID(self):
+        return int(self.events.photon_parent[self.i])
+
+    def GetPhotonStartTime(self):
+        return float(self.events.photon_start_time[self.i])
+
+    def GetPhotonStartPos(self, j):
+        # WCSim stores photon positions in mm
+        return float(self.events.photon_start_pos[self.i, j]) * 10
+
+    def GetPhotonEndPos(self, j):
+        return float(self.events.photon_end_pos[self.i, j]) * 10
+
+
+class SyntheticTrack:
+    def __init__(self, events, i):
+        self.events = events
+        self.i = i
+
+    def GetId(self):
+        return int(self.events.track_id[self.i])
+
+    def GetIpnu(self):
+        return int(self.events.track_pid[self.i])
+
+    def GetFlag(self):
+        return int(self.events.track_flag[self.i])
+
+    def GetParenttype(self):
+        return int(self.events.track_parent[self.i])
+
+    def GetTime(self):
+        return float(self.events.track_start_time[self.i])
+
+    def GetE(self):
+        return float(self.events.track_energy[self.i])
+
+    def GetP(self):
+        return float(self.events.track_momentum[self.i])
+
+    def GetDir(self, j):
+        return float(self.events.track_direction[self.i, j])
+
+    def GetStart(self, j):
+        return float(self.events.track_start_position[self.i, j])
+
+    def GetStop(self, j):
+        return float(self.events.track_stop_position[self.i, j])
+
+
+class SyntheticTrigger:
+    def __init__(self, events, t):
+        self.events = events
+        self.t = t
+        # Like the TClonesArrays of a real trigger, each array of objects is only created once
+        self.arrays = {}
+
+    def objects(self, cls, offsets):
+        if cls not in self.arrays:
+            self.arrays[cls] = SyntheticArray(cls(self.events, i) for i in range(offsets[self.t], offsets[self.t+1]))
+        return self.arrays[cls]
+
+    def GetHeader(self):
+        # WCSim numbers events from 1
+        event = int(np.searchsorted(self.events.trigger_offsets, self.t, side="right")) - 1
+        return SyntheticHeader(float(self.events.trigger_time[self.t]), event + 1)
+
+    def GetCherenkovDigiHits(self):
+        return self.objects(SyntheticDigiHit, self.events.digi_offsets)
+
+    def GetNcherenkovdigihits(self):
+        return int(self.events.digi_offsets[self.t+1] - self.events.digi_offsets[self.t])
+
+    def GetCherenkovHits(self):
+        return self.objects(SyntheticHit, self.events.hit_offsets)
+
+    def GetNcherenkovhits(self):
+        return int(self.events.hit_offsets[self.t+1] - self.events.hit_offsets[self.t])
+
+    def GetCherenkovHitTimes(self):
+        return self.objects(SyntheticHitTime, self.events.photon_offsets[self.events.hit_offsets])
+
+    def GetTracks(self):
+        return self.objects(SyntheticTrack, self.events.track_offsets)
+
+    def GetNtrack(self):
+        return int(self.events.track_offsets[self.t+1] - self.events.track_offsets[self.t])
+
+    def Delete(self):
+        pass
+
+
+class SyntheticEvent:
+    def __init__(self, events, ev):
+        self.events = events
+        self.read(ev)
+
+    def read(self, ev):
+        # Like reading a WCSimRootEvent, the same event object is filled with newly created triggers
+        self.ev = ev
+        first = int(self.events.trigger_offsets[ev])
+        self.triggers = [SyntheticTrigger(self.events, t) for t in range(first, int(self.events.trigger_offsets[ev+1]))]
+
+    def GetNumberOfEvents(self):
+        return len(self.triggers)
+
+    def GetTrigger(self, i):
+        return self.triggers[i]
+
+
+class SyntheticTree:
+    def __init__(self, events):
+        self.events = events
+        self.wcsimrootevent = SyntheticEvent(events, 0)
+
+    def GetEntries(self):
+        return self.events.nevents
+
+    def GetEvent(self, ev):
+        self.wcsimrootevent.read(ev)
+
+    GetEntry = GetEvent
+
+    def GetCurrentFile(self):
+        return None
+
+
+class SyntheticPMT:
+    def __init__(self, events, i):
+        self.events = events
+        self.i = i
+
+    def GetTubeNo(self):
+        return self.i + 1
+
+    def GetPosition(self, j):
+        return float(self.events.pmt_positions[self.i, j])
+
+    def GetOrientation(self, j):
+        return float(self.events.pmt_orientations[self.i, j])
+
+
+class SyntheticGeom:
+    def __init__(self, events):
+        self.events = events
+
+    def GetWCNumPMT(self):
+        return NUM_PMTS
+
+    def GetPMT(self, i):
+        return SyntheticPMT(self.events, i)
+
+
+class SyntheticGeoTree:
+    def __init__(self, events):
+        self.wcsimrootgeom = SyntheticGeom(events)
+
+    def GetEntries(self):
+        return 1
+
+    def GetEntry(self, i):
+        pass
+
+
+class SyntheticWCSim(WCSim):
+    """
+    WCSim reader of synthetic events, whose extract_range and extract_photons slice the arrays of the events instead of
+    running the compiled extraction code, so timing them does not time that code
+    """
+
+    def __init__(self, events, fields=EXTRACT_FIELDS):
+        self.events = events
+        self.geotree = events.geotree()
+        super().__init__(events.tree(), fields)
+
+    def geometry_key(self):
+        # The synthetic geometry is not cached
+        return None
+
+    def prune_branches(self):
+        # The synthetic tree has no other branches
+        pass
+
+    def set_cache(self, cache_size):
+        pass
+
+    def own_event(self):
+        self.event = self.tree.wcsimrootevent
+
+    def release_triggers(self, previous):
+        # Synthetic triggers are garbage collected
+        pass
+
+    def extract_range(self, start, stop, fields=None):
+        data = self.events.extract_range(start, stop, self.fields if fields is None else check_fields(fields))
+        if stop > start:
+            # Leave the last event of the range read, as WCSim.extract_range does
+            self.get_event(stop - 1)
+            self.get_trigger(0)
+        return data
+
+    def extract_entries(self, entries, fields=None):
+        fields = self.fields if fields is None else check_fields(fields)
+        if len(entries) == 0:
+            return self.events.extract_range(0, 0, fields)
+        first, last = int(np.min(entries)), int(np.max(entries))
+        data = take_events(self.events.extract_range(first, last + 1, fields), np.asarray(entries) - first)
+        self.get_event(int(entries[-1]))
+        self.get_trigger(0)
+        return data
+
+    def extract_photons(self, positions=True):
+        arrays = self.events.extract_range(self.current_event, self.current_event + 1, ("true_hits",))
+        del arrays["true_hit_offsets"]
+        if not positions:
+            for field in PHOTON_POSITION_FIELDS:
+                del arrays[PHOTON_FIELDS[field]]
+        return arrays
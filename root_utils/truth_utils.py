@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def event_info(pid, flag, parent, energy, momentum, start_position, direction):
+    """Returns the truth info of an event given numpy arrays of the properties of the tracks in its first trigger
+
+    Follows the same logic as WCSim.get_event_info, for use by readers that extract tracks as arrays
+    """
+    # Single particle with flag -1 is the incoming neutrino or gamma
+    particles = np.flatnonzero(flag == -1)
+    # Check if it's the dummy neutrino from old gamma simulations:
+    if len(particles) == 1 and pid[particles[0]] == 12 and energy[particles[0]] < 0.0001:
+        # Should be a positron/electron pair from a gamma simulation (temporary hack since no gamma truth saved)
+        particles = np.flatnonzero((flag == 0) & (parent == 0))
+        if len(particles) == 2 and np.all(np.abs(pid[particles]) == 11):
+            total_momentum = np.sum(direction[particles] * momentum[particles, None], axis=0)
+            return {
+                "pid": 22,
+                "position": start_position[particles[0]],  # e+ / e- should have same position
+                "direction": total_momentum / np.linalg.norm(total_momentum),
+                "energy": np.sum(energy[particles])
+            }
+    # Check there is exactly one particle with flag -1:
+    if len(particles) != 1:
+        # Look for one primary instead (flag 0 and parenttype 0)
+        particles = np.flatnonzero((flag == 0) & (parent == 0))
+    if len(particles) == 1:
+        # Only one primary, this is the particle being simulated
+        return {
+            "pid": pid[particles[0]],
+            "position": start_position[particles[0]],
+            "direction": direction[particles[0]],
+            "energy": energy[particles[0]]
+        }
+    # Otherwise something else is going on... guess info from the primaries
+    total_momentum = np.sum(direction[particles] * momentum[particles, None], axis=0)
+    return {
+        "pid": 0,  # there's more than one particle so use pid 0
+        "position": np.mean(start_position[particles], axis=0),  # average position
+        "direction": total_momentum / np.linalg.norm(total_momentum),  # direction of sum of momenta
+        "energy": np.sum(energy[particles])  # sum of energies
+    }
+
+
+def range_event_info(data):
+    """
+    Returns arrays of the truth info of each event in a range, given the track arrays returned by extract_range
+
+    Each event's info is found from the tracks of its first trigger, as in event_info
+    """
+    offsets = data["track_offsets"]
+    nevents = len(offsets) - 1
+    info = {
+        "pid": np.empty(nevents, dtype=np.int32),
+        "position": np.empty((nevents, 3), dtype=np.float64),
+        "direction": np.empty((nevents, 3), dtype=np.float64),
+        "energy": np.empty(nevents, dtype=np.float64)
+    }
+    for ev in range(nevents):
+        tracks = slice(offsets[ev], offsets[ev + 1])
+        first_trigger = data["track_trigger"][tracks] == 0
+        ev_info = event_info(*(data[k][tracks][first_trigger] for k in ("track_pid", "track_flag", "track_parent",
+                                                                        "track_energy", "track_momentum",
+                                                                        "track_start_position", "track_direction")))
+        for k, v in ev_info.items():
+            info[k][ev] = v
+    return info
@@ -0,0 +1,329 @@
+"""
+Columnar reader for WCSim ROOT files that uses uproot instead of PyROOT, so it does not need libWCSimRoot
+
+Whole blocks of events are read from the wcsimT tree at once and flattened into one numpy array per quantity, with
+offsets marking where each event's hits, photons and tracks start. WCSimUprootFile provides the same methods as WCSim
+in root_file_utils, so it can be used in its place on machines without a WCSim build.
+"""
+
+import numpy as np
+import awkward as ak
+import uproot
+
+from root_utils.truth_utils import event_info
+from root_utils.ragged_utils import offsets_from_counts, gather_segments
+from root_utils.profiling import NULL_PROFILER, profiled
+from root_utils.geometry import derive_geometry
+from root_utils.root_file_utils import EXTRACT_FIELDS, PHOTON_FIELDS, PHOTON_POSITION_FIELDS, check_fields, take_events
+
+
+def flatten_collection(collection, members):
+    """
+    Flattens a jagged events x triggers x items collection into one numpy array per member
+
+    As well as the requested members, the returned dictionary contains:
+        "offsets": offset of each event's first item
+        "trigger_offsets": offset of each trigger's first item, over all triggers in the block
+        "trigger": index of the trigger of each item within its event
+    """
+    triggers_per_event = ak.to_numpy(ak.num(collection, axis=1))
+    items_per_trigger = ak.to_numpy(ak.flatten(ak.num(collection, axis=2)))
+    event_trigger_offsets = offsets_from_counts(triggers_per_event)
+    trigger_offsets = offsets_from_counts(items_per_trigger)
+    trigger_in_event = np.arange(len(items_per_trigger)) - np.repeat(event_trigger_offsets[:-1], triggers_per_event)
+    arrays = {
+        "offsets": trigger_offsets[event_trigger_offsets],
+        "trigger_offsets": trigger_offsets,
+        "trigger": np.repeat(trigger_in_event, items_per_trigger).astype(np.int32)
+    }
+    for name, member in members.items():
+        arrays[name] = ak.to_numpy(ak.flatten(ak.flatten(collection[member], axis=2), axis=1))
+    return arrays
+
+
+class WCSimUprootFile:
+    # Replaced by a Profiler to record the time spent in each method
+    profiler = NULL_PROFILER
+
+    def __init__(self, filename, block_size=1000, fields=EXTRACT_FIELDS):
+        """
+        Reads the events of a file in blocks of block_size events, flattening only the given families of fields of
+        EXTRACT_ARRAYS, whose get_ methods are then the only ones available
+        """
+        self.fields = check_fields(fields)
+        self.file = uproot.open(filename)
+        self.tree = self.file["wcsimT"]
+        self.geotree = self.file["wcsimGeoT"]
+        print("number of entries in the geometry tree: " + str(self.geotree.num_entries))
+        self.geo = self.geotree["wcsimrootgeom"].array(entry_stop=1, library="ak")[0]
+        self.num_pmts = int(self.geo["fWCNumPMT"])
+        self.load_pmt_geometry()
+        self.nevent = self.tree.num_entries
+        print("number of entries in the tree: " + str(self.nevent))
+        self.block_size = block_size
+        self.block_start = 0
+        self.block_stop = 0
+        if self.nevent > 0:
+            self.get_event(0)
+        else:
+            self.current_event = 0
+            self.ntrigger = 0
+            self.first_trigger = -1
+        self.current_trigger = 0
+
+    def load_pmt_geometry(self):
+        # The PMT arrays are read in one go, so the geometry is derived from them without caching
+        pmts = self.geo["fPMTArray"]
+        self.geometry = derive_geometry(ak.to_numpy(pmts["fTubeNo"]), ak.to_numpy(pmts["fPosition"]),
+                                        ak.to_numpy(pmts["fOrientation"]))
+        self.pmt_tube_no = self.geometry["tube_no"]
+        self.pmt_positions = self.geometry["position"]
+        self.pmt_orientations = self.geometry["orientation"]
+
+    @profiled("load_block")
+    def load_block(self, start, stop):
+        with self.profiler.stage("uproot.read", stop - start):
+            triggers = self.tree["wcsimrootevent"].array(entry_start=start, entry_stop=stop, library="ak")["fEventList"]
+        self.block_start = start
+        self.block_stop = stop
+        self.event_trigger_offsets = offsets_from_counts(ak.to_numpy(ak.num(triggers, axis=1)))
+        self.trigger_times = ak.to_numpy(ak.flatten(triggers["fEvtHdr", "fDate"])).astype(np.float64)
+        self.trigger_ndigihits = ak.to_numpy(ak.flatten(triggers["fNcherenkovdigihits"])).astype(np.int32)
+        if "digi_hits" in self.fields:
+            self.digi_hits = flatten_collection(triggers["fCherenkovDigiHits"], {
+                "tube": "fTubeId",
+                "charge": "fQ",
+                "time": "fT"
+            })
+        if "tracks" in self.fields:
+            self.tracks = flatten_collection(triggers["fTracks"], {
+                "id": "fId",
+                "pid": "fIpnu",
+                "start_time": "fTime",
+                "energy": "fE",
+                "momentum": "fP",
+                "direction": "fDir",
+                "start_position": "fStart",
+                "stop_position": "fStop",
+                "parent": "fParenttype",
+                "flag": "fFlag"
+            })
+        if "true_hits" in self.fields:
+            self.load_photons(triggers["fCherenkovHits"], triggers["fCherenkovHitTimes"])
+
+    def load_photons(self, hit_collection, hit_time_collection):
+        hits = flatten_collection(hit_collection, {"tube": "fTubeID", "total_pe": "fTotalPe"})
+        photon_members = {"end_time": "fTruetime", "track": "fPrimaryParentID"}
+        # Only files from the new tracking branch of WCSim store the photon start and end points
+        self.has_photon_positions = "fPhotonStartPos" in ak.fields(hit_time_collection)
+        if self.has_photon_positions:
+            photon_members.update(start_time="fPhotonStartTime", start_position="fPhotonStartPos",
+                                  end_position="fPhotonEndPos")
+        hit_times = flatten_collection(hit_time_collection, photon_members)
+        # Each hit refers to a range of the hit times of its own trigger, gather them in hit order
+        triggers_per_hit = np.repeat(np.arange(len(hits["trigger_offsets"]) - 1), np.diff(hits["trigger_offsets"]))
+        photon_starts = hit_times["trigger_offsets"][triggers_per_hit] + hits["total_pe"][:, 0]
+        photon_counts = hits["total_pe"][:, 1]
+        photon_index = gather_segments(photon_starts, photon_counts)
+        hit_photon_offsets = offsets_from_counts(photon_counts)
+        self.photons = {name: hit_times[name][photon_index] for name in photon_members}
+        if self.has_photon_positions:
+            self.photons["start_position"] = self.photons["start_position"] / 10
+            self.photons["end_position"] = self.photons["end_position"] / 10
+        self.photons["offsets"] = hit_photon_offsets[hits["offsets"]]
+        self.photons["tube"] = np.repeat(hits["tube"], photon_counts)
+        self.photons["trigger"] = np.repeat(hits["trigger"], photon_counts)
+        # A true hit is assigned to a track only if all its photons came from that track
+        track = np.full(len(photon_counts), -2, dtype=np.int32)
+        has_photons = photon_counts > 0
+        if np.any(has_photons):
+            photon_track = self.photons["track"]
+            min_track = np.minimum.reduceat(photon_track, hit_photon_offsets[:-1][has_photons])
+            max_track = np.maximum.reduceat(photon_track, hit_photon_offsets[:-1][has_photons])
+            track[has_photons] = np.where(min_track == max_track, min_track, -2)
+        self.true_hits = {
+            "offsets": hits["offsets"],
+            "tube": hits["tube"],
+            "track": track,
+            "PE": photon_counts,
+            "trigger": hits["trigger"]
+        }
+
+    def event_slice(self, arrays, trigger=None):
+        ev = self.current_event - self.block_start
+        if trigger is None:
+            start, stop = arrays["offsets"][ev], arrays["offsets"][ev + 1]
+        else:
+            trigger += self.event_trigger_offsets[ev]
+            start, stop = arrays["trigger_offsets"][trigger], arrays["trigger_offsets"][trigger + 1]
+        return slice(start, stop)
+
+    @profiled("get_event")
+    def get_event(self, ev):
+        if not self.block_start <= ev < self.block_stop:
+            self.load_block(ev, min(ev + self.block_size, self.nevent))
+        self.current_event = ev
+        local_ev = ev - self.block_start
+        triggers = slice(self.event_trigger_offsets[local_ev], self.event_trigger_offsets[local_ev + 1])
+        self.ntrigger = triggers.stop - triggers.start
+        self.first_trigger = int(np.argmin(self.trigger_times[triggers])) if self.ntrigger > 0 else -1
+
+    def get_trigger(self, trig):
+        self.current_trigger = trig
+        return trig
+
+    def get_first_trigger(self):
+        return self.get_trigger(max(self.first_trigger, 0))
+
+    @profiled("get_truth_info")
+    def get_truth_info(self):  # deprecated: should now use get_event_info instead, leaving here for use with old files
+        self.get_trigger(0)
+        s = self.event_slice(self.tracks, trigger=0)
+        primary = ((self.tracks["parent"][s] == 0) & (self.tracks["flag"][s] == 0)
+                   & np.isin(self.tracks["pid"][s], [22, 11, -11, 13, -13, 111]))
+        direction = self.tracks["direction"][s][primary].tolist()
+        energy = self.tracks["energy"][s][primary].tolist()
+        pid = self.tracks["pid"][s][primary].tolist()
+        position = self.tracks["start_position"][s][primary].tolist()
+        return direction, energy, pid, position
+
+    @profiled("get_event_info")
+    def get_event_info(self):
+        self.get_trigger(0)
+        s = self.event_slice(self.tracks, trigger=0)
+        return event_info(self.tracks["pid"][s], self.tracks["flag"][s], self.tracks["parent"][s],
+                          self.tracks["energy"][s], self.tracks["momentum"][s], self.tracks["start_position"][s],
+                          self.tracks["direction"][s])
+
+    @profiled("get_digitized_hits", lambda hits: len(hits["pmt"]))
+    def get_digitized_hits(self, positions=True):
+        s = self.event_slice(self.digi_hits)
+        hits = {
+            "charge": self.digi_hits["charge"][s].astype(np.float64),
+            "time": self.digi_hits["time"][s].astype(np.float64),
+            "pmt": self.digi_hits["tube"][s].astype(np.int32) - 1,
+            "trigger": self.digi_hits["trigger"][s]
+        }
+        if positions:
+            hits["position"] = self.pmt_positions[hits["pmt"]]
+        return hits
+
+    @profiled("get_true_hits", lambda hits: len(hits["pmt"]))
+    def get_true_hits(self, positions=True):
+        s = self.event_slice(self.true_hits)
+        hits = {
+            "track": self.true_hits["track"][s],
+            "pmt": self.true_hits["tube"][s].astype(np.int32) - 1,
+            "PE": self.true_hits["PE"][s].astype(np.int32),
+            "trigger": self.true_hits["trigger"][s]
+        }
+        if positions:
+            hits["position"] = self.pmt_positions[hits["pmt"]]
+        return hits
+
+    @profiled("get_hit_photons", lambda photons: len(next(iter(photons.values()), [])))
+    def get_hit_photons(self, fields=tuple(PHOTON_FIELDS)):
+        s = self.event_slice(self.photons)
+        n_photons = s.stop - s.start
+        photons = {}
+        for field in fields:
+            if field in PHOTON_POSITION_FIELDS and not self.has_photon_positions:
+                photons[field] = np.zeros((n_photons, 3) if field.endswith("position") else n_photons, dtype=np.float64)
+            elif field == "pmt":
+                photons[field] = self.photons["tube"][s].astype(np.int32) - 1
+            elif field == "track":
+                photons[field] = self.photons["track"][s].astype(np.int32)
+            elif field == "trigger":
+                photons[field] = self.photons["trigger"][s]
+            else:
+                photons[field] = self.photons[field][s].astype(np.float64)
+        return photons
+
+    @profiled("get_tracks", lambda tracks: len(tracks["id"]))
+    def get_tracks(self):
+        s = self.event_slice(self.tracks)
+        tracks = {
+            "id": self.tracks["id"][s].astype(np.int32),
+            "pid": self.tracks["pid"][s].astype(np.int32),
+            "start_time": self.tracks["start_time"][s].astype(np.float64),
+            "energy": self.tracks["energy"][s].astype(np.float64),
+            "start_position": self.tracks["start_position"][s].astype(np.float64),
+            "stop_position": self.tracks["stop_position"][s].astype(np.float64),
+            "parent": self.tracks["parent"][s].astype(np.int32),
+            "flag": self.tracks["flag"][s].astype(np.int32)
+        }
+        return tracks
+
+    @profiled("get_trigger_times")
+    def get_trigger_times(self):
+        ev = self.current_event - self.block_start
+        return self.trigger_times[self.event_trigger_offsets[ev]:self.event_trigger_offsets[ev + 1]].copy()
+
+    def extract_range(self, start, stop, fields=None):
+        """
+        Reads events start to stop-1 as one block and returns the same arrays as WCSim.extract_range, for families of
+        fields that the reader was created with
+        """
+        fields = self.fields if fields is None else check_fields(fields)
+        missing = set(fields) - set(self.fields)
+        if missing:
+            raise ValueError("Fields " + ", ".join(sorted(missing)) + " were not read by this reader")
+        self.load_block(start, stop)
+        if stop > start:
+            self.get_event(stop - 1)
+        arrays = {}
+        if "triggers" in fields:
+            arrays.update(trigger_offsets=self.event_trigger_offsets, trigger_time=self.trigger_times,
+                          trigger_ndigihits=self.trigger_ndigihits)
+        if "digi_hits" in fields:
+            arrays.update(
+                digi_hit_offsets=self.digi_hits["offsets"],
+                digi_hit_pmt=self.digi_hits["tube"].astype(np.int32) - 1,
+                digi_hit_charge=self.digi_hits["charge"].astype(np.float64),
+                digi_hit_time=self.digi_hits["time"].astype(np.float64),
+                digi_hit_trigger=self.digi_hits["trigger"]
+            )
+        if "true_hits" in fields:
+            n_photons = len(self.photons["tube"])
+            if self.has_photon_positions:
+                arrays.update(
+                    true_hit_pos=self.photons["end_position"].astype(np.float64),
+                    true_hit_start_time=self.photons["start_time"].astype(np.float64),
+                    true_hit_start_pos=self.photons["start_position"].astype(np.float64)
+                )
+            else:
+                arrays.update(
+                    true_hit_pos=np.zeros((n_photons, 3), dtype=np.float64),
+                    true_hit_start_time=np.zeros(n_photons, dtype=np.float64),
+                    true_hit_start_pos=np.zeros((n_photons, 3), dtype=np.float64)
+                )
+            arrays.update(
+                true_hit_offsets=self.photons["offsets"],
+                true_hit_pmt=self.photons["tube"].astype(np.int32) - 1,
+                true_hit_time=self.photons["end_time"].astype(np.float64),
+                true_hit_parent=self.photons["track"].astype(np.int32),
+                true_hit_trigger=self.photons["trigger"]
+            )
+        if "tracks" in fields:
+            arrays.update(
+                track_offsets=self.tracks["offsets"],
+                track_id=self.tracks["id"].astype(np.int32),
+                track_pid=self.tracks["pid"].astype(np.int32),
+                track_start_time=self.tracks["start_time"].astype(np.float64),
+                track_energy=self.tracks["energy"].astype(np.float64),
+                track_momentum=self.tracks["momentum"].astype(np.float64),
+                track_direction=self.tracks["direction"].astype(np.float64),
+                track_start_position=self.tracks["start_position"].astype(np.float64),
+                track_stop_position=self.tracks["stop_position"].astype(np.float64),
+                track_parent=self.tracks["parent"].astype(np.int32),
+                track_flag=self.tracks["flag"].astype(np.int32),
+                track_trigger=self.tracks["trigger"]
+            )
+        return arrays
+
+    def extract_entries(self, entries, fields=None):
+        """Reads the block of events from the first to the last of a list and returns the arrays of the listed events"""
+        if len(entries) == 0:
+            return self.extract_range(0, 0, fields)
+        first = int(np.min(entries))
+        return take_events(self.extract_range(first, int(np.max(entries)) + 1, fields), np.asarray(entries) - first)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tools import root_utils as a top level package, as when run with the repository on PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
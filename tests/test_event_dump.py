@@ -0,0 +1,13 @@
+import sys
+
+import pytest
+
+import root_utils.event_dump as event_dump
+
+
+def test_resume_requires_chunks(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["event_dump.py", "wcsim.root", "--resume"])
+    with pytest.raises(SystemExit):
+        event_dump.get_args()
+    monkeypatch.setattr(sys, "argv", ["event_dump.py", "wcsim.root", "--resume", "--chunk_events", "100"])
+    assert event_dump.get_args().resume
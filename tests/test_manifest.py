@@ -0,0 +1,59 @@
+import os
+from multiprocessing import Pool
+
+from root_utils import manifest
+from root_utils.manifest import Manifest
+
+
+def write(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+
+def record_outputs(args):
+    manifest_path, directory, job = args
+    for i in range(10):
+        inputs = write(os.path.join(directory, "in_{}_{}".format(job, i)), b"input")
+        output = write(os.path.join(directory, "out_{}_{}".format(job, i)), b"output")
+        # Each record is made by a new manifest, read before the other jobs' records
+        Manifest(manifest_path).record([inputs], output)
+
+
+def test_concurrent_jobs_keep_each_others_records(tmp_path):
+    manifest_path = str(tmp_path / "manifest.json")
+    first, second = Manifest(manifest_path), Manifest(manifest_path)
+    first.record([write(tmp_path / "a.root", b"a")], write(tmp_path / "a.npz", b"a"))
+    second.record([write(tmp_path / "b.root", b"b")], write(tmp_path / "b.npz", b"b"))
+    saved = Manifest(manifest_path)
+    assert saved.is_converted([str(tmp_path / "a.root")], str(tmp_path / "a.npz"))
+    assert saved.is_converted([str(tmp_path / "b.root")], str(tmp_path / "b.npz"))
+
+    with Pool(4) as pool:
+        pool.map(record_outputs, [(manifest_path, str(tmp_path), job) for job in range(4)])
+    assert len(Manifest(manifest_path).outputs) == 2 + 4 * 10
+
+
+def test_changed_output_is_not_converted(tmp_path):
+    manifest_path = str(tmp_path / "manifest.json")
+    inputs, output = write(tmp_path / "a.root", b"a"), write(tmp_path / "a.npz", b"output")
+    Manifest(manifest_path).record([inputs], output)
+    assert Manifest(manifest_path).is_converted([inputs], output)
+    write(output, b"truncated")
+    assert not Manifest(manifest_path).is_converted([inputs], output)
+
+
+def test_touched_input_is_hashed_once(tmp_path, monkeypatch):
+    manifest_path = str(tmp_path / "manifest.json")
+    inputs, output = write(tmp_path / "a.root", b"a"), write(tmp_path / "a.npz", b"output")
+    Manifest(manifest_path).record([inputs], output)
+    stat = os.stat(inputs)
+    os.utime(inputs, (stat.st_atime + 10, stat.st_mtime + 10))
+    hashed = []
+    file_hash = manifest.file_hash
+    monkeypatch.setattr(manifest, "file_hash", lambda path: hashed.append(path) or file_hash(path))
+    assert Manifest(manifest_path).is_converted([inputs], output)
+    assert Manifest(manifest_path).is_converted([inputs], output)
+    assert len(hashed) == 1
+    write(inputs, b"b")
+    assert not Manifest(manifest_path).is_converted([inputs], output)
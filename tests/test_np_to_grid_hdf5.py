@@ -0,0 +1,64 @@
+import multiprocessing
+import signal
+
+import h5py
+import numpy as np
+import pytest
+
+import root_utils.np_to_grid_hdf5 as np_to_grid
+from root_utils.synthetic_wcsim import SyntheticEvents
+
+TIMEOUT = 60
+
+
+@pytest.fixture
+def dump_file(tmp_path):
+    filename = str(tmp_path / "dump.npz")
+    SyntheticEvents(40, digi_hits=50, true_hits=10, tracks=3).save_npz(filename)
+    return filename
+
+
+@pytest.fixture
+def timeout():
+    """Fails the test instead of hanging if it runs for longer than TIMEOUT seconds"""
+    def expired(signum, frame):
+        raise TimeoutError("Timed out after " + str(TIMEOUT) + " s")
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.alarm(TIMEOUT)
+    yield
+    signal.alarm(0)
+    signal.signal(signal.SIGALRM, previous)
+
+
+def test_convert_parallel_matches_serial(tmp_path, dump_file, timeout):
+    serial, parallel = str(tmp_path / "serial.h5"), str(tmp_path / "parallel.h5")
+    np_to_grid.convert_serial([dump_file, dump_file], serial, 16)
+    np_to_grid.convert_parallel([dump_file, dump_file], parallel, 16, 2)
+    with h5py.File(serial, "r") as s, h5py.File(parallel, "r") as p:
+        for name in ("event_data", "labels", "event_ids"):
+            assert np.array_equal(s[name][...], p[name][...])
+
+
+def fail_converting(*args, **kwargs):
+    raise ValueError("worker failed")
+    yield
+
+
+def fail_writing(*args, **kwargs):
+    raise ValueError("writer failed")
+
+
+def test_convert_parallel_raises_worker_error(tmp_path, dump_file, timeout, monkeypatch):
+    # The worker processes are forked after the patch, so they grid with it
+    monkeypatch.setattr(np_to_grid, "convert_file", fail_converting)
+    with pytest.raises(ValueError, match="worker failed"):
+        np_to_grid.convert_parallel([dump_file] * 4, str(tmp_path / "out.h5"), 8, 2)
+    # Neither the workers nor the writer are left running, which would keep the interpreter from exiting
+    assert multiprocessing.active_children() == []
+
+
+def test_convert_parallel_raises_writer_error(tmp_path, dump_file, timeout, monkeypatch):
+    monkeypatch.setattr(np_to_grid, "write_block", fail_writing)
+    with pytest.raises(RuntimeError, match="writer process"):
+        np_to_grid.convert_parallel([dump_file] * 4, str(tmp_path / "out.h5"), 8, 2)
+    assert multiprocessing.active_children() == []
@@ -0,0 +1,118 @@
+import types
+
+import numpy as np
+import pytest
+
+import root_utils.root_file_utils as rfu
+
+
+class FakeHeader:
+    def __init__(self, date):
+        self.date = date
+
+    def GetDate(self):
+        return self.date
+
+
+class FakeTrigger:
+    """Stand-in of a WCSimRootTrigger, recording whether it was deleted"""
+
+    def __init__(self, date):
+        self.header = FakeHeader(date)
+        self.deleted = False
+
+    def GetHeader(self):
+        return self.header
+
+    def GetNcherenkovdigihits(self):
+        return 0
+
+    def Delete(self):
+        assert not self.deleted, "trigger deleted twice"
+        self.deleted = True
+
+
+class FakeEvent:
+    """Stand-in of a WCSimRootEvent, which has no list of triggers until an entry is read"""
+
+    def __init__(self):
+        self.triggers = None
+
+    def GetNumberOfEvents(self):
+        assert self.triggers is not None, "triggers of an event object that never read an entry"
+        return len(self.triggers)
+
+    def GetTrigger(self, i):
+        assert self.triggers is not None, "triggers of an event object that never read an entry"
+        return self.triggers[i]
+
+
+class FakeTree:
+    """Events tree whose entries are lists of triggers, reading them into the event object set by the reader"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.event = None
+
+    def GetEntries(self):
+        return len(self.entries)
+
+    def GetEvent(self, ev):
+        self.event.triggers = self.entries[ev]
+
+
+class FakeGeoTree:
+    def GetEntries(self):
+        return 1
+
+    def GetEntry(self, i):
+        self.wcsimrootgeom = types.SimpleNamespace(GetWCNumPMT=lambda: 0)
+
+
+class FakeWCSim(rfu.WCSim):
+    """WCSim reading fake trees, with the real event reading and trigger release logic"""
+
+    def __init__(self, tree):
+        self.geotree = FakeGeoTree()
+        super().__init__(tree)
+
+    def load_pmt_geometry(self):
+        pass
+
+    def prune_branches(self):
+        pass
+
+    def set_cache(self, cache_size):
+        pass
+
+    def own_event(self):
+        self.event = FakeEvent()
+        self.tree.event = self.event
+
+
+@pytest.fixture(autouse=True)
+def fake_root(monkeypatch):
+    monkeypatch.setattr(rfu, "ROOT", types.SimpleNamespace(addressof=id))
+
+
+def test_get_event_releases_triggers_not_reused():
+    reused = FakeTrigger(1.)
+    entries = [[reused, FakeTrigger(2.)], [reused], [FakeTrigger(3.), FakeTrigger(0.5)], []]
+    wcsim = FakeWCSim(FakeTree(entries))
+    for ev in range(1, len(entries)):
+        previous = entries[ev - 1]
+        wcsim.get_event(ev)
+        for trigger in previous:
+            # Exactly the triggers of the previous entry that the new entry did not reuse are deleted
+            assert trigger.deleted == (trigger not in entries[ev])
+        assert not any(t.deleted for t in entries[ev])
+        # The trigger table is of the new entry
+        assert wcsim.ntrigger == len(entries[ev])
+        assert np.array_equal(wcsim.get_trigger_times(), [t.GetHeader().GetDate() for t in entries[ev]])
+        assert wcsim.first_trigger == (int(np.argmin(wcsim.get_trigger_times())) if entries[ev] else -1)
+
+
+def test_empty_tree():
+    wcsim = FakeWCSim(FakeTree([]))
+    assert wcsim.nevent == 0
+    assert wcsim.ntrigger == 0 and wcsim.triggers == [] and wcsim.first_trigger == -1
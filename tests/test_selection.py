@@ -0,0 +1,49 @@
+import numpy as np
+
+import root_utils.event_dump as event_dump
+from root_utils.selection import EventSelection
+from root_utils.synthetic_wcsim import SyntheticEvents, SyntheticWCSim
+
+
+class RecordingWCSim(SyntheticWCSim):
+    """Synthetic reader recording the events and families of fields of each extraction"""
+
+    def __init__(self, events):
+        super().__init__(events)
+        self.extractions = []
+
+    def extract_range(self, start, stop, fields=None):
+        self.extractions.append((list(range(start, stop)), tuple(fields)))
+        return super().extract_range(start, stop, fields)
+
+    def extract_entries(self, entries, fields=None):
+        self.extractions.append((list(entries), tuple(fields)))
+        return super().extract_entries(entries, fields)
+
+
+def test_rejected_events_hits_are_not_extracted():
+    events = SyntheticEvents(50, digi_hits=50, true_hits=50, tracks=3)
+    selection = EventSelection("first_ndigihits > 50 and energy < 700")
+    wcsim = RecordingWCSim(events)
+    data = event_dump.dump_events(wcsim, "synthetic.root", 0, 50, batch_size=20, selection=selection)
+    accepted = set(data["event_id"].tolist())
+    assert 0 < len(accepted) < 50
+    for entries, fields in wcsim.extractions:
+        if "digi_hits" in fields or "true_hits" in fields:
+            assert set(entries) <= accepted
+
+    # The selected events are stored as in a dump of all events
+    everything = event_dump.dump_events(SyntheticWCSim(events), "synthetic.root", 0, 50)
+    for name, offsets_name in (("digi_hit_pmt", "digi_hit_offsets"), ("digi_hit_charge", "digi_hit_offsets"),
+                               ("true_hit_pmt", "true_hit_offsets"), ("track_pid", "track_offsets"),
+                               ("trigger_time", "trigger_offsets")):
+        offsets = everything[offsets_name]
+        expected = np.concatenate([everything[name][offsets[e]:offsets[e+1]] for e in data["event_id"]])
+        assert np.array_equal(data[name], expected)
+
+
+def test_cut_names_are_the_source_of_each_term():
+    selection = EventSelection("(first_ndigihits > 0 or r < 2) and pid in (11, 13) and not (energy > 5 and r > 1)")
+    assert selection.cuts == ["(first_ndigihits > 0 or r < 2)", "pid in (11, 13)", "not (energy > 5 and r > 1)"]
+    assert EventSelection(" (energy > 1 and\n r < 3) ").cuts == ["energy > 1", "r < 3"]
+    assert EventSelection("abs(y) < 250").cuts == ["abs(y) < 250"]
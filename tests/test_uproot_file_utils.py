@@ -0,0 +1,182 @@
+import numpy as np
+import pytest
+
+ak = pytest.importorskip("awkward")
+pytest.importorskip("uproot")
+
+import root_utils.event_dump as event_dump
+import root_utils.uproot_file_utils as ufu
+from root_utils.root_file_utils import EXTRACT_ARRAYS, EXTRACT_FIELDS, EXTRACT_VECTORS
+
+NUM_PMTS = 38
+
+
+def random_events(nevents, seed=0):
+    """Returns WCSim events as nested lists of triggers in the layout of the wcsimrootevent branch read by uproot"""
+    rng = np.random.default_rng(seed)
+    events = []
+    for _ in range(nevents):
+        triggers = []
+        for _ in range(rng.integers(0, 3)):
+            digi_hits = [{"fTubeId": int(rng.integers(1, NUM_PMTS + 1)), "fQ": float(rng.exponential(2.)),
+                          "fT": float(rng.uniform(900, 1100))} for _ in range(rng.integers(0, 5))]
+            tracks = [{"fId": i, "fIpnu": int(rng.choice([11, 13, 22])), "fTime": float(rng.uniform(0, 10)),
+                       "fE": float(rng.exponential(100.)), "fP": float(rng.exponential(100.)),
+                       "fDir": rng.normal(size=3).tolist(), "fStart": rng.uniform(-300, 300, 3).tolist(),
+                       "fStop": rng.uniform(-300, 300, 3).tolist(), "fParenttype": int(rng.integers(0, 2)),
+                       "fFlag": int(rng.integers(-1, 1))} for i in range(rng.integers(0, 4))]
+            hit_times = []
+            hits = []
+            for _ in range(rng.integers(0, 4)):
+                nphotons = int(rng.integers(0, 3))
+                hits.append({"fTubeID": int(rng.integers(1, NUM_PMTS + 1)), "fTotalPe": [len(hit_times), nphotons]})
+                hit_times.extend({"fTruetime": float(rng.uniform(0, 100)), "fPrimaryParentID": int(rng.integers(1, 3)),
+                                  "fPhotonStartTime": float(rng.uniform(0, 10)),
+                                  "fPhotonStartPos": rng.uniform(-3000, 3000, 3).tolist(),
+                                  "fPhotonEndPos": rng.uniform(-3000, 3000, 3).tolist()} for _ in range(nphotons))
+            triggers.append({"fEvtHdr": {"fDate": float(rng.uniform(0, 1000))}, "fNcherenkovdigihits": len(digi_hits),
+                             "fCherenkovDigiHits": digi_hits, "fTracks": tracks, "fCherenkovHits": hits,
+                             "fCherenkovHitTimes": hit_times})
+        events.append({"fEventList": triggers})
+    return events
+
+
+def expected_arrays(events):
+    """Returns the arrays of EXTRACT_ARRAYS for events, found by looping over them"""
+    lists = {name: [] for arrays in EXTRACT_ARRAYS.values() for name in arrays}
+    for name in lists:
+        if name.endswith("_offsets"):
+            lists[name].append(0)
+    for event in events:
+        for t, trigger in enumerate(event["fEventList"]):
+            lists["trigger_time"].append(trigger["fEvtHdr"]["fDate"])
+            lists["trigger_ndigihits"].append(trigger["fNcherenkovdigihits"])
+            for hit in trigger["fCherenkovDigiHits"]:
+                lists["digi_hit_pmt"].append(hit["fTubeId"] - 1)
+                lists["digi_hit_charge"].append(hit["fQ"])
+                lists["digi_hit_time"].append(hit["fT"])
+                lists["digi_hit_trigger"].append(t)
+            for hit in trigger["fCherenkovHits"]:
+                first, count = hit["fTotalPe"]
+                for photon in trigger["fCherenkovHitTimes"][first:first + count]:
+                    lists["true_hit_pmt"].append(hit["fTubeID"] - 1)
+                    lists["true_hit_time"].append(photon["fTruetime"])
+                    lists["true_hit_pos"].append(np.divide(photon["fPhotonEndPos"], 10))
+                    lists["true_hit_start_time"].append(photon["fPhotonStartTime"])
+                    lists["true_hit_start_pos"].append(np.divide(photon["fPhotonStartPos"], 10))
+                    lists["true_hit_parent"].append(photon["fPrimaryParentID"])
+                    lists["true_hit_trigger"].append(t)
+            for track in trigger["fTracks"]:
+                for name, member in (("track_id", "fId"), ("track_pid", "fIpnu"), ("track_start_time", "fTime"),
+                                     ("track_energy", "fE"), ("track_momentum", "fP"), ("track_direction", "fDir"),
+                                     ("track_start_position", "fStart"), ("track_stop_position", "fStop"),
+                                     ("track_parent", "fParenttype"), ("track_flag", "fFlag")):
+                    lists[name].append(track[member])
+                lists["track_trigger"].append(t)
+        for arrays in EXTRACT_ARRAYS.values():
+            offsets_name, first_name = list(arrays)[:2]
+            lists[offsets_name].append(len(lists[first_name]))
+    arrays = {}
+    for name, values in lists.items():
+        dtype = next(a[name] for a in EXTRACT_ARRAYS.values() if name in a)
+        arrays[name] = np.array(values, dtype=dtype).reshape((-1, 3) if name in EXTRACT_VECTORS else -1)
+    return arrays
+
+
+def to_branch_array(records, fixed_size_members):
+    """
+    Returns an awkward array of records, with the members that are fixed size C arrays in the WCSim classes as regular
+    arrays, as uproot reads them
+    """
+    array = ak.Array(records)
+    for member in fixed_size_members:
+        array = ak.with_field(array, ak.to_regular(array[member], axis=-1), where=member)
+    return array
+
+
+class FakeBranch:
+    def __init__(self, records):
+        self.records = records
+
+    def array(self, entry_start=None, entry_stop=None, library="ak"):
+        return self.records[entry_start:entry_stop]
+
+
+class FakeTree(dict):
+    def __init__(self, branch, records):
+        super().__init__({branch: FakeBranch(records)})
+        self.num_entries = len(records)
+
+
+def fake_file(events):
+    """
+    Returns the trees of a WCSim file as read by uproot. uproot can only write trees of flat or singly jagged arrays,
+    not the objects of the WCSim classes, so the branches are given the layout of their arrays as read by uproot.
+    """
+    rng = np.random.default_rng(1)
+    pmts = [{"fTubeNo": i + 1, "fPosition": rng.uniform(-300, 300, 3).tolist(),
+             "fOrientation": rng.normal(size=3).tolist()} for i in range(NUM_PMTS)]
+    geometry = to_branch_array([{"fWCNumPMT": NUM_PMTS, "fPMTArray": pmts}],
+                               [("fPMTArray", "fPosition"), ("fPMTArray", "fOrientation")])
+    fixed_size_members = [("fEventList", "fCherenkovHits", "fTotalPe")]
+    fixed_size_members += [("fEventList", "fTracks", m) for m in ("fDir", "fStart", "fStop")]
+    fixed_size_members += [("fEventList", "fCherenkovHitTimes", m) for m in ("fPhotonStartPos", "fPhotonEndPos")]
+    records = to_branch_array(events if events else random_events(1), fixed_size_members)
+    if not events:
+        records = records[0:0]
+    return {"wcsimT": FakeTree("wcsimrootevent", records), "wcsimGeoT": FakeTree("wcsimrootgeom", geometry)}
+
+
+@pytest.fixture
+def open_events(monkeypatch):
+    def open_events(events, **kwargs):
+        monkeypatch.setattr(ufu.uproot, "open", lambda filename: fake_file(events))
+        return ufu.WCSimUprootFile("wcsim.root", **kwargs)
+    return open_events
+
+
+def check_arrays(arrays, expected, fields):
+    assert set(arrays) == {name for field in fields for name in EXTRACT_ARRAYS[field]}
+    for name, array in arrays.items():
+        assert array.dtype == expected[name].dtype, name
+        assert array.shape == expected[name].shape, name
+        assert np.allclose(array, expected[name]), name
+
+
+def test_extract_range_matches_extract_arrays_layout(open_events):
+    events = random_events(12)
+    wcsim = open_events(events, block_size=5)
+    check_arrays(wcsim.extract_range(0, 12), expected_arrays(events), EXTRACT_FIELDS)
+    check_arrays(wcsim.extract_range(3, 8, ("triggers", "digi_hits")), expected_arrays(events[3:8]),
+                 ("triggers", "digi_hits"))
+    check_arrays(wcsim.extract_entries([2, 7, 9]), expected_arrays([events[i] for i in (2, 7, 9)]), EXTRACT_FIELDS)
+
+
+def test_get_event_methods(open_events):
+    events = random_events(12)
+    wcsim = open_events(events, block_size=5)
+    expected = expected_arrays(events)
+    for ev in (0, 6, 11, 4):
+        wcsim.get_event(ev)
+        trigger_slice = slice(expected["trigger_offsets"][ev], expected["trigger_offsets"][ev + 1])
+        assert np.array_equal(wcsim.get_trigger_times(), expected["trigger_time"][trigger_slice])
+        hits = wcsim.get_digitized_hits()
+        hit_slice = slice(expected["digi_hit_offsets"][ev], expected["digi_hit_offsets"][ev + 1])
+        assert np.array_equal(hits["pmt"], expected["digi_hit_pmt"][hit_slice])
+        assert np.array_equal(hits["charge"], expected["digi_hit_charge"][hit_slice])
+
+
+def test_empty_tree(open_events):
+    wcsim = open_events([])
+    assert wcsim.nevent == 0
+    assert wcsim.ntrigger == 0 and wcsim.first_trigger == -1
+    check_arrays(wcsim.extract_range(0, 0), expected_arrays([]), EXTRACT_FIELDS)
+
+
+def test_dump_empty_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(ufu.uproot, "open", lambda filename: fake_file([]))
+    outfile = str(tmp_path / "empty.npz")
+    event_dump.dump_file("wcsim.root", outfile, use_uproot=True)
+    with np.load(outfile) as dump:
+        assert len(dump["event_id"]) == 0
+        assert np.array_equal(dump["digi_hit_offsets"], [0])